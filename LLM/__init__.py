@@ -1,5 +1,8 @@
-import os
+import litellm
+
 from .base import BaseLLM, completion
+from .replay import get_backend
+from utils.metrics import provider_labels, model_labels
 
 class OpenAIChat(BaseLLM):
     def __init__(self,
@@ -8,7 +11,6 @@ class OpenAIChat(BaseLLM):
                  api_base: str = None,
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
-        os.environ['OPENAI_API_KEY'] = api_key or os.getenv('OPENAI_API_KEY')
         super().__init__(provider='openai',
                          model_name=model_name,
                          api_key=api_key,
@@ -17,13 +19,14 @@ class OpenAIChat(BaseLLM):
                          max_tokens=max_tokens)
 
 class ClaudeChat(BaseLLM):
+    prompt_cache_hints = True
+
     def __init__(self,
                  model_name: str = 'claude-3-7-sonnet-20250219',
                  api_key: str = None,
                  api_base: str = None,
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
-        os.environ['ANTHROPIC_API_KEY'] = api_key or os.getenv('ANTHROPIC_API_KEY')
         super().__init__(provider='anthropic',
                          model_name=model_name,
                          api_key=api_key,
@@ -39,7 +42,6 @@ class GeminiChat(BaseLLM):
                  api_base: str = None,
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
-        os.environ['ANTHROPIC_API_KEY'] = api_key or os.getenv('ANTHROPIC_API_KEY')
         super().__init__(provider='google',
                          model_name=model_name,
                          api_key=api_key,
@@ -70,7 +72,6 @@ class HuggingFaceChat(BaseLLM):
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
 
-        os.environ['HUGGINGFACE_API_KEY'] = api_key or os.getenv('HUGGINGFACE_API_KEY')
         super().__init__(provider='huggingface',
                          model_name=f"huggingface/{model_name}",
                          api_key=api_key,
@@ -85,7 +86,6 @@ class GrokChat(BaseLLM):
                  api_base: str = None,
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
-        os.environ['XAI_API_KEY'] = api_key or os.getenv('XAI_API_KEY')
         super().__init__(provider='grok',
                          model_name=model_name,
                          api_key=api_key,
@@ -100,7 +100,6 @@ class GroqChat(BaseLLM):
                  api_base: str = None,
                  temperature: float = 0.6,
                  max_tokens: int = 1500):
-        os.environ['GROQ_API_KEY'] = api_key or os.getenv('GROQ_API_KEY')
         super().__init__(provider='groq',
                          model_name=model_name,
                          api_key=api_key,
@@ -109,23 +108,51 @@ class GroqChat(BaseLLM):
                          max_tokens=max_tokens)
 
 
+class ReplayChat(BaseLLM):
+    """
+    錄製／重播 provider：依 LLM_REPLAY_MODE 重播 cassette 中的回應、錄製真實 provider 的回應，
+    或在沒有錄製時產生合成回應，用於離線壓測與回歸測試。record 模式下 model_name 為真實的 litellm model。
+    """
+    def __init__(self,
+                 model_name: str = 'replay',
+                 api_key: str = None,
+                 api_base: str = None,
+                 temperature: float = 0.6,
+                 max_tokens: int = 1500):
+        super().__init__(provider='replay',
+                         model_name=model_name,
+                         api_key=api_key,
+                         api_base=api_base,
+                         temperature=temperature,
+                         max_tokens=max_tokens)
+
+    async def _acompletion(self, **kwargs):
+        return await get_backend().complete(kwargs)
+
+
 # 若要支援更多 provider，可自行新增對應子類與 mapping
+# 憑證以 api_key 參數逐次傳給 litellm，不寫入 os.environ；連線池由 LLM.clients.client_registry 共用
+PROVIDERS = {
+    'openai': OpenAIChat,
+    'anthropic': ClaudeChat,
+    'google': GeminiChat,
+    'ollama': OllamaChat,
+    'huggingface': HuggingFaceChat,
+    'grok': GrokChat,
+    'groq': GroqChat,
+    'replay': ReplayChat,
+}
+provider_labels.register(*PROVIDERS)
+model_labels.register(*litellm.model_cost)
+
+
 def get_llm(provider: str,
              model_name: str,
              api_key: str = None,
              api_base: str = None,
              temperature: float = 0.6,
              max_tokens: int = 1500) -> BaseLLM:
-    mapping = {
-        'openai': OpenAIChat,
-        'anthropic': ClaudeChat,
-        'google': GeminiChat,
-        'ollama': OllamaChat,
-        'huggingface': HuggingFaceChat,
-        'grok': GrokChat,
-        'groq': GroqChat,
-    }
-    cls = mapping.get(provider.lower())
+    cls = PROVIDERS.get(provider.lower())
     if not cls:
         raise ValueError(f"Unknown LLM provider: {provider}")
     return cls(model_name=model_name,
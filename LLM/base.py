@@ -1,10 +1,63 @@
 import json
 import time
-from litellm import completion
+import asyncio
+import threading
+from litellm import completion, acompletion
 from typing import Optional, List, Dict
-from Tool import TOOL_FUNCTIONS
+from Tool.executor import ToolBatch
+from Tool.results import ResultPolicies
+from .budget import Budget, PARTIAL_NOTICE
+from .clients import client_registry
+from .router import RoutingPolicy, hedged_call
+from .context import ContextManager
+from .scheduler import ProviderLimiter, estimate_request_tokens, release_on_close
+from .errors import ChatError, ToolExecutionError, classify_error
+from .resilience import RetryPolicy, circuit_breakers, counts_as_failure, mark_budget_timeout, LLM_RETRIES
+from utils.metrics import LLM_TOKENS, LLM_IN_FLIGHT, LLM_TTFT_SECONDS, observe_phase, current_agent, model_labels
+
+
+def _run_sync(coro):
+    """在同步環境中執行 coroutine；若目前執行緒已有 event loop，改在獨立執行緒執行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    t = threading.Thread(target=runner)
+    t.start()
+    t.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def _iter_sync(agen):
+    """將 async generator 轉為同步 generator"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
 
 class BaseLLM:
+    # provider 是否接受 cache_control 標記（Anthropic 式的 prompt caching）；
+    # OpenAI 等 provider 會自動快取相同的前綴，只需保持前綴穩定即可
+    prompt_cache_hints: bool = False
+
     def __init__(self,
                  provider: str,
                  model_name: str,
@@ -18,19 +71,33 @@ class BaseLLM:
         self.api_base = api_base
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.routing: Optional[RoutingPolicy] = None
+        self.rate_limiter: Optional[ProviderLimiter] = None
+        self.retry_policy = RetryPolicy()
 
-    def chat(self,
-             system_prompt: str,
-             user_prompt: str,
-             tools: Optional[List[dict]] = None,
-             history: List[Dict] = [],
-             stream: bool = False):
-        
+    def set_routing(self, routing: Optional[RoutingPolicy]):
+        """設定對沖與備援策略"""
+        self.routing = routing
+        return self
+
+    def set_rate_limiter(self, limiter: Optional[ProviderLimiter]):
+        """設定此 provider 與憑證的限流器"""
+        self.rate_limiter = limiter
+        return self
+
+    def set_retry_policy(self, policy: RetryPolicy):
+        """設定暫時性錯誤的重試策略"""
+        self.retry_policy = policy
+        return self
+
+    def _build_messages(self, system_prompt: str, user_prompt: str, history: Optional[List[Dict]]) -> List[Dict]:
         messages = [{"role": "system", "content": system_prompt}]
         if history:
             messages += history
         messages.append({"role": "user", "content": user_prompt})
+        return messages
 
+    def _build_kwargs(self, messages: List[Dict], tools: Optional[List[dict]]) -> Dict:
         kwargs = {
             "model": self.model_name,
             "messages": messages,
@@ -43,68 +110,376 @@ class BaseLLM:
             kwargs["api_base"] = self.api_base
         if tools:
             kwargs["tools"] = tools
+        return kwargs
+
+    def _with_cache_hints(self, kwargs: Dict) -> Dict:
+        """
+        在 system prompt、最後一個工具與最新一則訊息加上 cache_control 斷點，
+        讓 provider 快取「system + tools + 先前對話」這段固定前綴；不修改原本的 kwargs。
+        """
+        if not self.prompt_cache_hints:
+            return kwargs
+        hinted = dict(kwargs)
+        messages = list(kwargs["messages"])
+        marker = {"type": "ephemeral"}
+
+        def mark(message):
+            content = message.get("content") if isinstance(message, dict) else None
+            if not isinstance(content, str) or not content:
+                return message
+            return dict(message, content=[{"type": "text", "text": content, "cache_control": marker}])
+
+        messages[0] = mark(messages[0])
+        if len(messages) > 2:
+            messages[-1] = mark(messages[-1])
+        hinted["messages"] = messages
+        if kwargs.get("tools"):
+            tools = list(kwargs["tools"])
+            tools[-1] = dict(tools[-1], cache_control=marker)
+            hinted["tools"] = tools
+        return hinted
+
+    async def _acompletion(self, **kwargs):
+        """實際呼叫 provider；測試或離線環境可於子類別覆寫"""
+        return await acompletion(**kwargs)
+
+    async def _limited(self, kwargs: Dict):
+        """經過限流器後呼叫 provider；串流請求直到串流關閉才釋放併發名額"""
+        limiter = self.rate_limiter
+        if limiter is None:
+            return await self._acompletion(**kwargs)
+        estimated = estimate_request_tokens(kwargs)
+        await limiter.acquire(estimated)
+        try:
+            result = await self._acompletion(**kwargs)
+        except BaseException:
+            limiter.release()
+            raise
+        if kwargs.get("stream"):
+            return release_on_close(result, limiter)
+        limiter.release()
+        usage = getattr(result, "usage", None)
+        limiter.settle(estimated, getattr(usage, "total_tokens", None))
+        return result
+
+    async def _attempt(self, kwargs: Dict):
+        """
+        經過斷路器、重試與限流呼叫 provider；失敗時拋出 ChatError。
+
+        只重試可重試的錯誤（429、5xx、連線中斷、逾時），且不會等待超過本輪的 timeout。
+        """
+        breaker = circuit_breakers.get(self.provider, self.model_name)
+        deadline = time.monotonic() + kwargs["timeout"] if kwargs.get("timeout") else None
+        delay = None
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.before_call()
+            try:
+                result = await self._limited(kwargs)
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                error = mark_budget_timeout(classify_error(e, self.provider, self.model_name), kwargs.get("timeout"))
+                if counts_as_failure(error):
+                    breaker.record_failure()
+                else:
+                    breaker.release_probe()
+                if not error.retryable or attempt >= self.retry_policy.max_attempts:
+                    raise error from e
+                delay = self.retry_policy.next_delay(delay, error.retry_after)
+                if deadline is not None:
+                    if time.monotonic() + delay >= deadline:
+                        raise error from e
+                    kwargs = dict(kwargs, timeout=deadline - time.monotonic() - delay)
+                LLM_RETRIES.inc(provider=self.provider, model=model_labels(self.model_name), error=type(error).__name__)
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def _leg_kwargs(self, kwargs: Dict) -> Dict:
+        """將同一輪請求改寫成使用本物件的 model 與憑證"""
+        leg = dict(self._with_cache_hints(kwargs))
+        leg["model"] = self.model_name
+        leg.pop("api_key", None)
+        leg.pop("api_base", None)
+        leg.pop("shared_session", None)
+        if self.api_key:
+            leg["api_key"] = self.api_key
+        if self.api_base:
+            leg["api_base"] = self.api_base
+        session = client_registry.acquire(self.provider, self.api_key, self.api_base)
+        if session is not None:
+            leg["shared_session"] = session
+        return leg
+
+    async def _complete(self, kwargs: Dict, stats: Optional[Dict] = None):
+        """發出一輪 LLM 請求並記錄延遲；串流請求在收到回應標頭時即返回"""
+        with LLM_IN_FLIGHT.track(provider=self.provider, model=model_labels(self.model_name)):
+            start = time.perf_counter()
+            result = await self._route(kwargs, stats)
+            if not kwargs.get("stream"):
+                observe_phase("llm_round_trip", time.perf_counter() - start, self.provider,
+                              model_labels(self.model_name))
+            return result
+
+    async def _route(self, kwargs: Dict, stats: Optional[Dict] = None):
+        """有設定 routing 時依策略對沖或備援"""
+        primary_kwargs = self._with_cache_hints(kwargs)
+        if self.routing is None or not self.routing.fallbacks:
+            return await self._attempt(primary_kwargs)
+
+        legs = [(f"primary:{self.model_name}", lambda: self._attempt(primary_kwargs))]
+        for llm in self.routing.fallbacks:
+            leg_kwargs = llm._leg_kwargs(kwargs)
+            legs.append((f"fallback:{llm.model_name}", lambda llm=llm, kw=leg_kwargs: llm._attempt(kw)))
+
+        result, label = await hedged_call(legs,
+                                          hedge_after=self.routing.hedge_after,
+                                          failover=self.routing.failover,
+                                          stream=bool(kwargs.get("stream")))
+        if stats is not None:
+            stats.setdefault("routes", []).append(label)
+        return result
+
+    async def _summarize(self, messages: List) -> str:
+        """將舊對話濃縮成摘要，供 ContextManager 的 summarize 策略使用"""
+        transcript = "\n".join(
+            f"{m.get('role')}: {m.get('content')}" for m in messages if isinstance(m, dict) and m.get("content")
+        )
+        kwargs = self._build_kwargs([
+            {"role": "system", "content": "請用條列方式摘要以下對話的重點，保留人名、數字與結論。"},
+            {"role": "user", "content": transcript}
+        ], None)
+        resp = await self._attempt(kwargs)
+        return resp["choices"][0]["message"].content or ""
+
+    def _record_usage(self, stats: Optional[Dict], usage):
+        """累加 provider 回報的 token 用量（含 prompt cache 命中與寫入的 token 數），並計入 metrics"""
+        if not usage:
+            return
+        if stats is None:
+            stats = {}
+
+        def field(obj, name):
+            return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = field(usage, name)
+            if value:
+                stats[name] = stats.get(name, 0) + value
+
+        # OpenAI 回報於 prompt_tokens_details.cached_tokens；Anthropic 回報 cache_read_input_tokens
+        details = field(usage, "prompt_tokens_details")
+        cached = (field(details, "cached_tokens") if details else None) or field(usage, "cache_read_input_tokens")
+        if cached:
+            stats["cached_tokens"] = stats.get("cached_tokens", 0) + cached
+        created = field(usage, "cache_creation_input_tokens")
+        if created:
+            stats["cache_creation_tokens"] = stats.get("cache_creation_tokens", 0) + created
+
+        agent, model = current_agent.get(), model_labels(self.model_name)
+        for name, kind in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+            value = field(usage, name)
+            if value:
+                LLM_TOKENS.inc(value, agent=agent, provider=self.provider, model=model, type=kind)
+        if cached:
+            LLM_TOKENS.inc(cached, agent=agent, provider=self.provider, model=model, type="cached")
+        if created:
+            LLM_TOKENS.inc(created, agent=agent, provider=self.provider, model=model, type="cache_creation")
+
+    @staticmethod
+    def _submit_tool_call(batch: ToolBatch, call_id: str, name: str, arguments: str, budget: Optional[Budget]):
+        if budget is not None and not budget.take_tool_call():
+            batch.skip(call_id, "[Skipped: tool call budget exhausted]")
+        else:
+            batch.submit(call_id, name, arguments or "{}")
+
+    @staticmethod
+    async def _tool_results(batch: ToolBatch, budget: Optional[Budget]) -> List[Dict]:
+        try:
+            return await batch.results(budget.remaining() if budget else None)
+        except (asyncio.TimeoutError, ChatError):
+            raise
+        except Exception as e:
+            raise ToolExecutionError(f"{type(e).__name__}: {e}") from e
+
+    @staticmethod
+    def _prepare_round(kwargs: Dict, budget: Optional[Budget]) -> bool:
+        """依剩餘預算設定本輪的 timeout；預算耗盡時回傳 False"""
+        if budget is None:
+            return True
+        if not budget.start_round():
+            return False
+        remaining = budget.remaining()
+        if remaining is not None:
+            kwargs["timeout"] = remaining
+        if budget.final_round and kwargs.get("tools"):
+            kwargs["tool_choice"] = "none"
+        return True
+
+    def chat(self,
+             system_prompt: str,
+             user_prompt: str,
+             tools: Optional[List[dict]] = None,
+             history: List[Dict] = [],
+             stream: bool = False,
+             tool_concurrency: Optional[int] = None,
+             budget: Optional[Budget] = None,
+             stats: Optional[Dict] = None,
+             context: Optional[ContextManager] = None,
+             tool_results: Optional[ResultPolicies] = None):
+        """同步介面，內部委派給 achat"""
+        if not stream:
+            return _run_sync(self.achat(system_prompt, user_prompt, tools=tools, history=history,
+                                        tool_concurrency=tool_concurrency, budget=budget, stats=stats,
+                                        context=context, tool_results=tool_results))
+        agen = _run_sync(self.achat(system_prompt, user_prompt, tools=tools, history=history, stream=True,
+                                    tool_concurrency=tool_concurrency, budget=budget, stats=stats,
+                                    context=context, tool_results=tool_results))
+        return _iter_sync(agen)
+
+    async def achat(self,
+                    system_prompt: str,
+                    user_prompt: str,
+                    tools: Optional[List[dict]] = None,
+                    history: Optional[List[Dict]] = None,
+                    stream: bool = False,
+                    tool_concurrency: Optional[int] = None,
+                    budget: Optional[Budget] = None,
+                    stats: Optional[Dict] = None,
+                    context: Optional[ContextManager] = None,
+                    tool_results: Optional[ResultPolicies] = None):
+        """
+        非同步對話；stream=True 時回傳 async generator。
+
+        tool_concurrency: 同一輪多個 tool_calls 並行執行的上限，None 表示不限制。
+        budget: 請求預算（截止時間、往返次數、工具呼叫次數）；耗盡時回傳部分答案。
+        stats: 呼叫端提供的 dict，用於回報本次對話的統計（例如 routes：每輪勝出的 leg、token 用量）。
+        context: 依 token 預算整理歷史的 ContextManager；None 表示原樣送出。
+        tool_results: 工具結果政策（大小上限、欄位投影、截斷或分頁保存）；截斷統計寫入 stats["tool_results"]。
+
+        失敗時拋出 ChatError；串流模式下改以 "data: [Error during streaming]: {錯誤 JSON}" 事件回報。
+        """
+        if context is not None:
+            history, context_stats = await context.fit(self.model_name, system_prompt, history, user_prompt,
+                                                       tools, summarizer=self._summarize)
+            if stats is not None:
+                stats.update(context_stats)
+        messages = self._build_messages(system_prompt, user_prompt, history)
+        kwargs = self._build_kwargs(messages, tools)
+        session = client_registry.acquire(self.provider, self.api_key, self.api_base)
+        if session is not None:
+            kwargs["shared_session"] = session
 
         if not stream:
+            content = None
             try:
                 while True:
-                    resp = completion(**kwargs)
+                    if not self._prepare_round(kwargs, budget):
+                        return budget.partial_answer(content)
+                    resp = await self._complete(kwargs, stats)
+                    self._record_usage(stats, getattr(resp, "usage", None))
                     msg = resp["choices"][0]["message"]
                     if hasattr(msg, "tool_calls") and msg.tool_calls:
+                        content = msg.content or content
+                        batch = ToolBatch(tool_concurrency, tool_results, stats)
                         for call in msg.tool_calls:
-                            fname = call.function.name
-                            args = json.loads(call.function.arguments)
-                            func = TOOL_FUNCTIONS.get(fname)
-                            result = func(**args) if func else f"[No implementation for {fname}]"
-
-                            messages.append(msg)
-                            messages.append({
-                                "role": "tool",
-                                "tool_call_id": call.id,
-                                "content": str(result)
-                            })
-                            kwargs["messages"] = messages
+                            self._submit_tool_call(batch, call.id, call.function.name, call.function.arguments, budget)
+                        messages.append(msg)
+                        messages += await self._tool_results(batch, budget)
+                        kwargs["messages"] = messages
                     else:
                         return msg.content
             except Exception as e:
-                return f"[Error during chat]: {e}"
+                if budget is not None and budget.expired():
+                    return budget.partial_answer(content)
+                # 交由呼叫端依錯誤類別回應（例如 HTTP 429 與 Retry-After）
+                raise classify_error(e, self.provider, self.model_name) from e
         else:
-            def stream_generator():
+            async def stream_generator():
                 try:
-                    # tools 模式下暫不支援原生 stream，使用非 stream 模式模擬
-                    if tools:
-                        while True:
-                            resp = completion(**kwargs)
-                            msg = resp["choices"][0]["message"]
-
-                            if hasattr(msg, "tool_calls") and msg.tool_calls:
-                                for call in msg.tool_calls:
-                                    fname = call.function.name
-                                    args = json.loads(call.function.arguments)
-                                    func = TOOL_FUNCTIONS.get(fname)
-                                    result = func(**args) if func else f"[No implementation for {fname}]"
-
-                                    messages.append(msg)
-                                    messages.append({
-                                        "role": "tool",
-                                        "tool_call_id": call.id,
-                                        "content": str(result)
-                                    })
-                                    kwargs["messages"] = messages
-                            else:
-                                content = msg.content
-                                for i in range(0, len(content), 2):
-                                    yield f"data: {content[i:i+2]}"
-                                    time.sleep(0.05)
-                                break
-                    else:
-                        kwargs["stream"] = True
-                        for chunk in completion(**kwargs):
-                            delta = chunk["choices"][0]["delta"]
-                            content = delta.get("content", "")
-                            if content:
-                                yield f"data: {content}"
+                    kwargs["stream"] = True
+                    while True:
+                        if not self._prepare_round(kwargs, budget):
+                            yield f"data: {PARTIAL_NOTICE}"
+                            break
+
+                        # 依 index 組裝串流中的 tool_call 片段；下一個 index 出現時代表前一個的參數已完整
+                        calls = {}
+                        batch = ToolBatch(tool_concurrency, tool_results, stats)
+                        content_parts = []
+                        started = time.perf_counter()
+                        first_chunk = True
+                        try:
+                            async for chunk in await self._complete(kwargs, stats):
+                                if first_chunk:
+                                    first_chunk = False
+                                    LLM_TTFT_SECONDS.observe(time.perf_counter() - started, agent=current_agent.get(),
+                                                             provider=self.provider, model=model_labels(self.model_name))
+                                if budget is not None and budget.expired():
+                                    raise asyncio.TimeoutError()
+                                self._record_usage(stats, getattr(chunk, "usage", None))
+                                if not chunk["choices"]:
+                                    continue
+                                delta = chunk["choices"][0]["delta"]
+                                content = delta.get("content", "")
+                                if content:
+                                    content_parts.append(content)
+                                    yield f"data: {content}"
+
+                                for tc in getattr(delta, "tool_calls", None) or []:
+                                    idx = tc.index or 0
+                                    if idx not in calls:
+                                        for prev in calls.values():
+                                            if not prev["submitted"]:
+                                                prev["submitted"] = True
+                                                self._submit_tool_call(batch, prev["id"], prev["name"], prev["arguments"], budget)
+                                        calls[idx] = {"id": None, "name": "", "arguments": "", "submitted": False}
+                                    entry = calls[idx]
+                                    if tc.id:
+                                        entry["id"] = tc.id
+                                    if tc.function and tc.function.name:
+                                        entry["name"] += tc.function.name
+                                    if tc.function and tc.function.arguments:
+                                        entry["arguments"] += tc.function.arguments
+                        except BaseException:
+                            batch.cancel()
+                            raise
+                        finally:
+                            observe_phase("stream", time.perf_counter() - started, self.provider,
+                                          model_labels(self.model_name))
+
+                        if not calls:
+                            break
+
+                        for entry in calls.values():
+                            if not entry["submitted"]:
+                                entry["submitted"] = True
+                                self._submit_tool_call(batch, entry["id"], entry["name"], entry["arguments"], budget)
+
+                        messages.append({
+                            "role": "assistant",
+                            "content": "".join(content_parts) or None,
+                            "tool_calls": [
+                                {
+                                    "id": entry["id"],
+                                    "type": "function",
+                                    "function": {"name": entry["name"], "arguments": entry["arguments"]}
+                                }
+                                for entry in calls.values()
+                            ]
+                        })
+                        messages.extend(await self._tool_results(batch, budget))
+                        kwargs["messages"] = messages
                 except Exception as e:
-                    yield f"data: [Error during streaming]: {e}"
+                    if budget is not None and budget.expired():
+                        yield f"data: {PARTIAL_NOTICE}"
+                    else:
+                        error = classify_error(e, self.provider, self.model_name)
+                        yield f"data: [Error during streaming]: {json.dumps(error.to_dict(), ensure_ascii=False)}"
                 yield "data: done"
 
             return stream_generator()
@@ -0,0 +1,69 @@
+import time
+from typing import Optional, Dict
+
+PARTIAL_NOTICE = "[Partial answer: request budget exhausted]"
+
+
+class Budget:
+    """
+    單一 /chat 請求的預算：截止時間、LLM 往返次數與工具呼叫次數。
+
+    timeout: 從建立起算的秒數，None 表示不限制。
+    max_rounds: LLM 往返次數上限（含最後產生答案的那一次）。
+    max_tool_calls: 工具呼叫總數上限。
+    """
+
+    def __init__(self,
+                 timeout: Optional[float] = None,
+                 max_rounds: Optional[int] = None,
+                 max_tool_calls: Optional[int] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.max_rounds = max_rounds
+        self.max_tool_calls = max_tool_calls
+        self.rounds = 0
+        self.tool_calls = 0
+        self.exhausted: Optional[str] = None  # 預算耗盡的原因：deadline / rounds
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.exhausted = self.exhausted or "deadline"
+            return True
+        return False
+
+    def start_round(self) -> bool:
+        """開始一次 LLM 往返；預算不足時回傳 False"""
+        if self.expired():
+            return False
+        if self.max_rounds is not None and self.rounds >= self.max_rounds:
+            self.exhausted = self.exhausted or "rounds"
+            return False
+        self.rounds += 1
+        return True
+
+    @property
+    def final_round(self) -> bool:
+        """本輪之後不再允許工具呼叫，應要求模型直接回答"""
+        if self.max_rounds is not None and self.rounds >= self.max_rounds:
+            return True
+        return self.max_tool_calls is not None and self.tool_calls >= self.max_tool_calls
+
+    def take_tool_call(self) -> bool:
+        if self.max_tool_calls is not None and self.tool_calls >= self.max_tool_calls:
+            return False
+        self.tool_calls += 1
+        return True
+
+    def partial_answer(self, content: Optional[str]) -> str:
+        return f"{content}\n{PARTIAL_NOTICE}" if content else PARTIAL_NOTICE
+
+    def summary(self) -> Dict:
+        return {
+            "rounds": self.rounds,
+            "tool_calls": self.tool_calls,
+            "exhausted": self.exhausted,
+        }
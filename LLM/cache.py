@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Dict, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # 沒有 numpy 時僅提供精確比對層
+    np = None
+
+
+def _canonical(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _normalize_history(history: Optional[List[Dict]]) -> List[Dict]:
+    """只保留影響回答的欄位，並去除內容前後空白"""
+    normalized = []
+    for msg in history or []:
+        if not isinstance(msg, dict):
+            continue
+        item = {k: v for k, v in msg.items() if k in ("role", "content", "name", "tool_call_id", "tool_calls")}
+        if isinstance(item.get("content"), str):
+            item["content"] = item["content"].strip()
+        normalized.append(item)
+    return normalized
+
+
+def _digest(obj) -> str:
+    return hashlib.sha256(_canonical(obj).encode("utf-8")).hexdigest()
+
+
+def make_scope_key(agent_id: str, model: str, system_prompt: str, history: Optional[List[Dict]],
+                   tools: Union[List[dict], str, None], temperature: float) -> str:
+    """
+    除使用者問題外的所有影響回答的條件；語意層只在相同 scope 內比對。
+    包含 agent_id：設定相同的不同 agent 也不共用快取的回答。
+
+    tools 可為 schema 列表，或 ToolBundle.digest 等已代表整組工具的字串。
+    """
+    return _digest({
+        "agent": agent_id,
+        "model": model,
+        "system": (system_prompt or "").strip(),
+        "history": _normalize_history(history),
+        "tools": tools or [],
+        "temperature": temperature,
+    })
+
+
+def make_cache_key(scope: str, user_prompt: str) -> str:
+    return _digest({"scope": scope, "user": " ".join((user_prompt or "").split())})
+
+
+def embed_text(text: str, dim: int = 512):
+    """本地 hashing embedding：以字元 bigram/trigram 雜湊到固定維度，適用中英文混合"""
+    vec = np.zeros(dim, dtype=np.float32)
+    text = " ".join((text or "").lower().split())
+    for n in (2, 3):
+        for i in range(max(len(text) - n + 1, 1)):
+            h = int.from_bytes(hashlib.blake2b(text[i:i + n].encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % dim] += 1.0 if (h >> 63) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class _SemanticIndex:
+    """
+    單一 scope 的語意索引，相似度以矩陣乘法一次算完。
+    向量矩陣由少量列開始，需要時加倍成長；達到 capacity 後改為環狀緩衝覆寫最舊的項目。
+    """
+
+    def __init__(self, capacity: int, dim: int, initial: int = 16):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(initial, capacity), dim), dtype=np.float32)
+        self.keys: List[Optional[str]] = []
+        self.pos = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes
+
+    def add(self, key: str, vec):
+        if len(self.keys) < self.capacity:
+            row = len(self.keys)
+            if row >= len(self.vectors):
+                grown = np.zeros((min(len(self.vectors) * 2, self.capacity), self.vectors.shape[1]),
+                                 dtype=np.float32)
+                grown[:row] = self.vectors
+                self.vectors = grown
+            self.keys.append(key)
+        else:
+            row = self.pos
+            self.keys[row] = key
+            self.pos = (self.pos + 1) % self.capacity
+        self.vectors[row] = vec
+
+    def search(self, vec) -> Tuple[Optional[str], float]:
+        if not self.keys:
+            return None, 0.0
+        scores = self.vectors[:len(self.keys)] @ vec
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class ResponseCache:
+    """
+    兩層 LLM 回應快取：
+    - exact：以 model、system prompt、正規化歷史、工具 schema、temperature 與問題為 key，
+      記憶體 LRU + TTL，被擠出的項目寫到磁碟
+    - semantic：同一 scope 下以本地 embedding 比對相似問題；scope 以 LRU 管理，最多 max_semantic_scopes 個
+
+    max_bytes: 記憶體中回應內容與語意索引的估計用量上限，超過時先淘汰最久未使用的語意 scope，
+    再將最久未使用的回應寫到磁碟。磁碟讀寫不持有鎖。
+    """
+
+    def __init__(self,
+                 max_entries: int = 2048,
+                 disk_dir: Optional[str] = os.path.join("cache", "llm"),
+                 semantic_capacity: int = 1024,
+                 embed_dim: int = 512,
+                 max_semantic_scopes: int = 256,
+                 max_bytes: int = 128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.semantic_capacity = semantic_capacity
+        self.embed_dim = embed_dim
+        self.max_semantic_scopes = max_semantic_scopes
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._semantic: "OrderedDict[str, _SemanticIndex]" = OrderedDict()
+        self._entry_bytes = 0
+        self._semantic_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "spills": 0,
+                       "semantic_evictions": 0}
+
+    # ---------- 磁碟（呼叫端不可持有 self._lock） ----------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _spill(self, items: List[Tuple[str, float, str]]):
+        if not self.disk_dir or not items:
+            return
+        spilled = 0
+        for key, expires_at, value in items:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+                os.replace(tmp, path)
+                spilled += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._stats["spills"] += spilled
+
+    def _load_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data["expires_at"] < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return data["expires_at"], data["value"]
+
+    # ---------- 記憶體（呼叫端須持有 self._lock） ----------
+    @staticmethod
+    def _value_bytes(value: str) -> int:
+        return len(value) * 2
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] >= time.time():
+            self._entries.move_to_end(key)
+            return entry[1]
+        del self._entries[key]
+        self._entry_bytes -= self._value_bytes(entry[1])
+        return None
+
+    def _set(self, key: str, expires_at: float, value: str) -> List[Tuple[str, float, str]]:
+        """寫入記憶體並回傳需要寫到磁碟的項目（由呼叫端在釋放鎖之後寫入）"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._entry_bytes -= self._value_bytes(old[1])
+        self._entries[key] = (expires_at, value)
+        self._entry_bytes += self._value_bytes(value)
+
+        evicted = []
+        now = time.time()
+        while self._semantic and (len(self._semantic) > self.max_semantic_scopes
+                                  or self._entry_bytes + self._semantic_bytes > self.max_bytes):
+            _, index = self._semantic.popitem(last=False)
+            self._semantic_bytes -= index.nbytes
+            self._stats["semantic_evictions"] += 1
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                          or self._entry_bytes + self._semantic_bytes > self.max_bytes):
+            old_key, (old_expires, old_value) = self._entries.popitem(last=False)
+            self._entry_bytes -= self._value_bytes(old_value)
+            if old_expires >= now:
+                evicted.append((old_key, old_expires, old_value))
+        return evicted
+
+    def _add_semantic(self, scope: str, key: str, vec):
+        index = self._semantic.get(scope)
+        if index is None:
+            index = self._semantic[scope] = _SemanticIndex(self.semantic_capacity, self.embed_dim)
+            self._semantic_bytes += index.nbytes
+        self._semantic.move_to_end(scope)
+        before = index.nbytes
+        index.add(key, vec)
+        self._semantic_bytes += index.nbytes - before
+
+    # ---------- 對外介面 ----------
+    def _lookup(self, key: str) -> Optional[str]:
+        """依序查詢記憶體與磁碟；磁碟命中時放回記憶體"""
+        with self._lock:
+            value = self._get_memory(key)
+        if value is not None:
+            return value
+        entry = self._load_disk(key)
+        if entry is None:
+            return None
+        with self._lock:
+            spill = self._set(key, entry[0], entry[1])
+        self._spill(spill)
+        return entry[1]
+
+    def get(self, scope: str, user_prompt: str,
+            semantic_threshold: Optional[float] = None) -> Tuple[Optional[str], Optional[str]]:
+        """回傳 (回應, 命中層級)；未命中時為 (None, None)"""
+        key = make_cache_key(scope, user_prompt)
+        value = self._lookup(key)
+        if value is not None:
+            with self._lock:
+                self._stats["exact_hits"] += 1
+            return value, "exact"
+
+        if semantic_threshold is not None and np is not None and scope in self._semantic:
+            vec = embed_text(user_prompt, self.embed_dim)
+            with self._lock:
+                index = self._semantic.get(scope)
+                if index is not None:
+                    self._semantic.move_to_end(scope)
+                    match, score = index.search(vec)
+                else:
+                    match, score = None, 0.0
+            if match is not None and score >= semantic_threshold:
+                value = self._lookup(match)
+                if value is not None:
+                    with self._lock:
+                        self._stats["semantic_hits"] += 1
+                    return value, "semantic"
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, None
+
+    def put(self, scope: str, user_prompt: str, value: str, ttl: float, semantic: bool = False):
+        key = make_cache_key(scope, user_prompt)
+        vec = embed_text(user_prompt, self.embed_dim) if semantic and np is not None else None
+        with self._lock:
+            if vec is not None:
+                self._add_semantic(scope, key, vec)
+            spill = self._set(key, time.time() + ttl, value)
+            self._stats["stores"] += 1
+        self._spill(spill)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["semantic_scopes"] = len(self._semantic)
+            stats["bytes"] = self._entry_bytes + self._semantic_bytes
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# 全域共用的回應快取
+response_cache = ResponseCache(
+    max_semantic_scopes=int(os.getenv("LLM_CACHE_SEMANTIC_SCOPES", "256")),
+    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "128")) * 1024 * 1024),
+)
+
+
+def cache_policy(cfg: Dict, temperature: float) -> Optional[Dict]:
+    """
+    解析 agent 設定中的 response_cache；未啟用或取樣設定不適合快取時回傳 None。
+
+    預設只快取 temperature 為 0 的請求，可用 cache_nondeterministic 覆寫。
+    """
+    policy = cfg.get("response_cache") or {}
+    if not policy.get("enabled"):
+        return None
+    if temperature != 0 and not policy.get("cache_nondeterministic", False):
+        return None
+    return {
+        "ttl": policy.get("ttl", 3600),
+        "semantic_threshold": policy.get("semantic_threshold", 0.92) if policy.get("semantic") else None,
+    }
@@ -0,0 +1,94 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import aiohttp
+
+
+def credential_fingerprint(api_key: Optional[str]) -> str:
+    """以雜湊代表憑證，避免明文 key 留在 registry 的 key 中"""
+    if not api_key:
+        return "-"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class ClientRegistry:
+    """
+    以 (provider, 憑證指紋, api_base) 為 key 的連線池註冊表。
+
+    每個 key 持有一個長駐的 aiohttp.ClientSession（keep-alive 連線池），
+    透過 litellm 的 shared_session 參數逐次傳入；憑證則以 api_key 參數逐次傳入，
+    不再寫入 os.environ。閒置過久或超過容量的 session 以 LRU 淘汰並關閉。
+
+    session 綁定伺服器的 event loop（啟動時以 bind 指定）；同步 chat 介面等以 asyncio.run
+    建立的暫時 loop 不使用共用 session，避免 session 留在已關閉的 loop 上。
+    """
+
+    def __init__(self,
+                 max_clients: int = 1024,
+                 idle_ttl: float = 300.0,
+                 pool_size: int = 100,
+                 keepalive_timeout: float = 60.0,
+                 close_grace: float = 120.0):
+        self.max_clients = max_clients
+        self.close_grace = close_grace
+        self.idle_ttl = idle_ttl
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._clients: "OrderedDict[Tuple[str, str, str], Tuple[aiohttp.ClientSession, float]]" = OrderedDict()
+        self._loop = None
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                         keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector)
+
+    def _evict(self, now: float):
+        # 先淘汰閒置過久的，再依 LRU 淘汰超出容量的
+        while self._clients:
+            key, (session, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.max_clients and now - last_used < self.idle_ttl:
+                break
+            del self._clients[key]
+            # 被淘汰的 session 可能仍有進行中的請求，延遲關閉
+            self._loop.call_later(self.close_grace, lambda s=session: asyncio.ensure_future(s.close()))
+
+    def bind(self):
+        """將 registry 綁定到目前的 event loop（伺服器啟動時呼叫）"""
+        self._loop = asyncio.get_running_loop()
+
+    def acquire(self, provider: str, api_key: Optional[str], api_base: Optional[str]) -> Optional[aiohttp.ClientSession]:
+        """
+        取得對應的 session；須在 event loop 中呼叫。
+
+        未綁定，或不在綁定的 loop 中呼叫（例如同步 chat 介面）時回傳 None，由 litellm 自行建立連線。
+        """
+        if self._loop is None or asyncio.get_running_loop() is not self._loop:
+            return None
+
+        now = time.monotonic()
+        key = (provider, credential_fingerprint(api_key), api_base or "")
+        entry = self._clients.get(key)
+        if entry is None or entry[0].closed:
+            session = self._new_session()
+        else:
+            session = entry[0]
+        self._clients[key] = (session, now)
+        self._clients.move_to_end(key)
+        self._evict(now)
+        return session
+
+    async def close(self):
+        clients, self._clients = self._clients, OrderedDict()
+        for session, _ in clients.values():
+            await session.close()
+        self._loop = None
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# 全域共用的 LLM 連線池註冊表
+client_registry = ClientRegistry()
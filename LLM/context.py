@@ -0,0 +1,233 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import litellm
+
+# 每則訊息固定的格式開銷（role、分隔符號等），與 OpenAI 的計算方式一致
+_MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=64)
+def get_tokenizer(model: str) -> Callable[[str], int]:
+    """每個 model 只選擇一次 tokenizer；回傳計算 token 數的函式"""
+    try:
+        from litellm.utils import _select_tokenizer
+        tokenizer = _select_tokenizer(model=model)
+    except Exception:
+        tokenizer = None
+
+    if tokenizer is None:
+        # 無法取得 tokenizer 時以字元數粗估：CJK 約一字一 token，其餘約四字元一 token
+        def estimate(text: str) -> int:
+            cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+            return cjk + (len(text) - cjk + 3) // 4
+        return estimate
+
+    def count(text: str) -> int:
+        return len(litellm.encode(model=model, text=text, custom_tokenizer=tokenizer))
+    return count
+
+
+class _TokenCountCache:
+    """
+    (model, 文字摘要) -> token 數的 LRU。
+    以 16 bytes 的 blake2b 摘要作為 key，不保留訊息原文，記憶體用量只與項目數有關。
+    """
+
+    def __init__(self, max_entries: int = 16384):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, model: str, text: str) -> int:
+        key = (model, hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+        with self._lock:
+            value = self._counts.get(key)
+            if value is not None:
+                self._counts.move_to_end(key)
+                return value
+        value = get_tokenizer(model)(text)
+        with self._lock:
+            self._counts[key] = value
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return value
+
+
+_token_counts = _TokenCountCache(int(os.getenv("CONTEXT_TOKEN_CACHE_SIZE", "16384")))
+
+
+def _count_text(model: str, text: str) -> int:
+    return _token_counts.count(model, text)
+
+
+def _message_text(message) -> str:
+    if not isinstance(message, dict):
+        message = message.model_dump() if hasattr(message, "model_dump") else dict(message)
+    parts = [message.get("role") or ""]
+    content = message.get("content")
+    if isinstance(content, str):
+        parts.append(content)
+    elif content:
+        parts.append(json.dumps(content, ensure_ascii=False, sort_keys=True))
+    if message.get("tool_calls"):
+        parts.append(json.dumps(message["tool_calls"], ensure_ascii=False, sort_keys=True, default=str))
+    return "\n".join(parts)
+
+
+def count_message_tokens(model: str, message) -> int:
+    """單則訊息的 token 數；相同內容的訊息只計算一次"""
+    return _count_text(model, _message_text(message)) + _MESSAGE_OVERHEAD
+
+
+def count_tokens(model: str, messages: List) -> int:
+    return sum(count_message_tokens(model, m) for m in messages)
+
+
+def _role(message) -> Optional[str]:
+    return message.get("role") if isinstance(message, dict) else getattr(message, "role", None)
+
+
+def _group_turns(history: List) -> List[List]:
+    """
+    將歷史切成不可分割的單位：帶 tool_calls 的 assistant 訊息與其後的 tool 訊息必須一起保留或捨棄，
+    否則 provider 會拒絕孤立的 tool 訊息。
+    """
+    groups = []
+    for message in history:
+        if _role(message) == "tool" and groups:
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+class ContextManager:
+    """
+    在 BaseLLM.chat 前依 token 預算整理對話歷史。
+
+    policy:
+        sliding_window: 保留最新的對話，捨棄最舊的
+        summarize: 將被捨棄的舊對話以 summarizer 濃縮成一則摘要訊息
+    pinned system 與 tool 訊息（pin_tools=True 時）不會被捨棄。
+    """
+
+    def __init__(self,
+                 max_prompt_tokens: int,
+                 policy: str = "sliding_window",
+                 pin_tools: bool = False,
+                 summary_tokens: int = 300):
+        if policy not in ("sliding_window", "summarize"):
+            raise ValueError(f"Unknown context policy: {policy}")
+        self.max_prompt_tokens = max_prompt_tokens
+        self.policy = policy
+        self.pin_tools = pin_tools
+        self.summary_tokens = summary_tokens
+
+    def _pinned(self, group: List) -> bool:
+        role = _role(group[0])
+        if role == "system":
+            return True
+        return self.pin_tools and any(_role(m) == "tool" for m in group)
+
+    def trim(self, model: str, system_prompt: str, history: List, user_prompt: str,
+             tools: Optional[List[dict]] = None) -> Tuple[List, List, int]:
+        """回傳 (保留的歷史, 被捨棄的歷史, 預估 prompt token 數)"""
+        fixed = count_tokens(model, [{"role": "system", "content": system_prompt},
+                                     {"role": "user", "content": user_prompt}])
+        if tools:
+            fixed += _count_text(model, json.dumps(tools, ensure_ascii=False, sort_keys=True))
+
+        groups = _group_turns(history or [])
+        sizes = [sum(count_message_tokens(model, m) for m in g) for g in groups]
+        reserve = self.summary_tokens if self.policy == "summarize" else 0
+        budget = self.max_prompt_tokens - fixed
+        total = sum(sizes)
+        if total <= budget:
+            return list(history or []), [], fixed + total
+
+        # 從最舊的開始捨棄，直到放得進預算（保留 summarize 的摘要空間）
+        keep = [True] * len(groups)
+        for i, group in enumerate(groups):
+            if total <= budget - reserve:
+                break
+            if self._pinned(group):
+                continue
+            keep[i] = False
+            total -= sizes[i]
+
+        kept = [m for g, k in zip(groups, keep) if k for m in g]
+        dropped = [m for g, k in zip(groups, keep) if not k for m in g]
+        return kept, dropped, fixed + total
+
+    async def fit(self, model: str, system_prompt: str, history: List, user_prompt: str,
+                  tools: Optional[List[dict]] = None, summarizer=None) -> Tuple[List, Dict]:
+        """
+        回傳 (整理後的歷史, 統計)。
+
+        summarizer: async function(訊息列表) -> 摘要文字；policy 為 summarize 時使用。
+        """
+        # 第一次使用某個 model 時選擇 tokenizer 可能較慢，計數放到 thread 執行
+        kept, dropped, prompt_tokens = await asyncio.to_thread(self.trim, model, system_prompt, history,
+                                                               user_prompt, tools)
+        stats = {
+            "prompt_tokens_estimate": prompt_tokens,
+            "dropped_messages": len(dropped),
+        }
+        if dropped and self.policy == "summarize" and summarizer is not None:
+            summary = await summarize_cached(dropped, summarizer)
+            summary_message = {"role": "system", "content": f"先前對話摘要：{summary}"}
+            kept = [summary_message] + kept
+            stats["prompt_tokens_estimate"] += count_message_tokens(model, summary_message)
+            stats["summarized"] = True
+        return kept, stats
+
+
+# 滾動摘要快取：key 為被捨棄訊息前綴的累積雜湊。
+# 對話變長時只需把「上一次的摘要 + 新被捨棄的訊息」再摘要一次，不必重新摘要整段歷史。
+_SUMMARY_CACHE: "Dict[str, str]" = {}
+_SUMMARY_CACHE_SIZE = 1024
+
+
+async def summarize_cached(messages: List, summarizer) -> str:
+    prefix_keys = []
+    digest = b""
+    for m in messages:
+        digest = hashlib.sha256(digest + _message_text(m).encode("utf-8")).digest()
+        prefix_keys.append(digest.hex())
+
+    if prefix_keys[-1] in _SUMMARY_CACHE:
+        return _SUMMARY_CACHE[prefix_keys[-1]]
+
+    start, previous = 0, None
+    for i in range(len(prefix_keys) - 2, -1, -1):
+        if prefix_keys[i] in _SUMMARY_CACHE:
+            start, previous = i + 1, _SUMMARY_CACHE[prefix_keys[i]]
+            break
+
+    pending = list(messages[start:])
+    if previous is not None:
+        pending.insert(0, {"role": "system", "content": f"先前對話摘要：{previous}"})
+    summary = await summarizer(pending)
+
+    if len(_SUMMARY_CACHE) >= _SUMMARY_CACHE_SIZE:
+        _SUMMARY_CACHE.pop(next(iter(_SUMMARY_CACHE)))
+    _SUMMARY_CACHE[prefix_keys[-1]] = summary
+    return summary
+
+
+def context_manager_from_config(cfg: Dict) -> Optional[ContextManager]:
+    """解析 agent 設定中的 context；未設定 max_prompt_tokens 時回傳 None"""
+    policy = cfg.get("context") or {}
+    if not policy.get("max_prompt_tokens"):
+        return None
+    return ContextManager(max_prompt_tokens=policy["max_prompt_tokens"],
+                          policy=policy.get("policy", "sliding_window"),
+                          pin_tools=policy.get("pin_tools", False),
+                          summary_tokens=policy.get("summary_tokens", 300))
@@ -0,0 +1,144 @@
+import asyncio
+from typing import Dict, Optional
+
+import aiohttp
+import litellm
+
+
+class ChatError(Exception):
+    """
+    對話過程中的結構化錯誤。
+
+    status_code: 對應的 HTTP 狀態碼。
+    retryable: 重試是否可能成功（暫時性錯誤）。
+    retry_after: 建議的重試秒數，None 表示未知。
+    """
+    status_code = 500
+    retryable = False
+
+    def __init__(self, message: str, provider: Optional[str] = None, model: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.provider = provider
+        self.model = model
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict:
+        error = {"type": type(self).__name__, "message": self.message, "retryable": self.retryable}
+        if self.provider:
+            error["provider"] = self.provider
+        if self.model:
+            error["model"] = self.model
+        if self.retry_after is not None:
+            error["retry_after"] = round(self.retry_after, 1)
+        return error
+
+
+class ProviderError(ChatError):
+    """provider 回傳的錯誤"""
+    status_code = 502
+
+
+class ProviderRateLimitError(ProviderError):
+    status_code = 429
+    retryable = True
+
+
+class ProviderUnavailableError(ProviderError):
+    """5xx 或連線中斷"""
+    status_code = 503
+    retryable = True
+
+
+class ProviderTimeoutError(ProviderError):
+    """
+    budget_limited: 本次請求的 timeout 由呼叫端的 /chat 預算縮短（低於 provider 的正常回應時間），
+    逾時不代表 provider 故障。
+    """
+    status_code = 504
+    retryable = True
+    budget_limited = False
+
+
+class ProviderAuthError(ProviderError):
+    status_code = 401
+
+
+class ProviderBadRequestError(ProviderError):
+    """請求內容有誤（例如超出 context window），重試不會成功"""
+    status_code = 400
+
+
+class CircuitOpenError(ProviderError):
+    """provider 連續失敗，斷路器開啟中，直接拒絕"""
+    status_code = 503
+
+
+class ToolExecutionError(ChatError):
+    status_code = 500
+
+
+class ToolTimeoutError(ToolExecutionError):
+    """isolated 工具超過時間上限，worker 已被終止"""
+    status_code = 504
+    retryable = True
+
+
+class ToolResourceError(ToolExecutionError):
+    """isolated 工具超出記憶體或 CPU 限制，或 worker 異常結束"""
+
+
+# litellm 例外對應的錯誤類別；依序比對，子類別須排在父類別之前
+_LITELLM_ERRORS = (
+    (litellm.RateLimitError, ProviderRateLimitError),
+    (litellm.Timeout, ProviderTimeoutError),
+    (litellm.ContextWindowExceededError, ProviderBadRequestError),
+    (litellm.AuthenticationError, ProviderAuthError),
+    (litellm.PermissionDeniedError, ProviderAuthError),
+    (litellm.BadRequestError, ProviderBadRequestError),
+    (litellm.NotFoundError, ProviderBadRequestError),
+    (litellm.UnprocessableEntityError, ProviderBadRequestError),
+    (litellm.ServiceUnavailableError, ProviderUnavailableError),
+    (litellm.InternalServerError, ProviderUnavailableError),
+    (litellm.BadGatewayError, ProviderUnavailableError),
+    (litellm.APIConnectionError, ProviderUnavailableError),
+)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: BaseException, provider: Optional[str] = None, model: Optional[str] = None) -> ChatError:
+    """將 provider 呼叫拋出的例外轉為 ChatError"""
+    if isinstance(exc, ChatError):
+        return exc
+    message = str(exc) or type(exc).__name__
+    for exc_type, error_type in _LITELLM_ERRORS:
+        if isinstance(exc, exc_type):
+            return error_type(message, provider, model, _retry_after(exc))
+
+    if isinstance(exc, asyncio.TimeoutError):
+        return ProviderTimeoutError(message, provider, model)
+    if isinstance(exc, (aiohttp.ClientConnectionError, ConnectionError)):
+        return ProviderUnavailableError(message, provider, model)
+
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return ProviderRateLimitError(message, provider, model, _retry_after(exc))
+    if isinstance(status, int) and status >= 500:
+        return ProviderUnavailableError(message, provider, model)
+    if isinstance(status, int) and status in (401, 403):
+        return ProviderAuthError(message, provider, model)
+    if isinstance(status, int) and status >= 400:
+        return ProviderBadRequestError(message, provider, model)
+    if isinstance(status, int):
+        return ProviderError(message, provider, model)
+    return ChatError(message, provider, model)
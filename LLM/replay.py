@@ -0,0 +1,326 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+
+from litellm import acompletion, ModelResponse, ModelResponseStream
+
+# 產生 key 時忽略的參數（憑證、連線與逾時不影響回應內容）
+_KEY_FIELDS = ("model", "messages", "tools", "tool_choice", "temperature", "max_tokens", "stream")
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def _normalize_message(message) -> Dict:
+    """只保留影響回應的欄位，讓錄製時的 litellm Message 與重播時的 dict 得到相同的 key"""
+    normalized = {"role": _field(message, "role"), "content": _field(message, "content")}
+    tool_calls = _field(message, "tool_calls")
+    if tool_calls:
+        normalized["tool_calls"] = [
+            {
+                "id": _field(call, "id"),
+                "name": _field(_field(call, "function"), "name"),
+                "arguments": _field(_field(call, "function"), "arguments"),
+            }
+            for call in tool_calls
+        ]
+    if _field(message, "tool_call_id"):
+        normalized["tool_call_id"] = _field(message, "tool_call_id")
+    return normalized
+
+
+def request_key(kwargs: Dict) -> str:
+    payload = {field: kwargs.get(field) for field in _KEY_FIELDS}
+    payload["messages"] = [_normalize_message(m) for m in kwargs.get("messages", [])]
+    payload["stream"] = bool(payload["stream"])
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _usage_dict(usage) -> Optional[Dict]:
+    if not usage:
+        return None
+    return {name: _field(usage, name) or 0 for name in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+
+class LatencyModel:
+    """
+    重播時的延遲模型。
+
+    mode:
+        none: 不等待
+        recorded: 依錄製時的時間間隔重播
+        synthetic: 以 ttft（首個 token 延遲）與 inter_token（每個 chunk 間隔）加上 jitter 比例的隨機抖動
+    """
+
+    def __init__(self, mode: str = "none", ttft: float = 0.3, inter_token: float = 0.02, jitter: float = 0.2):
+        if mode not in ("none", "recorded", "synthetic"):
+            raise ValueError(f"Unknown replay latency mode: {mode}")
+        self.mode = mode
+        self.ttft = ttft
+        self.inter_token = inter_token
+        self.jitter = jitter
+
+    @classmethod
+    def from_env(cls) -> "LatencyModel":
+        """LLM_REPLAY_LATENCY: none | recorded | synthetic；synthetic 參數由 LLM_REPLAY_TTFT / LLM_REPLAY_ITL 設定"""
+        return cls(mode=os.getenv("LLM_REPLAY_LATENCY", "none"),
+                   ttft=float(os.getenv("LLM_REPLAY_TTFT", "0.3")),
+                   inter_token=float(os.getenv("LLM_REPLAY_ITL", "0.02")),
+                   jitter=float(os.getenv("LLM_REPLAY_JITTER", "0.2")))
+
+    def _jittered(self, seconds: float) -> float:
+        if not self.jitter:
+            return seconds
+        return max(0.0, seconds * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def first(self, recorded: Optional[float]) -> float:
+        if self.mode == "recorded" and recorded is not None:
+            return recorded
+        return self._jittered(self.ttft) if self.mode == "synthetic" else 0.0
+
+    def gap(self, recorded: Optional[float]) -> float:
+        if self.mode == "recorded" and recorded is not None:
+            return recorded
+        return self._jittered(self.inter_token) if self.mode == "synthetic" else 0.0
+
+
+class Cassette:
+    """
+    一個 JSON Lines 檔案，每行一筆錄製：{"key", "response"} 或 {"key", "chunks"}。
+
+    response: {"message", "usage", "elapsed"}
+    chunks: [{"delta", "dt"}, ...]，dt 為與前一個 chunk 的間隔秒數；最後可附 usage
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, Dict]] = None
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]] = entry
+        return self._entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._load().get(key)
+
+    def put(self, entry: Dict):
+        self._load()[entry["key"]] = entry
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def __len__(self):
+        return len(self._load())
+
+
+_CASSETTES: Dict[str, Cassette] = {}
+
+
+def get_cassette(path: str) -> Cassette:
+    cassette = _CASSETTES.get(path)
+    if cassette is None:
+        cassette = _CASSETTES[path] = Cassette(path)
+    return cassette
+
+
+# ---- 合成回應：沒有對應錄製時使用 ----
+
+_WORDS = ("the", "agent", "result", "value", "tool", "answer", "data", "request", "model", "stream",
+          "token", "cache", "weather", "time", "user", "system", "query", "response", "text", "ok")
+
+
+def _sample_argument(schema: Dict, seed: int):
+    if schema.get("enum"):
+        return schema["enum"][0]
+    return {
+        "integer": seed % 10 + 1,
+        "number": float(seed % 10 + 1),
+        "boolean": True,
+        "array": [],
+        "object": {},
+    }.get(schema.get("type"), f"sample-{seed % 100}")
+
+
+def synthetic_message(kwargs: Dict, key: str) -> Dict:
+    """
+    依請求內容產生確定性的回應：最後一則是使用者訊息且有工具時，依 key 選擇一個工具呼叫，
+    否則產生長度與 max_tokens 相關的文字答案。
+    """
+    seed = int(key[:8], 16)
+    messages = kwargs.get("messages", [])
+    tools = kwargs.get("tools") or []
+    last_role = _field(messages[-1], "role") if messages else None
+    if tools and last_role == "user" and kwargs.get("tool_choice") != "none":
+        function = tools[seed % len(tools)]["function"]
+        properties = function.get("parameters", {}).get("properties", {})
+        arguments = {name: _sample_argument(prop, seed + i) for i, (name, prop) in enumerate(properties.items())}
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{key[:12]}",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)}
+            }]
+        }
+    length = max(1, min(kwargs.get("max_tokens") or 64, 64))
+    rng = random.Random(seed)
+    return {"role": "assistant", "content": " ".join(rng.choice(_WORDS) for _ in range(length))}
+
+
+def _estimate_usage(kwargs: Dict, message: Dict) -> Dict:
+    prompt = len(json.dumps([_normalize_message(m) for m in kwargs.get("messages", [])], ensure_ascii=False)) // 4
+    completion = len(json.dumps(message, ensure_ascii=False)) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _message_to_deltas(message: Dict) -> List[Dict]:
+    """將完整訊息切成串流 delta：文字約每個詞一個 chunk，tool_call 先送名稱再分段送參數"""
+    deltas = []
+    content = message.get("content")
+    if content:
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            deltas.append({"role": "assistant", "content": word if i == 0 else " " + word})
+    for index, call in enumerate(message.get("tool_calls") or []):
+        arguments = call["function"]["arguments"]
+        deltas.append({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                       "function": {"name": call["function"]["name"], "arguments": ""}}]})
+        for start in range(0, len(arguments), 16):
+            deltas.append({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + 16]}}]})
+    return deltas
+
+
+def _finish_reason(message: Dict) -> str:
+    return "tool_calls" if message.get("tool_calls") else "stop"
+
+
+def _build_response(kwargs: Dict, message: Dict, usage: Optional[Dict]) -> ModelResponse:
+    return ModelResponse(model=kwargs.get("model"),
+                         choices=[{"index": 0, "message": message, "finish_reason": _finish_reason(message)}],
+                         usage=usage)
+
+
+def _build_chunk(kwargs: Dict, delta: Dict, usage: Optional[Dict] = None) -> ModelResponseStream:
+    chunk = ModelResponseStream(model=kwargs.get("model"), choices=[{"index": 0, "delta": delta}])
+    if usage:
+        chunk.usage = usage
+    return chunk
+
+
+class ReplayBackend:
+    """
+    錄製與重播 provider 回應。
+
+    mode:
+        replay: 只重播；沒有錄製時使用合成回應（預設，完全離線）
+        record: 呼叫真實 provider 並錄製（已有錄製時直接重播）
+        passthrough: 呼叫真實 provider，不錄製
+    """
+
+    def __init__(self, cassette: Cassette, mode: str = "replay", latency: Optional[LatencyModel] = None):
+        if mode not in ("replay", "record", "passthrough"):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency or LatencyModel()
+        self.stats = {"hits": 0, "synthetic": 0, "recorded": 0}
+
+    async def complete(self, kwargs: Dict, upstream=acompletion):
+        key = request_key(kwargs)
+        stream = bool(kwargs.get("stream"))
+        if self.mode != "passthrough":
+            entry = self.cassette.get(key)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return self._replay_stream(kwargs, entry) if stream else await self._replay(kwargs, entry)
+        if self.mode == "replay":
+            self.stats["synthetic"] += 1
+            message = synthetic_message(kwargs, key)
+            usage = _estimate_usage(kwargs, message)
+            entry = {"key": key, "response": {"message": message, "usage": usage, "elapsed": None}}
+            if stream:
+                entry = {"key": key, "chunks": [{"delta": d, "dt": None} for d in _message_to_deltas(message)],
+                         "usage": usage}
+                return self._replay_stream(kwargs, entry)
+            return await self._replay(kwargs, entry)
+
+        started = time.perf_counter()
+        result = await upstream(**kwargs)
+        if self.mode == "passthrough":
+            return result
+        self.stats["recorded"] += 1
+        if stream:
+            return self._record_stream(key, result, started)
+        message = result["choices"][0]["message"].model_dump(exclude_none=True)
+        message.pop("provider_specific_fields", None)
+        self.cassette.put({"key": key, "response": {"message": message,
+                                                    "usage": _usage_dict(getattr(result, "usage", None)),
+                                                    "elapsed": round(time.perf_counter() - started, 4)}})
+        return result
+
+    async def _record_stream(self, key: str, stream, started: float):
+        chunks = []
+        usage = None
+        last = started
+        async for chunk in stream:
+            now = time.perf_counter()
+            if chunk.choices:
+                delta = chunk.choices[0].delta.model_dump(exclude_none=True)
+                delta.pop("provider_specific_fields", None)
+                chunks.append({"delta": delta, "dt": round(now - last, 4)})
+            usage = _usage_dict(getattr(chunk, "usage", None)) or usage
+            last = now
+            yield chunk
+        # 只在串流完整結束時寫入，中斷的串流不錄製
+        self.cassette.put({"key": key, "chunks": chunks, "usage": usage})
+
+    async def _replay(self, kwargs: Dict, entry: Dict) -> ModelResponse:
+        response = entry["response"]
+        message = response["message"]
+        if self.latency.mode == "synthetic":
+            delay = self.latency.first(None) + self.latency.gap(None) * len(_message_to_deltas(message))
+        else:
+            delay = self.latency.first(response.get("elapsed"))
+        if delay:
+            await asyncio.sleep(delay)
+        return _build_response(kwargs, message, response.get("usage"))
+
+    async def _replay_stream(self, kwargs: Dict, entry: Dict):
+        for i, chunk in enumerate(entry["chunks"]):
+            delay = self.latency.first(chunk.get("dt")) if i == 0 else self.latency.gap(chunk.get("dt"))
+            if delay:
+                await asyncio.sleep(delay)
+            yield _build_chunk(kwargs, chunk["delta"])
+        if entry.get("usage"):
+            yield ModelResponseStream(model=kwargs.get("model"), choices=[], usage=entry["usage"])
+
+
+_BACKENDS: Dict[str, ReplayBackend] = {}
+
+
+def get_backend() -> ReplayBackend:
+    """
+    依環境變數建立（並共用）重播後端：
+    LLM_REPLAY_MODE（replay / record / passthrough）、LLM_REPLAY_CASSETTE（cassette 檔案路徑）、
+    LLM_REPLAY_LATENCY 等延遲設定。
+    """
+    path = os.getenv("LLM_REPLAY_CASSETTE", os.path.join("cassettes", "default.jsonl"))
+    mode = os.getenv("LLM_REPLAY_MODE", "replay")
+    backend = _BACKENDS.get(path)
+    if backend is None or backend.mode != mode:
+        backend = _BACKENDS[path] = ReplayBackend(get_cassette(path), mode, LatencyModel.from_env())
+    return backend
@@ -0,0 +1,180 @@
+import os
+import time
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .errors import ChatError, ProviderError, CircuitOpenError, ProviderBadRequestError, ProviderAuthError, \
+    ProviderRateLimitError, ProviderTimeoutError
+from utils.metrics import registry, model_labels, OTHER_LABEL
+
+CIRCUIT_STATE = registry.gauge(
+    "llm_circuit_state", "Circuit breaker state per provider and model (0=closed, 1=half_open, 2=open)",
+    ("provider", "model"))
+CIRCUIT_TRANSITIONS = registry.counter(
+    "llm_circuit_transitions_total", "Circuit breaker state changes",
+    ("provider", "model", "state"))
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "LLM requests retried after a transient error",
+    ("provider", "model", "error"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class RetryPolicy:
+    """
+    可重試錯誤的重試策略，退避時間採 decorrelated jitter：
+    delay = min(max_delay, random(base_delay, 上次 delay * 3))。
+
+    max_attempts: 含第一次在內的嘗試次數上限。
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def next_delay(self, previous: Optional[float], retry_after: Optional[float] = None) -> float:
+        previous = previous or self.base_delay
+        delay = min(self.max_delay, random.uniform(self.base_delay, previous * 3))
+        # provider 指定的 Retry-After 優先
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict]) -> "RetryPolicy":
+        cfg = cfg or {}
+        return cls(max_attempts=cfg.get("max_attempts", 3),
+                   base_delay=cfg.get("base_delay", 0.5),
+                   max_delay=cfg.get("max_delay", 8.0))
+
+
+class CircuitBreaker:
+    """
+    單一 (provider, model) 的斷路器。
+
+    連續 failure_threshold 次失敗後開啟，開啟期間直接拒絕；
+    recovery_timeout 秒後進入半開狀態，放行 half_open_max 個探測請求，成功則關閉，失敗則重新開啟。
+    """
+
+    def __init__(self, provider: str, model: str,
+                 failure_threshold: int = 5,
+                 recovery_timeout: float = 30.0,
+                 half_open_max: int = 1):
+        self.provider = provider
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        model = model_labels(self.model)
+        # 未設定的 model 共用 "other" 標籤，狀態無法以單一 gauge 表示，只計轉換次數
+        if model != OTHER_LABEL:
+            CIRCUIT_STATE.set(_STATE_VALUES[state], provider=self.provider, model=model)
+        CIRCUIT_TRANSITIONS.inc(provider=self.provider, model=model, state=state)
+
+    def before_call(self):
+        """請求前檢查；斷路器開啟時拋出 CircuitOpenError"""
+        if self.state == OPEN:
+            waited = time.monotonic() - self.opened_at
+            if waited < self.recovery_timeout:
+                raise CircuitOpenError(f"circuit open for {self.provider}/{self.model}",
+                                       self.provider, self.model, self.recovery_timeout - waited)
+            self._set_state(HALF_OPEN)
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_max:
+                raise CircuitOpenError(f"circuit half-open for {self.provider}/{self.model}, probe in progress",
+                                       self.provider, self.model, 1.0)
+            self.probes += 1
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def release_probe(self):
+        """探測請求未產生結果（例如被取消）時歸還名額"""
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+
+# 請求的 timeout 低於此秒數時，逾時視為呼叫端預算不足（/chat 的 timeout 或剩餘時間太短），而非 provider 故障
+BREAKER_MIN_TIMEOUT = float(os.getenv("LLM_BREAKER_MIN_TIMEOUT", "30"))
+
+
+def mark_budget_timeout(error: ChatError, timeout: Optional[float]) -> ChatError:
+    """本次嘗試的 timeout 低於 BREAKER_MIN_TIMEOUT 時，將逾時標記為預算造成"""
+    if isinstance(error, ProviderTimeoutError) and timeout is not None and timeout < BREAKER_MIN_TIMEOUT:
+        error.budget_limited = True
+    return error
+
+
+def counts_as_failure(error: ChatError) -> bool:
+    """
+    請求本身有誤、憑證錯誤、限流或呼叫端預算造成的逾時不代表 provider 故障，不計入斷路器。
+    斷路器由所有 agent 共用：429 針對的是單一憑證的額度，預算逾時取決於單一請求的設定，
+    計入會讓少數請求連帶擋下其他 agent。
+    """
+    if isinstance(error, ProviderTimeoutError) and error.budget_limited:
+        return False
+    return isinstance(error, ProviderError) and \
+        not isinstance(error, (ProviderBadRequestError, ProviderAuthError, ProviderRateLimitError, CircuitOpenError))
+
+
+class BreakerRegistry:
+    """
+    max_breakers: 保留的斷路器數上限（model 名稱來自請求）；超過時淘汰最久未使用、且處於關閉狀態的斷路器，
+    全部都未關閉時才淘汰最久未使用的。
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max: int = 1,
+                 max_breakers: int = 1024):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self.max_breakers = max(1, max_breakers)
+        self._breakers: "OrderedDict[Tuple[str, str], CircuitBreaker]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is not None:
+                self._breakers.move_to_end(key)
+                return breaker
+            breaker = self._breakers[key] = CircuitBreaker(
+                provider, model, self.failure_threshold, self.recovery_timeout, self.half_open_max)
+            if len(self._breakers) > self.max_breakers:
+                self._evict()
+        if model_labels(model) != OTHER_LABEL:
+            CIRCUIT_STATE.set(0, provider=provider, model=model)
+        return breaker
+
+    def _evict(self):
+        victim = next((k for k, b in self._breakers.items() if b.state == CLOSED), None)
+        self._breakers.pop(victim if victim is not None else next(iter(self._breakers)))
+
+    def states(self) -> Dict[str, str]:
+        return {f"{p}/{m}": b.state for (p, m), b in list(self._breakers.items())}
+
+
+# 全域共用的斷路器；同一 provider 與 model 的所有 agent 共用狀態
+circuit_breakers = BreakerRegistry(max_breakers=int(os.getenv("LLM_MAX_BREAKERS", "1024")))
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+
+class RoutingPolicy:
+    """
+    每個 agent 可選的路由策略。
+
+    fallbacks: 依序備援的 BaseLLM（可為不同 provider 或 model）。
+    hedge_after: 主要 provider 在此秒數內未產生第一個 token（非串流為完整回應）時，
+        對下一個備援發出對沖請求，先回應者勝出，另一方被取消；None 表示只在錯誤時切換。
+    failover: 發生錯誤時是否切換到下一個備援。
+    """
+
+    def __init__(self, fallbacks: List, hedge_after: Optional[float] = None, failover: bool = True):
+        self.fallbacks = fallbacks
+        self.hedge_after = hedge_after
+        self.failover = failover
+
+
+async def _close(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+class _PrefetchedStream:
+    """已預讀第一個 chunk 的串流；aclose 會關閉底層串流（即使從未被迭代），釋放連線與限流名額"""
+
+    def __init__(self, first, stream, iterator):
+        self._first = first
+        self._pending_first = True
+        self._stream = stream
+        self._iterator = iterator
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._pending_first:
+            self._pending_first = False
+            first, self._first = self._first, None
+            return first
+        return await self._iterator.__anext__()
+
+    async def aclose(self):
+        self._pending_first = False
+        await _close(self._stream)
+
+
+async def _first_chunk(stream):
+    """等待串流的第一個 chunk，回傳已預讀第一個 chunk 的串流；等待中被取消或出錯時關閉串流"""
+    iterator = stream.__aiter__()
+    try:
+        first = await iterator.__anext__()
+    except BaseException:
+        await _close(stream)
+        raise
+    return _PrefetchedStream(first, stream, iterator)
+
+
+async def _discard(task: asyncio.Future):
+    task.cancel()
+    try:
+        result = await task
+    except BaseException:
+        return
+    # 已完成的串流也要關閉，釋放連線
+    await _close(result)
+
+
+async def hedged_call(legs: List[Tuple[str, Callable[[], Awaitable]]],
+                      hedge_after: Optional[float] = None,
+                      failover: bool = True,
+                      stream: bool = False):
+    """
+    依序啟動 legs，回傳 (結果, 勝出的 leg 名稱)。
+
+    legs: (名稱, 發出請求的 coroutine function)；串流模式下以第一個 chunk 到達作為回應。
+    """
+    pending = {}
+    errors = []
+    next_leg = 0
+
+    def launch():
+        nonlocal next_leg
+        label, call = legs[next_leg]
+        next_leg += 1
+
+        async def run():
+            result = await call()
+            return await _first_chunk(result) if stream else result
+
+        pending[asyncio.ensure_future(run())] = label
+
+    launch()
+    try:
+        while pending:
+            can_hedge = hedge_after is not None and next_leg < len(legs)
+            done, _ = await asyncio.wait(pending, timeout=hedge_after if can_hedge else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+
+            for task in done:
+                label = pending.pop(task)
+                if task.exception() is None:
+                    return task.result(), label
+                errors.append(task.exception())
+                if failover and next_leg < len(legs):
+                    launch()
+        raise errors[-1]
+    finally:
+        for task in pending:
+            await _discard(task)
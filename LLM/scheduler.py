@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque, OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from .clients import credential_fingerprint
+from .errors import ChatError
+from utils.metrics import registry
+
+RATE_LIMIT_WAITING = registry.gauge(
+    "llm_rate_limit_waiting", "LLM requests waiting for a rate-limit slot",
+    ("provider",))
+RATE_LIMIT_REJECTED = registry.counter(
+    "llm_rate_limit_rejected_total", "LLM requests rejected by the local rate limiter",
+    ("provider", "reason"))
+
+
+class RateLimited(ChatError):
+    """本地限流拒絕請求；retry_after 為建議的重試秒數"""
+    status_code = 429
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        super().__init__(f"{provider} rate limit exceeded ({reason}), retry after {retry_after:.1f}s",
+                         provider=provider, retry_after=retry_after)
+        self.reason = reason
+
+
+def estimate_request_tokens(kwargs: Dict) -> int:
+    """以字元數粗估一次請求的 token 數（prompt + max_tokens），僅供限流使用"""
+    size = len(json.dumps(kwargs.get("messages", []), ensure_ascii=False, default=str))
+    if kwargs.get("tools"):
+        size += len(json.dumps(kwargs["tools"], ensure_ascii=False, default=str))
+    return size // 4 + (kwargs.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """每分鐘補充 per_minute 個 token 的 token bucket；允許透支，讓等待中的請求依序排隊"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """取得 amount 個 token 需要等待的秒數"""
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity)
+        return max(amount - self.tokens, 0.0) / self.rate
+
+    def take(self, amount: float):
+        self._refill(time.monotonic())
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def resize(self, per_minute: float):
+        """調整上限，保留目前剩餘（或透支）的額度"""
+        self._refill(time.monotonic())
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = min(self.capacity, self.tokens)
+
+
+def _resize_bucket(bucket: Optional[TokenBucket], per_minute: Optional[float]) -> Optional[TokenBucket]:
+    if not per_minute:
+        return None
+    if bucket is None:
+        return TokenBucket(per_minute)
+    bucket.resize(per_minute)
+    return bucket
+
+
+class ProviderLimiter:
+    """
+    單一 (provider, 憑證) 的限流器。
+
+    rpm / tpm: 每分鐘請求數與 token 數上限，None 表示不限制。
+    max_concurrency: 同時進行的請求上限（串流請求直到串流結束才釋放）。
+    max_queue: 等待中的請求上限，超過時立即拒絕。
+    max_wait: 預估等待超過此秒數時立即拒絕，不排隊。
+
+    併發名額依到達順序分配：有請求在等待時，新請求排在後面；釋放的名額直接交給最早的等待者。
+    """
+
+    def __init__(self,
+                 provider: str,
+                 rpm: Optional[float] = None,
+                 tpm: Optional[float] = None,
+                 max_concurrency: Optional[int] = None,
+                 max_queue: int = 100,
+                 max_wait: float = 30.0):
+        self.provider = provider
+        self.requests = self.tokens = None
+        self.active = 0
+        self.waiting = 0
+        self._waiters: deque = deque()
+        self.configure(rpm, tpm, max_concurrency, max_queue, max_wait)
+
+    def configure(self,
+                  rpm: Optional[float] = None,
+                  tpm: Optional[float] = None,
+                  max_concurrency: Optional[int] = None,
+                  max_queue: int = 100,
+                  max_wait: float = 30.0):
+        """就地套用新設定，保留目前的額度、進行中與等待中的請求"""
+        self.config = (rpm, tpm, max_concurrency, max_queue, max_wait)
+        self.requests = _resize_bucket(self.requests, rpm)
+        self.tokens = _resize_bucket(self.tokens, tpm)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        # 上限提高時讓等待者取得新增的名額
+        self._wake_next()
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and self.waiting == 0
+
+    def _has_slot(self) -> bool:
+        return self.max_concurrency is None or self.active < self.max_concurrency
+
+    def _reject(self, retry_after: float, reason: str):
+        RATE_LIMIT_REJECTED.inc(provider=self.provider, reason=reason)
+        raise RateLimited(self.provider, retry_after, reason)
+
+    async def _acquire_slot(self):
+        if self._has_slot() and not self._waiters:
+            self.active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # 被喚醒時名額已由 _wake_next 計入 active
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # 名額已交給本請求卻被取消，轉交給下一個等待者
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters and self._has_slot():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    async def acquire(self, tokens: int):
+        """等待額度與併發名額；無法在 max_wait 內取得時拋出 RateLimited"""
+        if self.waiting >= self.max_queue:
+            self._reject(self.max_wait, "queue_full")
+
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens))
+        if delay > self.max_wait:
+            self._reject(delay, "rate")
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+
+        # 已有請求在等待名額時不可插隊
+        if not delay and self._has_slot() and not self._waiters:
+            self.active += 1
+            return
+
+        self.waiting += 1
+        RATE_LIMIT_WAITING.inc(provider=self.provider)
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            await asyncio.wait_for(self._acquire_slot(), self.max_wait)
+        except BaseException as e:
+            # 未送出的請求歸還額度
+            if self.requests is not None:
+                self.requests.refund(1)
+            if self.tokens is not None:
+                self.tokens.refund(tokens)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(self.max_wait, "concurrency")
+            raise
+        finally:
+            self.waiting -= 1
+            RATE_LIMIT_WAITING.dec(provider=self.provider)
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """以 provider 回報的實際用量修正 tpm 額度"""
+        if self.tokens is not None and actual is not None and actual < estimated:
+            self.tokens.refund(estimated - actual)
+
+
+class _ReleasingStream:
+    """串流結束、出錯或被關閉時釋放併發名額（即使從未被迭代）"""
+
+    def __init__(self, stream, limiter: ProviderLimiter):
+        self._iterator = stream.__aiter__()
+        self._stream = stream
+        self._limiter = limiter
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        self._release()
+        aclose = getattr(self._stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    def __del__(self):
+        self._release()
+
+
+def release_on_close(stream, limiter: ProviderLimiter):
+    return _ReleasingStream(stream, limiter)
+
+
+def _strictest(configs: Iterable[Tuple]) -> Tuple:
+    """逐欄取最嚴格（最小）的設定；None 表示不限制"""
+    def lowest(values):
+        values = [v for v in values if v is not None]
+        return min(values) if values else None
+    return tuple(lowest(column) for column in zip(*configs))
+
+
+class RateLimitScheduler:
+    """
+    以 (provider, 憑證指紋) 為 key 的限流器註冊表；使用同一把 API key 的 agent 共用額度。
+
+    共用同一把 key 的 agent 設定不同時，採用 config_ttl 秒內出現過的設定中最嚴格的值，
+    並就地調整限流器，不重設額度與等待佇列。
+    max_limiters: 保留的限流器數上限，超過時淘汰最久未使用且閒置的限流器。
+    """
+
+    def __init__(self, max_limiters: int = 4096, config_ttl: float = 600.0):
+        self.max_limiters = max_limiters
+        self.config_ttl = config_ttl
+        self._limiters: "OrderedDict[Tuple[str, str], ProviderLimiter]" = OrderedDict()
+        self._configs: Dict[Tuple[str, str], Dict[Tuple, float]] = {}
+
+    def get(self, provider: str, api_key: Optional[str], limits: Optional[Dict]) -> Optional[ProviderLimiter]:
+        """
+        依 agent 設定取得限流器；limits 為空時回傳 None（不限流）。
+
+        limits: {"rpm": 500, "tpm": 200000, "max_concurrency": 20, "max_queue": 100, "max_wait": 30}
+        """
+        if not limits:
+            return None
+        key = (provider, credential_fingerprint(api_key))
+        config = (limits.get("rpm"), limits.get("tpm"), limits.get("max_concurrency"),
+                  limits.get("max_queue", 100), limits.get("max_wait", 30.0))
+        now = time.monotonic()
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = ProviderLimiter(provider, *config)
+            self._configs[key] = {config: now}
+            self._evict()
+            return limiter
+
+        self._limiters.move_to_end(key)
+        seen = self._configs[key]
+        seen[config] = now
+        if len(seen) > 1:
+            for old in [c for c, at in seen.items() if now - at > self.config_ttl]:
+                del seen[old]
+            effective = _strictest(seen)
+        else:
+            effective = config
+        if limiter.config != effective:
+            limiter.configure(*effective)
+        return limiter
+
+    def _evict(self):
+        excess = len(self._limiters) - self.max_limiters
+        if excess <= 0:
+            return
+        victims = []
+        for key, limiter in self._limiters.items():
+            if len(victims) >= excess:
+                break
+            if limiter.idle:
+                victims.append(key)
+        for key in victims:
+            del self._limiters[key]
+            del self._configs[key]
+
+
+# 全域共用的限流排程器
+rate_limiter = RateLimitScheduler(max_limiters=int(os.getenv("LLM_MAX_RATE_LIMITERS", "4096")))
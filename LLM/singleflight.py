@@ -0,0 +1,119 @@
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+
+def make_flight_key(**parts) -> str:
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Broadcast:
+    """將單一串流分送給多個訂閱者；晚加入的訂閱者會先重播已產生的 chunk"""
+
+    def __init__(self, agen: AsyncIterator, on_done: Callable[[], None]):
+        self.chunks = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._task = asyncio.ensure_future(self._pump(agen))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self, agen: AsyncIterator):
+        try:
+            async for chunk in agen:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_done()
+            self._notify()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                changed = self._changed
+                if i < len(self.chunks):
+                    yield self.chunks[i]
+                    i += 1
+                elif self.done:
+                    if self.error is not None and not isinstance(self.error, asyncio.CancelledError):
+                        raise self.error
+                    return
+                else:
+                    await changed.wait()
+        finally:
+            self.subscribers -= 1
+            # 所有訂閱者都離開時停止上游請求
+            if self.subscribers == 0 and not self.done:
+                self._task.cancel()
+
+
+class SingleFlight:
+    """
+    相同請求的合併執行：同一 key 在執行中時，後到的請求共用第一個請求的上游呼叫。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """
+        回傳 (結果, 是否共用他人的呼叫)。
+
+        上游呼叫在獨立的 task 中執行，第一個請求中途斷線也不會影響共用它的其他請求。
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self._stats["followers"] += 1
+        else:
+            self._stats["leaders"] += 1
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator]) -> Tuple[AsyncIterator, bool]:
+        """回傳 (訂閱用的 async generator, 是否共用他人的串流)"""
+        broadcast = self._streams.get(key)
+        shared = broadcast is not None
+        if shared:
+            self._stats["followers"] += 1
+        else:
+            self._stats["leaders"] += 1
+            broadcast = self._streams[key] = _Broadcast(factory(), lambda: self._streams.pop(key, None))
+        return broadcast.subscribe(), shared
+
+    def stats(self) -> Dict:
+        return dict(self._stats, in_flight=len(self._calls) + len(self._streams))
+
+
+# 全域共用的 single-flight 群組
+single_flight = SingleFlight()
+
+
+def flight_enabled(cfg: Dict, temperature: float) -> bool:
+    """
+    agent 設定 single_flight 啟用且取樣設定可共享時才合併。
+
+    single_flight 可為 true，或 {"enabled": true, "allow_sampling": false}；
+    預設只在 temperature 為 0 時合併，避免把同一個隨機取樣結果分給所有人。
+    """
+    policy = cfg.get("single_flight")
+    if isinstance(policy, bool):
+        policy = {"enabled": policy}
+    if not policy or not policy.get("enabled"):
+        return False
+    return temperature == 0 or bool(policy.get("allow_sampling", False))
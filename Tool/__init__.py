@@ -33,23 +33,73 @@
 
 
 import os
+import inspect
 import importlib
 import sys
 
 # 全域工具註冊表
 TOOL_FUNCTIONS = {}
+# 模組名稱 -> 該模組註冊的工具名稱，供 Tool.reloader 增量重新載入時比對
+MODULE_TOOLS = {}
+# 註冊表版本：工具新增、改寫或移除後遞增，供快取工具解析結果的呼叫端（utils.agent_cache）判斷是否過期
+_registry_version = 0
 
-def register_tool(name: str = None):
+def registry_version() -> int:
+    return _registry_version
+
+def bump_registry_version():
+    global _registry_version
+    _registry_version += 1
+
+def register_tool(name: str = None,
+                  concurrency: int = None,
+                  cache_ttl: float = None,
+                  cache_max_entries: int = 256,
+                  cache_key=None,
+                  isolated: bool = False,
+                  timeout: float = None,
+                  result_policy: dict = None,
+                  builtin: bool = False):
+    """
+    name: 自定義工具名稱，預設為函式名。
+    concurrency: 此工具同時執行的上限（跨請求共享），None 表示不限制。
+    cache_ttl: 結果快取秒數，None 表示不快取。
+    cache_max_entries: 此工具快取的最大筆數（LRU）。
+    cache_key: 自訂參數正規化函式，接收參數 dict，回傳用於組成快取 key 的值。
+    isolated: 是否在獨立的 worker process 中執行（見 Tool.sandbox），使用者上傳的程式碼應開啟。
+    timeout: isolated 工具單次執行的秒數上限，None 表示使用 sandbox 預設值。
+    result_policy: 工具結果政策（max_chars、fields、on_overflow、page_chars，見 Tool.results），
+        agent 設定的 tool_results 可覆寫。
+    builtin: 立即加入 TOOL_FUNCTIONS，用於不在 tools 資料夾、不經 load_tools 收集的內建工具（例如 read_tool_result）。
+    """
     def decorator(func):
         func._is_tool = True
         func._tool_name = name or func.__name__
+        func._tool_concurrency = concurrency
+        func._tool_isolated = isolated
+        func._tool_async = inspect.iscoroutinefunction(func)
+        func._tool_result_policy = result_policy
+        func._tool_timeout = timeout
+        func._tool_cache = None
+        if cache_ttl:
+            func._tool_cache = {"ttl": cache_ttl, "max_entries": cache_max_entries, "key": cache_key}
+        if builtin:
+            TOOL_FUNCTIONS[func._tool_name] = func
+            bump_registry_version()
         return func
     return decorator
 
-def load_tools():
-    # 假設 tools 資料夾與這個檔案在同一層
-    base_dir = os.path.dirname(__file__)
-    tools_dir = os.path.join(base_dir, "tools")
+def load_tools(tools_dir: str = None, lazy: bool = True):
+    """
+    註冊 tools 資料夾中的工具。
+    lazy 為 True 時，manifest 與原始碼相符的模組只讀取 manifest，第一次呼叫才匯入；
+    其餘模組照常匯入並補寫 manifest，下次啟動即可延遲載入。
+    """
+    from .manifest import read_manifest, lazy_tools, manifest_entries
+
+    # 預設 tools 資料夾與這個檔案在同一層；benchmark 等情境可指定其他資料夾
+    if tools_dir is None:
+        tools_dir = os.path.join(os.path.dirname(__file__), "tools")
 
     # 確保 tools 可以被 Python 匯入
     if tools_dir not in sys.path:
@@ -60,12 +110,28 @@ def load_tools():
             continue
 
         mod_name = fname[:-3]  # 移除 .py
-        module = importlib.import_module(mod_name)  # 因為 tools/ 已加到 sys.path，所以直接用模組名
+        path = os.path.join(tools_dir, fname)
+        manifest = read_manifest(path) if lazy else None
+        if manifest is not None:
+            tools = lazy_tools(manifest)
+        else:
+            module = importlib.import_module(mod_name)  # 因為 tools/ 已加到 sys.path，所以直接用模組名
+            tools = collect_tools(module)
+            if lazy:
+                tools = manifest_entries(mod_name, module, path, tools)
+
+        TOOL_FUNCTIONS.update(tools)
+        MODULE_TOOLS[mod_name] = set(tools)
+    bump_registry_version()
 
-        for attr in dir(module):
-            obj = getattr(module, attr)
-            if callable(obj) and getattr(obj, "_is_tool", False):
-                TOOL_FUNCTIONS[obj._tool_name] = obj
+def collect_tools(module) -> dict:
+    """模組中標記為 _is_tool 的函式，以工具名稱為 key"""
+    tools = {}
+    for attr in dir(module):
+        obj = getattr(module, attr)
+        if callable(obj) and getattr(obj, "_is_tool", False):
+            tools[obj._tool_name] = obj
+    return tools
 
 # 載入時立即註冊工具
 load_tools()
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MISSING = object()
+
+
+def _normalize(value):
+    """預設的參數正規化：字串去除前後空白，dict 依 key 排序"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def make_tool_key(tool_name: str, args: Dict, key_func: Optional[Callable] = None) -> str:
+    normalized = key_func(args) if key_func else _normalize(args)
+    raw = json.dumps([tool_name, normalized], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """
+    跨使用者、跨對話共享的工具結果快取。
+
+    每個工具各自一個 LRU（容量由 register_tool 的 cache_max_entries 決定），
+    disk_dir 有設定時，可 JSON 序列化的結果也會寫到磁碟，重啟後仍可命中。
+    """
+
+    def __init__(self, disk_dir: Optional[str] = None):
+        self.disk_dir = disk_dir
+        self._entries: Dict[str, "OrderedDict[str, Tuple[float, Any]]"] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _tool_stats(self, tool_name: str) -> Dict[str, int]:
+        stats = self._stats.get(tool_name)
+        if stats is None:
+            stats = self._stats[tool_name] = {"hits": 0, "misses": 0, "evictions": 0}
+        return stats
+
+    def _disk_path(self, tool_name: str, key: str) -> str:
+        return os.path.join(self.disk_dir, tool_name, f"{key}.json")
+
+    def _load_disk(self, tool_name: str, key: str):
+        if not self.disk_dir:
+            return MISSING
+        try:
+            with open(self._disk_path(tool_name, key), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return MISSING
+        if data["expires_at"] < time.time():
+            return MISSING
+        return data["expires_at"], data["value"]
+
+    def _write_disk(self, tool_name: str, key: str, expires_at: float, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(tool_name, key)
+        try:
+            payload = json.dumps({"expires_at": expires_at, "value": value}, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # 無法序列化的結果只留在記憶體
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def get(self, tool_name: str, key: str):
+        """命中時回傳快取結果，否則回傳 MISSING"""
+        with self._lock:
+            stats = self._tool_stats(tool_name)
+            entries = self._entries.get(tool_name)
+            entry = entries.get(key) if entries is not None else None
+            if entry is not None:
+                if entry[0] >= time.time():
+                    entries.move_to_end(key)
+                    stats["hits"] += 1
+                    return entry[1]
+                del entries[key]
+
+        entry = self._load_disk(tool_name, key)
+        with self._lock:
+            if entry is MISSING:
+                stats["misses"] += 1
+                return MISSING
+            stats["hits"] += 1
+            self._entries.setdefault(tool_name, OrderedDict())[key] = entry
+            return entry[1]
+
+    def put(self, tool_name: str, key: str, value, ttl: float, max_entries: int):
+        expires_at = time.time() + ttl
+        with self._lock:
+            entries = self._entries.setdefault(tool_name, OrderedDict())
+            entries[key] = (expires_at, value)
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+                self._tool_stats(tool_name)["evictions"] += 1
+        self._write_disk(tool_name, key, expires_at, value)
+
+    def clear(self, tool_name: str):
+        """工具被改寫或刪除時清除其快取"""
+        with self._lock:
+            self._entries.pop(tool_name, None)
+        if self.disk_dir:
+            shutil.rmtree(os.path.join(self.disk_dir, tool_name), ignore_errors=True)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            result = {}
+            for tool_name, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                result[tool_name] = dict(stats,
+                                         entries=len(self._entries.get(tool_name, ())),
+                                         hit_rate=stats["hits"] / lookups if lookups else 0.0)
+            return result
+
+
+# 全域共用的工具結果快取；設定 TOOL_CACHE_DIR 啟用磁碟後端
+tool_cache = ToolResultCache(disk_dir=os.getenv("TOOL_CACHE_DIR"))
@@ -0,0 +1,146 @@
+import json
+import time
+import asyncio
+import inspect
+import weakref
+import functools
+from typing import Dict, List, Optional
+from . import TOOL_FUNCTIONS
+from .cache import tool_cache, make_tool_key, MISSING
+from .sandbox import sandbox_pool
+from .results import ResultPolicies
+from LLM.errors import ToolTimeoutError, ToolResourceError
+from utils.metrics import TOOL_CALL_SECONDS, TOOL_IN_FLIGHT, current_agent
+
+# 每個 event loop 各自一組工具 semaphore（asyncio.Semaphore 不可跨 loop 共用）
+_TOOL_SEMAPHORES = weakref.WeakKeyDictionary()
+
+def _tool_semaphore(fname: str, func) -> Optional[asyncio.Semaphore]:
+    limit = getattr(func, "_tool_concurrency", None)
+    if not limit:
+        return None
+    per_loop = _TOOL_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    sem = per_loop.get(fname)
+    if sem is None:
+        sem = per_loop[fname] = asyncio.Semaphore(limit)
+    return sem
+
+def forget_tool(fname: str):
+    """工具重新載入後丟棄其 semaphore，下一次呼叫依新的 concurrency 設定重建"""
+    for per_loop in list(_TOOL_SEMAPHORES.values()):
+        per_loop.pop(fname, None)
+
+def _is_async(func) -> bool:
+    # register_tool 與 manifest（LazyTool）會記錄 _tool_async；未經 register_tool 的函式才需檢查
+    is_async = getattr(func, "_tool_async", None)
+    return inspect.iscoroutinefunction(func) if is_async is None else is_async
+
+async def call_tool(fname: str, arguments: str):
+    """執行單一工具；同步工具丟到 thread 執行，避免阻塞 event loop"""
+    args = json.loads(arguments)
+    func = TOOL_FUNCTIONS.get(fname)
+    if not func:
+        return f"[No implementation for {fname}]"
+
+    cache = getattr(func, "_tool_cache", None)
+    if cache:
+        key = make_tool_key(fname, args, cache["key"])
+        cached = tool_cache.get(fname, key)
+        if cached is not MISSING:
+            TOOL_CALL_SECONDS.observe(0.0, agent=current_agent.get(), tool=fname, status="cached")
+            return cached
+
+    # isolated 工具（使用者上傳的程式碼）交給 sandbox worker process 執行；
+    # async def 工具直接在 event loop 上 await，其餘同步工具丟到 thread 執行
+    if getattr(func, "_tool_isolated", False) and sandbox_pool.enabled:
+        run = functools.partial(sandbox_pool.acall, fname, func, args)
+    elif _is_async(func):
+        run = functools.partial(func, **args)
+    else:
+        run = functools.partial(asyncio.to_thread, func, **args)
+
+    sem = _tool_semaphore(fname, func)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with TOOL_IN_FLIGHT.track(tool=fname):
+            if sem is None:
+                result = await run()
+            else:
+                async with sem:
+                    result = await run()
+        status = "ok"
+    except (ToolTimeoutError, ToolResourceError) as e:
+        # 逾時或超出資源上限時以結構化錯誤作為工具結果，讓模型自行決定改用其他方式
+        status = "timeout" if isinstance(e, ToolTimeoutError) else "limit"
+        return json.dumps({"error": e.to_dict()}, ensure_ascii=False)
+    finally:
+        TOOL_CALL_SECONDS.observe(time.perf_counter() - start, agent=current_agent.get(), tool=fname, status=status)
+
+    if cache:
+        tool_cache.put(fname, key, result, cache["ttl"], cache["max_entries"])
+    return result
+
+class ToolBatch:
+    """
+    同一輪 tool_calls 的執行批次：每個呼叫提交後立即開始執行，
+    最後依提交順序（即 tool_calls 順序）組回 tool 訊息。
+
+    max_concurrency: 本輪同時執行的工具上限（由 agent 設定），None 表示不限制。
+    result_policies: 工具結果政策（見 Tool.results），None 表示結果原樣送回。
+    stats: 呼叫端的統計 dict，結果政策的截斷統計寫入其中的 tool_results。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 result_policies: Optional[ResultPolicies] = None,
+                 stats: Optional[Dict] = None):
+        self._sem = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._policies = result_policies
+        self._stats = stats
+        self._tasks = []
+
+    async def _run(self, fname: str, arguments: str):
+        if self._sem is None:
+            return await call_tool(fname, arguments)
+        async with self._sem:
+            return await call_tool(fname, arguments)
+
+    def submit(self, call_id: str, fname: str, arguments: str):
+        task = asyncio.ensure_future(self._run(fname, arguments))
+        self._tasks.append((call_id, fname, task))
+
+    def skip(self, call_id: str, content: str):
+        """不執行此呼叫，直接以 content 作為結果（例如預算耗盡）"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(content)
+        self._tasks.append((call_id, None, future))
+
+    def cancel(self):
+        for _, _, task in self._tasks:
+            task.cancel()
+
+    async def results(self, timeout: Optional[float] = None) -> List[Dict]:
+        """timeout 秒內未完成時取消所有工具並拋出 asyncio.TimeoutError"""
+        gathered = asyncio.gather(*(task for _, _, task in self._tasks), return_exceptions=True)
+        try:
+            results = await asyncio.wait_for(gathered, timeout)
+        except asyncio.TimeoutError:
+            self.cancel()
+            raise
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return [
+            {
+                "role": "tool",
+                "tool_call_id": call_id,
+                "content": self._content(fname, result)
+            }
+            for (call_id, fname, _), result in zip(self._tasks, results)
+        ]
+
+    def _content(self, fname: Optional[str], result) -> str:
+        if self._policies is None or fname is None:
+            return str(result)
+        return self._policies.apply(fname, result, self._stats)
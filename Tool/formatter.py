@@ -1,6 +1,12 @@
+import os
+import json
 import inspect
 import typing
-from typing import Callable, List, Union, get_origin, get_args
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union, get_origin, get_args
+from . import TOOL_FUNCTIONS
 from .register import get_registered_tools
 
 def _python_type_to_json_type(py_type):
@@ -17,44 +23,126 @@ def _python_type_to_json_type(py_type):
         return "string", list(get_args(py_type))  # enum
     return mapping.get(py_type, "string"), None
 
+def compile_tool_schema(func: Callable) -> dict:
+    """由函式簽名產生單一工具的 OpenAI tool schema"""
+    sig = inspect.signature(func)
+    properties = {}
+    required = []
+
+    for param in sig.parameters.values():
+        annotation = param.annotation if param.annotation != param.empty else str
+        json_type, enum_values = _python_type_to_json_type(annotation)
+
+        prop = {"type": json_type}
+        if enum_values:
+            prop["enum"] = enum_values
+        prop["description"] = f"{param.name} 參數"
+
+        properties[param.name] = prop
+
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": func.__name__,
+            "description": func.__doc__ or "",
+            "parameters": {
+                "type": "object",
+                "properties": properties,
+                "required": required
+            }
+        }
+    }
+
 def generate_tool_schema(funcs: Union[Callable, List[Callable]]):
     if not isinstance(funcs, (list, tuple)):
         funcs = [funcs]
+    return [compile_tool_schema(func) for func in funcs]
 
-    result = []
-    for func in funcs:
-        sig = inspect.signature(func)
-        properties = {}
-        required = []
-
-        for param in sig.parameters.values():
-            annotation = param.annotation if param.annotation != param.empty else str
-            json_type, enum_values = _python_type_to_json_type(annotation)
-
-            prop = {"type": json_type}
-            if enum_values:
-                prop["enum"] = enum_values
-            prop["description"] = f"{param.name} 參數"
-
-            properties[param.name] = prop
-
-            if param.default is inspect.Parameter.empty:
-                required.append(param.name)
-
-        result.append({
-            "type": "function",
-            "function": {
-                "name": func.__name__,
-                "description": func.__doc__ or "",
-                "parameters": {
-                    "type": "object",
-                    "properties": properties,
-                    "required": required
-                }
-            }
-        })
 
-    return result
+class ToolBundle:
+    """
+    一組工具（通常是一個 agent 的工具列表）預先編譯好的 schema。
+
+    schemas: 傳給 LLM 的 tool schema 列表；多個請求共用，呼叫端不可修改。
+    digest: schemas 正規化序列化（鍵排序）後的雜湊，可直接用於快取 key。
+    """
+
+    def __init__(self, names: Tuple[str, ...], schemas: List[dict]):
+        self.names = names
+        self.schemas = schemas
+        serialized = json.dumps(schemas, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        self.digest = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+# name -> (工具函式, schema)；函式物件改變（重新載入）時視為失效
+_SCHEMA_CACHE: Dict[str, Tuple[Callable, dict]] = {}
+# 工具名稱組合 -> ToolBundle（LRU，最多 _MAX_BUNDLES 個）；_BUNDLES_BY_TOOL 為反向索引，供單一工具失效時找出受影響的組合
+_BUNDLES: "OrderedDict[Tuple[str, ...], ToolBundle]" = OrderedDict()
+_BUNDLES_BY_TOOL: Dict[str, Set[Tuple[str, ...]]] = {}
+_MAX_BUNDLES = int(os.getenv("TOOL_BUNDLE_CACHE_SIZE", "1024"))
+_lock = threading.Lock()
+
+
+def get_tool_schema(name: str) -> Optional[dict]:
+    """取得已編譯的工具 schema；工具不存在時回傳 None"""
+    func = TOOL_FUNCTIONS.get(name)
+    if func is None:
+        return None
+    entry = _SCHEMA_CACHE.get(name)
+    if entry is not None and entry[0] is func:
+        return entry[1]
+    # 延遲載入的工具（Tool.manifest.LazyTool）直接使用 manifest 中的 schema，不需匯入模組
+    schema = getattr(func, "_tool_schema", None) or compile_tool_schema(func)
+    _SCHEMA_CACHE[name] = (func, schema)
+    return schema
+
+
+def get_tool_bundle(names: Iterable[str], cache: bool = True) -> ToolBundle:
+    """
+    將工具名稱列表解析為 ToolBundle；相同的名稱組合（不論順序與重複）共用同一個 bundle。
+    不存在的工具會被略過，工具依名稱排序，讓 prompt 前綴保持穩定。
+
+    cache: 是否保留 bundle 供之後的請求共用；每次請求組合都不同時（例如工具檢索）應設為 False。
+    """
+    key = tuple(sorted(set(names)))
+    with _lock:
+        bundle = _BUNDLES.get(key)
+        if bundle is not None:
+            _BUNDLES.move_to_end(key)
+            return bundle
+    schemas = [schema for schema in (get_tool_schema(name) for name in key) if schema is not None]
+    bundle = ToolBundle(key, schemas)
+    if not cache:
+        return bundle
+    with _lock:
+        _BUNDLES[key] = bundle
+        for name in key:
+            _BUNDLES_BY_TOOL.setdefault(name, set()).add(key)
+        while len(_BUNDLES) > _MAX_BUNDLES:
+            _drop_bundle(next(iter(_BUNDLES)))
+    return bundle
+
+
+def _drop_bundle(key: Tuple[str, ...]):
+    _BUNDLES.pop(key, None)
+    for name in key:
+        keys = _BUNDLES_BY_TOOL.get(name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _BUNDLES_BY_TOOL[name]
+
+
+def invalidate_tool_schema(name: str):
+    """工具模組被改寫或刪除時呼叫：移除該工具的 schema 與所有包含它的 bundle"""
+    with _lock:
+        _SCHEMA_CACHE.pop(name, None)
+        for key in _BUNDLES_BY_TOOL.pop(name, ()):
+            _BUNDLES.pop(key, None)
+
 
 def generate_tools():
     tools = get_registered_tools().values()
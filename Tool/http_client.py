@@ -0,0 +1,80 @@
+"""
+API 工具共用的非同步 HTTP client。
+
+write_tool_file 產生的 api 工具為 async def，透過 get_json 共用同一個 httpx.AsyncClient
+（keep-alive 連線池；有安裝 h2 時啟用 HTTP/2），避免每次呼叫重新建立連線與 TLS 握手。
+"""
+import os
+import json
+import asyncio
+import weakref
+import importlib.util
+from typing import Dict, Optional
+
+import httpx
+
+from LLM.errors import ToolTimeoutError, ToolResourceError
+
+DEFAULT_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "10"))
+DEFAULT_MAX_BYTES = int(os.getenv("TOOL_HTTP_MAX_BYTES", str(1024 * 1024)))
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ToolHttpClient:
+    """
+    每個 event loop 各自一個 httpx.AsyncClient（client 綁定建立時的 loop，不可跨 loop 共用）。
+
+    max_connections: 連線池上限；max_keepalive: 保留的閒置連線數；keepalive_expiry: 閒置連線保留秒數。
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 60.0, http2: Optional[bool] = None):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self._clients = weakref.WeakKeyDictionary()
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = httpx.AsyncClient(
+                limits=self.limits, http2=self.http2, timeout=DEFAULT_TIMEOUT, follow_redirects=True)
+        return client
+
+    async def aclose(self):
+        """關閉目前 event loop 的 client（服務關閉時呼叫）"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+tool_http = ToolHttpClient()
+
+
+async def get_json(url: str, params: Optional[Dict] = None,
+                   timeout: Optional[float] = None, max_bytes: Optional[int] = None):
+    """
+    GET url 並解析 JSON 回應。
+
+    timeout: 連線、讀取等各階段的秒數上限，超過時拋出 ToolTimeoutError。
+    max_bytes: 回應大小上限，超過時中斷讀取並拋出 ToolResourceError。
+    非 2xx 回應照常拋出 httpx.HTTPStatusError。
+    """
+    timeout = timeout or DEFAULT_TIMEOUT
+    max_bytes = max_bytes or DEFAULT_MAX_BYTES
+    try:
+        async with tool_http.client().stream("GET", url, params=params, timeout=timeout) as response:
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ToolResourceError(f"response from {url} is {declared} bytes, limit is {max_bytes}")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > max_bytes:
+                    raise ToolResourceError(f"response from {url} exceeded {max_bytes} bytes")
+    except httpx.TimeoutException as e:
+        raise ToolTimeoutError(f"request to {url} timed out after {timeout:g}s ({type(e).__name__})") from e
+    return json.loads(bytes(body))
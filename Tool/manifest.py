@@ -0,0 +1,238 @@
+"""
+工具 manifest 與延遲載入。
+
+每個工具模組旁有一份 <模組>.tool.json，記錄模組內各工具的名稱、簽名、schema、register_tool 參數
+與原始碼的雜湊、mtime 與大小。啟動時若 manifest 與原始碼相符（mtime 與大小相同時不必讀取原始碼，
+不同時才比對雜湊），只讀取 manifest 並註冊 LazyTool，
+模組在工具第一次被呼叫時才匯入；已匯入的模組以 LRU 管理，超過上限時卸載最久未使用的模組。
+"""
+import os
+import sys
+import json
+import hashlib
+import inspect
+import importlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.metrics import registry
+
+MANIFEST_SUFFIX = ".tool.json"
+MANIFEST_VERSION = 1
+
+TOOL_MODULE_IMPORTS = registry.counter(
+    "tool_module_imports_total", "Tool modules imported on first call or after eviction")
+TOOL_MODULE_EVICTIONS = registry.counter(
+    "tool_module_evictions_total", "Tool modules unloaded by the LRU")
+TOOL_MODULES_LOADED = registry.gauge(
+    "tool_modules_loaded", "Lazily loaded tool modules currently imported")
+
+
+def manifest_path(source_path: str) -> str:
+    return source_path[:-3] + MANIFEST_SUFFIX
+
+
+def source_hash(source_path: str) -> str:
+    with open(source_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_stat(source_path: str) -> Dict[str, int]:
+    st = os.stat(source_path)
+    return {"source_mtime_ns": st.st_mtime_ns, "source_size": st.st_size}
+
+
+def build_manifest(mod_name: str, source_path: str, tools: Dict[str, Callable]) -> Optional[dict]:
+    """
+    由已匯入模組的工具建立 manifest。
+    自訂 cache_key 等無法序列化的設定無法延遲載入，回傳 None，此模組維持啟動時匯入。
+    """
+    from .formatter import compile_tool_schema
+
+    entries = []
+    for name, func in tools.items():
+        cache = getattr(func, "_tool_cache", None)
+        if cache and cache.get("key") is not None:
+            return None
+        entries.append({
+            "name": name,
+            "attr": func.__name__,
+            "signature": str(inspect.signature(func)),
+            "schema": compile_tool_schema(func),
+            "concurrency": getattr(func, "_tool_concurrency", None),
+            "isolated": getattr(func, "_tool_isolated", False),
+            "timeout": getattr(func, "_tool_timeout", None),
+            "is_async": inspect.iscoroutinefunction(func),
+            "result_policy": getattr(func, "_tool_result_policy", None),
+            "cache": {"ttl": cache["ttl"], "max_entries": cache["max_entries"]} if cache else None,
+        })
+    # 先取 stat 再計算雜湊：兩者之間檔案被修改時，下次啟動會因 stat 不符而重新比對雜湊
+    stat = source_stat(source_path)
+    return {"version": MANIFEST_VERSION, "module": mod_name,
+            "source_hash": source_hash(source_path), **stat, "tools": entries}
+
+
+def write_manifest(source_path: str, manifest: Optional[dict]):
+    """寫入 manifest；manifest 為 None 時刪除舊檔。先寫暫存檔再取代，避免讀到寫一半的內容"""
+    path = manifest_path(source_path)
+    if manifest is None:
+        remove_manifest(source_path)
+        return
+    # sandbox worker 啟動時也會執行 load_tools，暫存檔名加上 pid 避免互相覆寫
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def remove_manifest(source_path: str):
+    try:
+        os.remove(manifest_path(source_path))
+    except FileNotFoundError:
+        pass
+
+
+def read_manifest(source_path: str) -> Optional[dict]:
+    """
+    讀取與原始碼相符的 manifest；不存在、格式不符或原始碼已變更時回傳 None。
+    mtime 與大小都相同時視為未變更；不同時（例如 git checkout 更新了 mtime）才比對雜湊，
+    內容未變則更新 manifest 中的 mtime 與大小，下次啟動不必再計算雜湊。
+    """
+    try:
+        with open(manifest_path(source_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        stat = source_stat(source_path)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    if all(manifest.get(k) == v for k, v in stat.items()):
+        return manifest
+    try:
+        if manifest.get("source_hash") != source_hash(source_path):
+            return None
+    except OSError:
+        return None
+    manifest.update(stat)
+    try:
+        write_manifest(source_path, manifest)
+    except OSError:
+        pass
+    return manifest
+
+
+class ModuleCache:
+    """
+    延遲載入的工具模組 LRU。
+
+    max_modules: 同時保留的模組數上限；超過時自 sys.modules 卸載最久未使用的模組，
+    下次呼叫其工具時重新匯入。
+    """
+
+    def __init__(self, max_modules: int = 256):
+        self.max_modules = max_modules
+        self._modules: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.imports = 0
+        self.evictions = 0
+
+    def get(self, mod_name: str):
+        with self._lock:
+            module = self._modules.get(mod_name)
+            if module is not None:
+                self._modules.move_to_end(mod_name)
+                self.hits += 1
+                return module
+            module = sys.modules.get(mod_name) or importlib.import_module(mod_name)
+            self.imports += 1
+            TOOL_MODULE_IMPORTS.inc()
+            self._put(mod_name, module)
+            return module
+
+    def put(self, mod_name: str, module):
+        """放入剛由其他途徑（例如重新載入）匯入的模組"""
+        with self._lock:
+            self._put(mod_name, module)
+
+    def _put(self, mod_name: str, module):
+        self._modules[mod_name] = module
+        self._modules.move_to_end(mod_name)
+        while len(self._modules) > self.max_modules:
+            evicted, _ = self._modules.popitem(last=False)
+            sys.modules.pop(evicted, None)
+            self.evictions += 1
+            TOOL_MODULE_EVICTIONS.inc()
+        TOOL_MODULES_LOADED.set(len(self._modules))
+
+    def discard(self, mod_name: str):
+        with self._lock:
+            self._modules.pop(mod_name, None)
+            TOOL_MODULES_LOADED.set(len(self._modules))
+
+    def stats(self) -> Dict:
+        return {"loaded": len(self._modules), "max_modules": self.max_modules,
+                "hits": self.hits, "imports": self.imports, "evictions": self.evictions}
+
+
+module_cache = ModuleCache(max_modules=int(os.getenv("TOOL_MODULE_CACHE_SIZE", "256")))
+
+
+class LazyTool:
+    """
+    TOOL_FUNCTIONS 中代表尚未（或已被卸載而不再）匯入的工具。
+    register_tool 的屬性與 schema 來自 manifest，呼叫時才透過 module_cache 取得實際函式。
+    """
+
+    _is_tool = True
+
+    def __init__(self, mod_name: str, entry: dict):
+        self._module_name = mod_name
+        self._attr = entry.get("attr", entry["name"])
+        self._tool_name = entry["name"]
+        self._tool_schema = entry["schema"]
+        self._tool_signature = entry.get("signature")
+        self._tool_concurrency = entry.get("concurrency")
+        self._tool_isolated = entry.get("isolated", False)
+        self._tool_timeout = entry.get("timeout")
+        self._tool_async = entry.get("is_async", False)
+        self._tool_result_policy = entry.get("result_policy")
+        cache = entry.get("cache")
+        self._tool_cache = dict(cache, key=None) if cache else None
+        self.__name__ = entry["schema"]["function"]["name"]
+        self.__doc__ = entry["schema"]["function"]["description"]
+
+    def resolve(self) -> Callable:
+        return getattr(module_cache.get(self._module_name), self._attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyTool {self._tool_name} from {self._module_name}>"
+
+
+def tool_location(func) -> Tuple[str, str]:
+    """工具所在的 (模組名稱, 屬性名稱)，供 sandbox worker 自行匯入"""
+    if isinstance(func, LazyTool):
+        return func._module_name, func._attr
+    return func.__module__, func.__name__
+
+
+def lazy_tools(manifest: dict) -> Dict[str, LazyTool]:
+    return {entry["name"]: LazyTool(manifest["module"], entry) for entry in manifest["tools"]}
+
+
+def manifest_entries(mod_name: str, module, source_path: str, tools: Dict[str, Callable]) -> Dict[str, Callable]:
+    """
+    為剛匯入的模組寫入 manifest，並回傳要放入 TOOL_FUNCTIONS 的項目：
+    可延遲載入時為 LazyTool（模組放入 LRU），否則為原本的函式。
+    """
+    manifest = build_manifest(mod_name, source_path, tools)
+    write_manifest(source_path, manifest)
+    if manifest is None:
+        module_cache.discard(mod_name)
+        return tools
+    module_cache.put(mod_name, module)
+    return lazy_tools(manifest)
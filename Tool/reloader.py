@@ -0,0 +1,184 @@
+"""
+工具模組的增量重新載入。
+
+POST /tool、PUT /tool/{name}、POST /agent 與 DELETE 端點寫入或刪除工具檔後呼叫 reload_tool_module，
+只匯入、重新載入或卸載該模組；ToolWatcher 則輪詢 tools 資料夾，處理直接在磁碟上修改的檔案。
+
+註冊表以逐一 key 的方式更新（新的函式先寫入，再移除模組已不再提供的名稱），
+TOOL_FUNCTIONS 本身不會被替換，進行中的對話不受影響：已開始執行的工具沿用舊函式，
+之後的呼叫取得新函式。
+"""
+import os
+import sys
+import logging
+import importlib
+import importlib.util
+import threading
+from typing import Dict, List, Optional, Set
+
+from . import TOOL_FUNCTIONS, MODULE_TOOLS, collect_tools, bump_registry_version
+from .cache import tool_cache
+from .executor import forget_tool
+from .formatter import invalidate_tool_schema
+from .manifest import manifest_entries, remove_manifest, module_cache
+
+logger = logging.getLogger(__name__)
+
+TOOLS_DIR = os.path.join(os.path.dirname(__file__), "tools")
+
+# 同一時間只允許一個重新載入，避免端點與 watcher 同時處理同一模組
+_lock = threading.RLock()
+# 模組名稱 -> 最近一次載入時的 (mtime_ns, size)，watcher 據此判斷檔案是否有變更
+_loaded_versions: Dict[str, tuple] = {}
+
+
+def _file_version(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _import_fresh(mod_name: str, path: str):
+    """
+    匯入或重新載入模組。先刪除 __pycache__ 中的 .pyc：同一秒內改寫且長度相同的檔案，
+    其 mtime（秒）與大小皆與舊 .pyc 相符，會被誤用為快取。
+    """
+    try:
+        os.remove(importlib.util.cache_from_source(path))
+    except OSError:
+        pass
+    importlib.invalidate_caches()
+    module = sys.modules.get(mod_name)
+    if module is not None and os.path.abspath(getattr(module, "__file__", "") or "") == os.path.abspath(path):
+        return importlib.reload(module)
+    sys.modules.pop(mod_name, None)
+    return importlib.import_module(mod_name)
+
+
+def _apply(mod_name: str, tools: Dict[str, object]) -> Set[str]:
+    """以模組的新工具集合更新註冊表，回傳有變動的工具名稱"""
+    previous = MODULE_TOOLS.get(mod_name, set())
+    removed = previous - set(tools)
+    TOOL_FUNCTIONS.update(tools)
+    for name in removed:
+        TOOL_FUNCTIONS.pop(name, None)
+    if tools:
+        MODULE_TOOLS[mod_name] = set(tools)
+    else:
+        MODULE_TOOLS.pop(mod_name, None)
+
+    changed = set(tools) | removed
+    bump_registry_version()
+    for name in changed:
+        tool_cache.clear(name)
+        invalidate_tool_schema(name)
+        forget_tool(name)
+    return changed
+
+
+def reload_tool_module(mod_name: str, tools_dir: str = None) -> Set[str]:
+    """
+    依磁碟上的現況同步單一工具模組：檔案存在則匯入或重新載入，不存在則卸載。
+    成本只與這個模組有關，與工具總數無關。回傳有變動的工具名稱。
+
+    匯入失敗（例如語法錯誤）時保留原有的工具並拋出例外。
+    """
+    tools_dir = tools_dir or TOOLS_DIR
+    path = os.path.join(tools_dir, f"{mod_name}.py")
+    with _lock:
+        version = _file_version(path)
+        if version is None:
+            return unload_tool_module(mod_name, tools_dir)
+        if tools_dir not in sys.path:
+            sys.path.insert(0, tools_dir)
+        try:
+            module = _import_fresh(mod_name, path)
+        finally:
+            # 即使失敗也記錄版本，watcher 不會對同一份壞檔反覆重試
+            _loaded_versions[mod_name] = version
+        changed = _apply(mod_name, manifest_entries(mod_name, module, path, collect_tools(module)))
+    logger.info("reloaded tool module %s: %s", mod_name, sorted(changed))
+    return changed
+
+
+def unload_tool_module(mod_name: str, tools_dir: str = None) -> Set[str]:
+    """移除模組註冊的所有工具並自 sys.modules 卸載"""
+    with _lock:
+        changed = _apply(mod_name, {})
+        sys.modules.pop(mod_name, None)
+        module_cache.discard(mod_name)
+        remove_manifest(os.path.join(tools_dir or TOOLS_DIR, f"{mod_name}.py"))
+        _loaded_versions.pop(mod_name, None)
+    if changed:
+        logger.info("unloaded tool module %s: %s", mod_name, sorted(changed))
+    return changed
+
+
+def scan_tools_dir(tools_dir: str = None) -> List[str]:
+    """
+    比對資料夾中每個檔案的 (mtime, size) 與上次載入時的版本，只重新載入有變動的模組，
+    並卸載檔案已被刪除的模組。回傳處理過的模組名稱。
+    """
+    tools_dir = tools_dir or TOOLS_DIR
+    current = {}
+    with os.scandir(tools_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".py") and entry.name != "__init__.py" and entry.is_file():
+                stat = entry.stat()
+                current[entry.name[:-3]] = (stat.st_mtime_ns, stat.st_size)
+
+    handled = []
+    for mod_name, version in current.items():
+        if _loaded_versions.get(mod_name) != version:
+            try:
+                reload_tool_module(mod_name, tools_dir)
+            except Exception:
+                logger.exception("failed to reload tool module %s", mod_name)
+            handled.append(mod_name)
+    for mod_name in set(MODULE_TOOLS) - set(current):
+        unload_tool_module(mod_name, tools_dir)
+        handled.append(mod_name)
+    return handled
+
+
+def snapshot_versions(tools_dir: str = None):
+    """記錄目前已載入模組的檔案版本（啟動時由 load_tools 載入的模組）"""
+    tools_dir = tools_dir or TOOLS_DIR
+    with _lock:
+        for mod_name in MODULE_TOOLS:
+            version = _file_version(os.path.join(tools_dir, f"{mod_name}.py"))
+            if version is not None:
+                _loaded_versions.setdefault(mod_name, version)
+
+
+class ToolWatcher:
+    """
+    以背景執行緒每 interval 秒輪詢 tools 資料夾。每次輪詢只做一次 scandir 與 stat，
+    重新載入的成本只與變動的模組數量有關。
+    """
+
+    def __init__(self, tools_dir: str = None, interval: float = 2.0):
+        self.tools_dir = tools_dir or TOOLS_DIR
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> "ToolWatcher":
+        snapshot_versions(self.tools_dir)
+        self._thread = threading.Thread(target=self._run, name="tool-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                scan_tools_dir(self.tools_dir)
+            except Exception:
+                logger.exception("tool watcher scan failed")
@@ -0,0 +1,244 @@
+"""
+工具結果政策：限制送回模型的工具結果大小，避免單一工具的大型回應讓之後每一輪的 prompt 都變長。
+
+agent 設定範例：
+    "tool_results": {
+        "default": {"max_chars": 8000},
+        "tools": {
+            "search": {"fields": ["items.title", "items.url"], "max_chars": 4000, "on_overflow": "spill"}
+        }
+    }
+
+工具也可用 register_tool(result_policy={...}) 提供預設政策；優先順序為
+agent 的 tools 設定 > register_tool 的 result_policy > agent 的 default。
+"""
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import TOOL_FUNCTIONS, register_tool
+from utils.metrics import registry, current_agent
+
+TOOL_RESULT_ACTIONS = registry.counter(
+    "tool_result_policy_total", "Tool results changed by a result policy",
+    ("tool", "action"))
+TOOL_RESULT_CHARS = registry.counter(
+    "tool_result_chars_total", "Characters of tool results before and after result policies",
+    ("tool", "stage"))
+
+PAGING_TOOL = "read_tool_result"
+
+# 結構保留截斷依序嘗試的 (列表保留項數, 字串保留字數)，越後面越精簡
+_SHRINK_STEPS = ((50, 2000), (20, 1000), (10, 500), (5, 200), (3, 100), (1, 50))
+
+
+class ResultStore:
+    """
+    超出大小上限的工具結果以分頁方式保存在伺服器端，模型透過 read_tool_result 逐頁讀取。
+    以 LRU 與 TTL 限制記憶體用量；多 process 部署時各 process 各自一份。
+    每筆結果綁定產生它的 agent（owner），其他 agent 即使取得 result_id 也無法讀取。
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # result_id -> (到期時間, owner, 各頁內容)
+        self._entries: "OrderedDict[str, Tuple[float, str, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, content: str, page_chars: int, owner: str) -> Tuple[str, int]:
+        pages = [content[i:i + page_chars] for i in range(0, len(content), page_chars)] or [""]
+        result_id = secrets.token_hex(8)
+        with self._lock:
+            self._entries[result_id] = (time.monotonic() + self.ttl, owner, pages)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result_id, len(pages)
+
+    def page(self, result_id: str, page: int, owner: str) -> Optional[Tuple[str, int]]:
+        """回傳 (第 page 頁內容, 總頁數)；不存在、已過期或不屬於 owner 時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(result_id, None)
+                return None
+            if entry[1] != owner:
+                return None
+            self._entries.move_to_end(result_id)
+        pages = entry[2]
+        if not 1 <= page <= len(pages):
+            return "", len(pages)
+        return pages[page - 1], len(pages)
+
+
+result_store = ResultStore()
+
+
+@register_tool(name=PAGING_TOOL, builtin=True)
+async def read_tool_result(result_id: str, page: int = 2) -> str:
+    """讀取先前因內容過長而分頁保存的工具結果；result_id 與總頁數見原本的工具結果"""
+    found = result_store.page(result_id, page, current_agent.get())
+    if found is None:
+        return json.dumps({"error": f"result {result_id} not found or expired"}, ensure_ascii=False)
+    content, pages = found
+    return json.dumps({"result_id": result_id, "page": page, "pages": pages, "content": content},
+                      ensure_ascii=False)
+
+
+def _field_tree(fields: List[str]) -> Dict:
+    tree = {}
+    for path in fields:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _project(value: Any, tree: Dict) -> Any:
+    """只保留 tree 中列出的欄位；列表會逐項套用，未列出子欄位的欄位整個保留"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def _shrink(value: Any, max_items: int, max_string: int) -> Any:
+    """保留結構的截斷：列表只留前 max_items 項，字串只留前 max_string 字，並標註省略的數量"""
+    if isinstance(value, list):
+        items = [_shrink(item, max_items, max_string) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"…{len(value) - max_items} more items")
+        return items
+    if isinstance(value, dict):
+        return {key: _shrink(item, max_items, max_string) for key, item in value.items()}
+    if isinstance(value, str) and len(value) > max_string:
+        return f"{value[:max_string]}…(+{len(value) - max_string} chars)"
+    return value
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class ResultPolicy:
+    """
+    max_chars: 送回模型的字數上限，None 表示不限制。
+    fields: 只保留的 JSON 欄位路徑（以 . 分隔，列表會逐項套用），例如 ["items.title", "total"]。
+    on_overflow: 超過 max_chars 時的處理方式，"truncate"（保留結構截斷）或 "spill"（分頁保存於伺服器端）。
+    page_chars: spill 時每頁的字數，預設與 max_chars 相同。
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, fields: Optional[List[str]] = None,
+                 on_overflow: str = "truncate", page_chars: Optional[int] = None):
+        self.max_chars = max_chars
+        self.fields = _field_tree(fields) if fields else None
+        self.on_overflow = on_overflow
+        self.page_chars = page_chars or max_chars
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict]) -> Optional["ResultPolicy"]:
+        if not cfg:
+            return None
+        return cls(max_chars=cfg.get("max_chars"), fields=cfg.get("fields"),
+                   on_overflow=cfg.get("on_overflow", "truncate"), page_chars=cfg.get("page_chars"))
+
+    def apply(self, result: Any) -> Tuple[str, List[str]]:
+        """回傳 (送回模型的內容, 套用的動作)"""
+        actions = []
+        value = result
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        structured = isinstance(value, (dict, list))
+
+        if self.fields and structured:
+            value = _project(value, self.fields)
+            actions.append("projected")
+        content = _dumps(value) if structured else str(result)
+        if not self.max_chars or len(content) <= self.max_chars:
+            return content, actions
+
+        if self.on_overflow == "spill":
+            # 以目前請求的 agent（utils.metrics.current_agent）作為 owner，read_tool_result 以同一個值檢查
+            result_id, pages = result_store.put(content, self.page_chars, current_agent.get())
+            first = content[:self.page_chars]
+            actions.append("spilled")
+            return _dumps({
+                "result_id": result_id, "page": 1, "pages": pages, "content": first,
+                "note": f"Result too long ({len(content)} chars); call {PAGING_TOOL} with result_id and page to read more.",
+            }), actions
+
+        actions.append("truncated")
+        if structured:
+            for max_items, max_string in _SHRINK_STEPS:
+                shrunk = _dumps(_shrink(value, max_items, max_string))
+                if len(shrunk) <= self.max_chars:
+                    return shrunk, actions
+        return f"{content[:self.max_chars]}…[truncated {len(content) - self.max_chars} chars]", actions
+
+
+class ResultPolicies:
+    """一個 agent 的工具結果政策，依工具名稱查詢"""
+
+    def __init__(self, default: Optional[ResultPolicy] = None,
+                 tools: Optional[Dict[str, Optional[ResultPolicy]]] = None):
+        self.default = default
+        self.tools = tools or {}
+
+    def for_tool(self, name: str) -> Optional[ResultPolicy]:
+        if name == PAGING_TOOL:
+            return None
+        if name in self.tools:
+            return self.tools[name]
+        func = TOOL_FUNCTIONS.get(name)
+        tool_policy = getattr(func, "_tool_result_policy", None)
+        if tool_policy:
+            return ResultPolicy.from_config(tool_policy)
+        return self.default
+
+    def needs_paging(self, names: List[str]) -> bool:
+        """任一工具的政策可能 spill 時，agent 需要 read_tool_result 工具"""
+        for name in names:
+            policy = self.for_tool(name)
+            if policy is not None and policy.on_overflow == "spill":
+                return True
+        return False
+
+    def apply(self, name: str, result: Any, stats: Optional[Dict] = None) -> str:
+        policy = self.for_tool(name)
+        if policy is None:
+            return str(result)
+        raw_chars = len(result) if isinstance(result, str) else len(_dumps(result))
+        content, actions = policy.apply(result)
+
+        TOOL_RESULT_CHARS.inc(raw_chars, tool=name, stage="raw")
+        TOOL_RESULT_CHARS.inc(len(content), tool=name, stage="sent")
+        for action in actions:
+            TOOL_RESULT_ACTIONS.inc(tool=name, action=action)
+        if stats is not None:
+            summary = stats.setdefault("tool_results", {"results": 0, "projected": 0, "truncated": 0,
+                                                        "spilled": 0, "raw_chars": 0, "sent_chars": 0})
+            summary["results"] += 1
+            summary["raw_chars"] += raw_chars
+            summary["sent_chars"] += len(content)
+            for action in actions:
+                summary[action] += 1
+        return content
+
+
+def result_policies_from_config(cfg: Dict) -> ResultPolicies:
+    """由 agent 設定的 tool_results 建立 ResultPolicies；未設定時只套用工具自帶的 result_policy"""
+    policy_cfg = cfg.get("tool_results") or {}
+    return ResultPolicies(
+        default=ResultPolicy.from_config(policy_cfg.get("default")),
+        # 工具設定為空 dict 時代表此工具不套用任何政策（包含 default）
+        tools={name: ResultPolicy.from_config(c) for name, c in (policy_cfg.get("tools") or {}).items()},
+    )
@@ -0,0 +1,183 @@
+"""
+工具檢索：工具數量很多的 agent 每次請求只送出與使用者問題最相關的 top_k 個工具與固定工具。
+
+索引以工具名稱、說明與參數名稱建立，評分方式：
+- bm25：關鍵字比對（英文以單字、中文以單字與二字詞為單位）
+- embedding：LLM.cache.embed_text 的本地 hashing embedding，餘弦相似度
+- hybrid（預設）：兩者各自正規化後加權平均
+
+索引以工具 schema 物件為版本：工具新增、改寫或刪除後（schema 快取失效），
+下一次查詢時只重新索引有變動的工具。
+"""
+import re
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from LLM.cache import embed_text, np
+from .formatter import get_tool_schema
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英文與數字以單字為單位（拆開 snake_case、camelCase），中文取單字與相鄰二字"""
+    text = _CAMEL.sub(" ", text or "")
+    tokens = _WORD.findall(text.lower().replace("_", " "))
+    for run in _CJK.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def tool_document(schema: dict) -> str:
+    """用於索引的工具文字：名稱、說明、參數名稱與列舉值"""
+    function = schema["function"]
+    parts = [function["name"], function.get("description") or ""]
+    for name, prop in function.get("parameters", {}).get("properties", {}).items():
+        parts.append(name)
+        parts.extend(str(value) for value in prop.get("enum", ()))
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """
+    所有工具共用的檢索索引。
+
+    k1, b: BM25 參數；dim: embedding 維度；embedding_weight: hybrid 模式中 embedding 分數的權重。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, dim: int = 256, embedding_weight: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.dim = dim
+        self.embedding_weight = embedding_weight
+        self._lock = threading.Lock()
+        # name -> 建立索引時的 schema 物件（以 identity 判斷是否需要重新索引）
+        self._versions: Dict[str, dict] = {}
+        self._terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        # embedding 以列存放，刪除的列放回 _free 重複使用
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._vectors = np.zeros((64, dim), dtype=np.float32) if np is not None else None
+
+    def __len__(self):
+        return len(self._versions)
+
+    def _remove(self, name: str):
+        terms = self._terms.pop(name, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self._postings[term]
+            posting.pop(name, None)
+            if not posting:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(name)
+        self._free.append(self._rows.pop(name))
+        self._versions.pop(name, None)
+
+    def _add(self, name: str, schema: dict):
+        text = tool_document(schema)
+        terms = Counter(tokenize(text))
+        self._terms[name] = terms
+        self._lengths[name] = sum(terms.values())
+        self._total_length += self._lengths[name]
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[name] = tf
+
+        if self._free:
+            row = self._free.pop()
+        else:
+            row = len(self._rows)
+            if row >= len(self._vectors):
+                grown = np.zeros((len(self._vectors) * 2, self.dim), dtype=np.float32)
+                grown[:len(self._vectors)] = self._vectors
+                self._vectors = grown
+        self._vectors[row] = embed_text(text, self.dim)
+        self._rows[name] = row
+        self._versions[name] = schema
+
+    def sync(self, names: List[str]) -> List[str]:
+        """確保 names 中的工具索引為最新版本，回傳目前仍存在的工具"""
+        present = []
+        with self._lock:
+            for name in names:
+                schema = get_tool_schema(name)
+                if schema is None:
+                    self._remove(name)
+                    continue
+                if self._versions.get(name) is not schema:
+                    self._remove(name)
+                    self._add(name, schema)
+                present.append(name)
+        return present
+
+    def _bm25(self, names: List[str], query_terms: List[str]):
+        scores = np.zeros(len(names), dtype=np.float32)
+        if not self._versions:
+            return scores
+        lengths = np.fromiter((self._lengths[name] for name in names), dtype=np.float32, count=len(names))
+        avg_length = self._total_length / len(self._versions) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        for term in set(query_terms):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            tf = np.fromiter((posting.get(name, 0) for name in names), dtype=np.float32, count=len(names))
+            idf = math.log(1 + (len(self._versions) - len(posting) + 0.5) / (len(posting) + 0.5))
+            scores += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def _embedding(self, names: List[str], query: str):
+        rows = np.fromiter((self._rows[name] for name in names), dtype=np.int64, count=len(names))
+        return self._vectors[rows] @ embed_text(query, self.dim)
+
+    def rank(self, names: List[str], query: str, method: str = "hybrid") -> List[str]:
+        """依與 query 的相關程度排序 names（須先 sync）"""
+        if not names:
+            return []
+        with self._lock:
+            if method == "bm25":
+                scores = self._bm25(names, tokenize(query))
+            elif method == "embedding":
+                scores = self._embedding(names, query)
+            else:
+                bm25 = self._bm25(names, tokenize(query))
+                if bm25.max() > 0:
+                    bm25 = bm25 / bm25.max()
+                embedding = np.clip(self._embedding(names, query), 0, None)
+                scores = (1 - self.embedding_weight) * bm25 + self.embedding_weight * embedding
+        # 分數相同時維持原本順序
+        order = np.argsort(-scores, kind="stable")
+        return [names[i] for i in order]
+
+
+tool_index = ToolIndex()
+
+
+def select_tools(names: List[str], query: str, cfg: Optional[Dict]) -> Tuple[List[str], bool]:
+    """
+    依 agent 的 tool_retrieval 設定挑選本次請求要送出的工具，回傳 (工具名稱, 是否經過檢索篩選)。
+    經過篩選的組合每次請求都可能不同，呼叫端不應長期保留其 ToolBundle。
+
+    cfg: {"top_k": 8, "pinned": [...], "method": "hybrid", "min_tools": 16}；
+    未設定、沒有 numpy 或工具數不超過 max(min_tools, top_k + 固定工具數) 時回傳全部工具。
+    """
+    if not cfg or not cfg.get("enabled", True) or np is None:
+        return names, False
+    top_k = cfg.get("top_k", 8)
+    pinned = [name for name in cfg.get("pinned", []) if name in names]
+    if len(names) <= max(cfg.get("min_tools", 16), top_k + len(pinned)):
+        return names, False
+
+    pinned_set = set(pinned)
+    candidates = tool_index.sync([name for name in names if name not in pinned_set])
+    ranked = tool_index.rank(candidates, query, cfg.get("method", "hybrid"))
+    return pinned + ranked[:top_k], True
@@ -0,0 +1,282 @@
+"""
+isolated 工具（register_tool(isolated=True)，例如經 POST /tool 上傳的 function 工具）的 worker process pool。
+
+每個 worker 是預先啟動的獨立 process（執行 Tool/sandbox_worker.py，不匯入主程序模組），
+載入過的工具模組會保留在 worker 中：
+- 單次呼叫（含等待空閒 worker 的時間）超過 timeout 時直接終止 worker，回傳 ToolTimeoutError
+- worker 啟動時以 RLIMIT_AS 限制記憶體，每次呼叫前以 RLIMIT_CPU 限制 CPU 時間
+- 每個 worker 執行 max_calls 次後回收，避免記憶體洩漏或殘留狀態累積
+- 被終止或回收的 worker 在背景替換，不延遲當次呼叫的結果
+- 呼叫在專屬的 thread pool（大小與 worker 數相同）中執行，等待 worker 時不佔用 asyncio 預設 executor
+
+環境變數：TOOL_SANDBOX_WORKERS（0 表示停用，isolated 工具改在主程序執行）、TOOL_SANDBOX_TIMEOUT、
+TOOL_SANDBOX_MEMORY_MB、TOOL_SANDBOX_CPU_SECONDS、TOOL_SANDBOX_MAX_CALLS。
+"""
+import os
+import sys
+import queue
+import signal
+import socket
+import asyncio
+import logging
+import functools
+import threading
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Dict, Optional
+
+from LLM.errors import ToolExecutionError, ToolTimeoutError, ToolResourceError
+from utils.metrics import registry
+from .manifest import tool_location
+
+logger = logging.getLogger(__name__)
+
+TOOL_SANDBOX_RESTARTS = registry.counter(
+    "tool_sandbox_worker_restarts_total", "Sandbox worker processes replaced",
+    ("reason",))
+TOOL_SANDBOX_BUSY = registry.gauge(
+    "tool_sandbox_workers_busy", "Sandbox workers currently executing a tool")
+
+TOOLS_DIR = os.path.join(os.path.dirname(__file__), "tools")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Worker:
+    def __init__(self, tools_dir: str, memory_mb: int, preload: tuple):
+        parent_sock, child_sock = socket.socketpair()
+        with child_sock:
+            self.process = subprocess.Popen(
+                [sys.executable, WORKER_SCRIPT, "--fd", str(child_sock.fileno()), "--root", ROOT_DIR,
+                 "--tools-dir", tools_dir, "--memory-mb", str(memory_mb), *preload],
+                pass_fds=(child_sock.fileno(),), stdin=subprocess.DEVNULL)
+        self.conn = Connection(parent_sock.detach())
+        self.calls = 0
+
+    def wait(self, timeout: float) -> Optional[int]:
+        """等待 process 結束並回傳 exit code（被 signal 終止時為負的 signal 編號），逾時回傳 None"""
+        try:
+            return self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.wait(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.wait(1)
+        self.kill()
+
+
+class ToolStats:
+    __slots__ = ("calls", "ok", "errors", "timeouts", "killed", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = self.ok = self.errors = self.timeouts = self.killed = 0
+        self.total_seconds = self.max_seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {"calls": self.calls, "ok": self.ok, "errors": self.errors,
+                "timeouts": self.timeouts, "killed": self.killed,
+                "avg_seconds": round(self.total_seconds / self.calls, 4) if self.calls else 0.0,
+                "max_seconds": round(self.max_seconds, 4)}
+
+
+class SandboxPool:
+    """
+    workers: worker 數量，即 isolated 工具同時執行的上限；0 表示停用。
+    timeout: 單次呼叫的預設秒數上限（工具可用 register_tool(timeout=...) 覆寫）。
+    memory_mb: 每個 worker 的虛擬記憶體上限。
+    cpu_seconds: 單次呼叫的 CPU 秒數上限，None 表示與 timeout 相同。
+    max_calls: 每個 worker 執行幾次後回收。
+    preload: 新 worker 啟動時預先載入的模組數，取最近被呼叫的 isolated 工具模組。
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 30.0, memory_mb: int = 512,
+                 cpu_seconds: Optional[float] = None, max_calls: int = 100,
+                 tools_dir: str = TOOLS_DIR, preload: int = 32):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_calls = max_calls
+        self.tools_dir = tools_dir
+        self.preload = preload
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats: Dict[str, ToolStats] = {}
+        self._stats_lock = threading.Lock()
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _spawn(self) -> _Worker:
+        with self._stats_lock:
+            preload = tuple(reversed(self._recent))
+        return _Worker(self.tools_dir, self.memory_mb, preload)
+
+    def _touch(self, mod_name: str):
+        self._recent[mod_name] = None
+        self._recent.move_to_end(mod_name)
+        while len(self._recent) > self.preload:
+            self._recent.popitem(last=False)
+
+    def start(self):
+        """預先啟動所有 worker；未呼叫時於第一次執行 isolated 工具時啟動"""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            for _ in range(self.workers):
+                self._idle.put(self._spawn())
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tool-sandbox")
+            self._started = True
+
+    def shutdown(self):
+        with self._lock:
+            self._started = False
+            executor, self._executor = self._executor, None
+            while True:
+                try:
+                    self._idle.get_nowait().stop()
+                except queue.Empty:
+                    break
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, worker: _Worker):
+        if self._started:
+            self._idle.put(worker)
+        else:
+            worker.stop()
+
+    def _respawn(self, worker: _Worker):
+        worker.kill()
+        while True:
+            try:
+                replacement = self._spawn()
+                break
+            except Exception:
+                if not self._started:
+                    return
+                logger.exception("failed to start a tool sandbox worker, retrying")
+                time.sleep(1)
+        self._release(replacement)
+
+    def _replace(self, worker: _Worker, reason: str):
+        """在背景終止 worker 並補上新的 worker，呼叫端不等待新 process 啟動"""
+        TOOL_SANDBOX_RESTARTS.inc(reason=reason)
+        threading.Thread(target=self._respawn, args=(worker,), name="tool-sandbox-respawn", daemon=True).start()
+
+    async def acall(self, tool_name: str, func, args: Dict):
+        """非同步介面：在專屬 thread pool 中執行 call，排隊時間計入工具的 timeout"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self.call, tool_name, func, args, submitted=time.perf_counter()))
+
+    def call(self, tool_name: str, func, args: Dict, timeout: Optional[float] = None,
+             submitted: Optional[float] = None):
+        """
+        在 worker 中執行工具並回傳結果（阻塞）。
+        timeout 由 submitted（預設為呼叫當下）起算，包含等待空閒 worker 的時間。
+        超時拋出 ToolTimeoutError，超出資源上限或 worker 異常結束拋出 ToolResourceError，
+        工具本身拋出的例外轉為 ToolExecutionError。
+        """
+        self.start()
+        start = time.perf_counter()
+        mod_name, attr = tool_location(func)
+        timeout = timeout or getattr(func, "_tool_timeout", None) or self.timeout
+        deadline = (submitted or start) + timeout
+        cpu_seconds = self.cpu_seconds or timeout
+        with self._stats_lock:
+            stats = self._stats.setdefault(tool_name, ToolStats())
+            self._touch(mod_name)
+
+        worker = None
+        busy = False
+        outcome = "errors"
+        try:
+            try:
+                worker = self._idle.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                outcome = "timeouts"
+                raise ToolTimeoutError(f"tool {tool_name} found no free sandbox worker within {timeout:g}s")
+            TOOL_SANDBOX_BUSY.inc()
+            busy = True
+            try:
+                worker.conn.send((mod_name, attr, args, cpu_seconds))
+                if not worker.conn.poll(max(deadline - time.perf_counter(), 0)):
+                    outcome = "timeouts"
+                    self._replace(worker, "timeout")
+                    worker = None
+                    raise ToolTimeoutError(f"tool {tool_name} timed out after {timeout:g}s")
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                outcome = "killed"
+                exitcode = worker.wait(1)
+                self._replace(worker, "crashed")
+                worker = None
+                if exitcode == -signal.SIGXCPU:
+                    raise ToolResourceError(f"tool {tool_name} exceeded the CPU limit of {cpu_seconds:g}s")
+                raise ToolResourceError(f"tool {tool_name} worker exited unexpectedly (exit code {exitcode})")
+
+            worker.calls += 1
+            if status == "memory":
+                outcome = "killed"
+                # MemoryError 之後 worker 狀態不可信，直接替換
+                self._replace(worker, "memory")
+                worker = None
+                raise ToolResourceError(f"tool {tool_name} exceeded the memory limit of {self.memory_mb}MB")
+            if worker.calls >= self.max_calls:
+                self._replace(worker, "recycled")
+                worker = None
+            if status == "error":
+                raise ToolExecutionError(payload)
+            outcome = "ok"
+            return payload
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                stats.calls += 1
+                setattr(stats, outcome, getattr(stats, outcome) + 1)
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+            if busy:
+                TOOL_SANDBOX_BUSY.dec()
+            if worker is not None:
+                self._release(worker)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "idle": self._idle.qsize(),
+            "tools": {name: stats.to_dict() for name, stats in list(self._stats.items())},
+        }
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+sandbox_pool = SandboxPool(
+    workers=int(os.getenv("TOOL_SANDBOX_WORKERS", "2")),
+    timeout=_env_float("TOOL_SANDBOX_TIMEOUT", 30.0),
+    memory_mb=int(os.getenv("TOOL_SANDBOX_MEMORY_MB", "512")),
+    cpu_seconds=_env_float("TOOL_SANDBOX_CPU_SECONDS", None),
+    max_calls=int(os.getenv("TOOL_SANDBOX_MAX_CALLS", "100")),
+)
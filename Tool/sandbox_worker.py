@@ -0,0 +1,143 @@
+"""
+sandbox worker process 的進入點，由 Tool.sandbox 以 `python Tool/sandbox_worker.py` 啟動。
+
+以獨立腳本執行而非 multiprocessing spawn，worker 不會重新匯入主程序的 __main__（main.py、litellm、
+FastAPI 等），記憶體上限在直譯器剛啟動時就套用。工具模組的 `from Tool import register_tool`
+由 _install_tool_stub 提供的替身滿足，不會執行 Tool/__init__.py 的 load_tools()。
+"""
+import os
+import sys
+
+if __name__ == "__main__":
+    # 以腳本執行時 sys.path[0] 是 Tool/，移除以免其中的模組遮蔽同名套件
+    sys.path.pop(0)
+
+import types
+import asyncio
+import argparse
+from typing import Dict, Tuple
+
+try:
+    import resource
+except ImportError:  # 非 POSIX 平台無法設定資源上限
+    resource = None
+
+
+def _set_memory_limit(memory_mb: int):
+    if resource is None or not memory_mb:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_limit(cpu_seconds: float):
+    """
+    RLIMIT_CPU 以整個 process 累計的 CPU 時間計算，每次呼叫前依已使用量重設 soft limit；
+    超過時 kernel 送出 SIGXCPU 終止 worker。hard limit 維持不變，之後才能再調高 soft limit。
+    """
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _install_tool_stub():
+    """
+    以最小的 Tool 替身取代真正的套件，只提供 register_tool：worker 直接呼叫函式，不需要註冊資訊。
+    isolated 工具（使用者上傳的 function 工具）只匯入 register_tool；其他 Tool 子模組依賴主程序的
+    工具註冊表與 LLM（litellm），不在 worker 中提供。
+    """
+    def register_tool(name: str = None, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+    stub = types.ModuleType("Tool")
+    stub.register_tool = register_tool
+    sys.modules["Tool"] = stub
+
+
+def _load_module(modules: Dict[str, Tuple[tuple, types.ModuleType]], tools_dir: str, mod_name: str):
+    """
+    由原始碼載入工具模組，檔案 (mtime, size) 改變時重新載入。
+    直接 compile 原始碼而不經 importlib，避免讀到主程序熱載入前留下的 .pyc。
+    """
+    path = os.path.join(tools_dir, f"{mod_name}.py")
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = modules.get(mod_name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        code = compile(f.read(), path, "exec")
+    module = types.ModuleType(mod_name)
+    module.__file__ = path
+    sys.modules[mod_name] = module
+    exec(code, module.__dict__)
+    modules[mod_name] = (version, module)
+    return module
+
+
+def worker_main(conn, tools_dir: str, memory_mb: int, preload: Tuple[str, ...] = ()):
+    """
+    反覆接收 (模組, 屬性, 參數, CPU 秒數) 並回傳 ("ok", 結果) 或 ("error", 訊息)；
+    收到 None 或連線關閉時結束。
+    """
+    _set_memory_limit(memory_mb)
+    if tools_dir not in sys.path:
+        sys.path.insert(0, tools_dir)
+    modules = {}
+    for mod_name in preload:
+        try:
+            _load_module(modules, tools_dir, mod_name)
+        except Exception:
+            pass
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        mod_name, attr, args, cpu_seconds = message
+        try:
+            _set_cpu_limit(cpu_seconds)
+            func = getattr(_load_module(modules, tools_dir, mod_name), attr)
+            result = func(**args)
+            if asyncio.iscoroutine(result):
+                result = asyncio.run(result)
+            reply = ("ok", result)
+        except MemoryError:
+            reply = ("memory", f"{mod_name}.{attr} exceeded the memory limit")
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+
+        try:
+            conn.send(reply)
+        except Exception:
+            # 無法 pickle 的結果改傳字串（tool 訊息最終也會轉為字串）
+            conn.send(("ok", str(reply[1])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tool sandbox worker")
+    parser.add_argument("--fd", type=int, required=True, help="socket connected to the parent pool")
+    parser.add_argument("--root", required=True, help="project root, so tool modules can import Tool")
+    parser.add_argument("--tools-dir", required=True)
+    parser.add_argument("--memory-mb", type=int, default=0)
+    parser.add_argument("preload", nargs="*", help="tool modules to load before the first call")
+    args = parser.parse_args(argv)
+
+    from multiprocessing.connection import Connection
+    sys.path.insert(0, args.root)
+    _install_tool_stub()
+    worker_main(Connection(args.fd), args.tools_dir, args.memory_mb, tuple(args.preload))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""Microbenchmarks：python -m benchmarks.runner"""
+from typing import Callable, Dict, List, Optional
+
+REGISTRY: List[Dict] = []
+
+
+class SkipBenchmark(Exception):
+    pass
+
+
+def benchmark(name: Optional[str] = None, rounds: int = 20, number: int = 1, warmup: int = 1):
+    """
+    rounds: 量測回合數；number: 每回合呼叫次數（回報的時間為單次呼叫的平均）。
+    """
+    def decorator(setup: Callable):
+        REGISTRY.append({
+            "name": f"{setup.__module__.rsplit('.', 1)[-1]}.{name or setup.__name__}",
+            "setup": setup,
+            "rounds": rounds,
+            "number": number,
+            "warmup": warmup,
+        })
+        return setup
+    return decorator
@@ -0,0 +1,70 @@
+import os
+import random
+import logging
+
+from benchmarks.fixtures import synthetic_agents_dir, synthetic_agents_db
+from benchmarks import benchmark
+
+
+@benchmark(rounds=50, number=100)
+def load_agent_config_10000():
+    """在 10,000 個 agent 設定中隨機讀取（main.load_agent_config 以相對路徑讀取 agents/，經 agent 設定快取）"""
+    import main
+    # 合成 agent 引用的工具並未註冊，略過 agent 設定快取對每個 agent 的警告
+    logging.getLogger("utils.agent_cache").setLevel(logging.ERROR)
+    root = synthetic_agents_dir(10000)
+    rng = random.Random(0)
+    ids = [f"BENCH-{rng.randrange(10000):05d}" for _ in range(1000)]
+    state = {"i": 0}
+    os.chdir(root)
+
+    def run():
+        state["i"] = (state["i"] + 1) % len(ids)
+        main.load_agent_config(ids[state["i"]])
+    return run
+
+
+@benchmark(rounds=50, number=100)
+def json_store_get_10000():
+    """同上但不經快取，每次開檔並解析 JSON（對照 agent 設定快取的效果）"""
+    from utils.agent_store import JsonAgentStore
+    store = JsonAgentStore(os.path.join(synthetic_agents_dir(10000), "agents"))
+    rng = random.Random(0)
+    ids = [f"BENCH-{rng.randrange(10000):05d}" for _ in range(1000)]
+    state = {"i": 0}
+
+    def run():
+        state["i"] = (state["i"] + 1) % len(ids)
+        store.get(ids[state["i"]])
+    return run
+
+
+@benchmark(rounds=50, number=100)
+def sqlite_store_get_10000():
+    """SQLite 儲存後端以主鍵讀取並解析單一 agent 設定（不經快取）"""
+    from utils.agent_store import SQLiteAgentStore
+    store = SQLiteAgentStore(synthetic_agents_db(10000))
+    rng = random.Random(0)
+    ids = [f"BENCH-{rng.randrange(10000):05d}" for _ in range(1000)]
+    state = {"i": 0}
+
+    def run():
+        state["i"] = (state["i"] + 1) % len(ids)
+        store.get(ids[state["i"]])
+    return run
+
+
+@benchmark(rounds=5, number=1)
+def json_store_list_page_10000():
+    """列出 10,000 個 agent 中公開 agent 的第 10 頁（JSON 後端須解析每個檔案）"""
+    from utils.agent_store import JsonAgentStore
+    store = JsonAgentStore(os.path.join(synthetic_agents_dir(10000), "agents"))
+    return lambda: store.list(offset=450, limit=50, is_public=True)
+
+
+@benchmark(rounds=50, number=10)
+def sqlite_store_list_page_10000():
+    """同上，SQLite 後端以 is_public、name 索引分頁"""
+    from utils.agent_store import SQLiteAgentStore
+    store = SQLiteAgentStore(synthetic_agents_db(10000))
+    return lambda: store.list(offset=450, limit=50, is_public=True)
@@ -0,0 +1,62 @@
+import os
+import random
+import tempfile
+from collections import namedtuple
+
+from benchmarks import benchmark, SkipBenchmark
+
+# 與 fitz.Rect 相同的座標欄位，避免 benchmark 依賴 PyMuPDF 的物件建立成本
+Rect = namedtuple("Rect", "x0 y0 x1 y1")
+
+
+def _file_processor():
+    try:
+        from data_pipeline import file_processor
+    except ImportError as e:
+        raise SkipBenchmark(f"data_pipeline dependencies missing: {e}")
+    return file_processor
+
+
+def _page_images(count: int, seed: int = 0):
+    """模擬一頁中的圖片位置：部分圖片相鄰成群，其餘分散"""
+    rng = random.Random(seed)
+    images = []
+    for i in range(count):
+        x, y = rng.uniform(0, 500), rng.uniform(0, 800)
+        w, h = rng.uniform(10, 80), rng.uniform(10, 80)
+        images.append((Rect(x, y, x + w, y + h), i, f"img_{i}.png"))
+    return images
+
+
+@benchmark(rounds=20)
+def group_adjacent_images_50():
+    file_processor = _file_processor()
+    images = _page_images(50)
+    return lambda: file_processor._group_adjacent_images(images, padding=5)
+
+
+@benchmark(rounds=5)
+def group_adjacent_images_500():
+    file_processor = _file_processor()
+    images = _page_images(500)
+    return lambda: file_processor._group_adjacent_images(images, padding=5)
+
+
+@benchmark(rounds=10)
+def merge_images_8():
+    file_processor = _file_processor()
+    from PIL import Image
+
+    tmp = tempfile.mkdtemp(prefix="bench_images_")
+    paths = []
+    for i in range(8):
+        path = os.path.join(tmp, f"part_{i}.png")
+        Image.new("RGB", (400, 120), (i * 30 % 255, 80, 160)).save(path)
+        paths.append(path)
+
+    class FakeStorage:
+        def upload_file_return_url(self, local_path, remote_key):
+            return f"https://bench/{remote_key}"
+
+    output = os.path.join(tmp, "merged.jpg")
+    return lambda: file_processor._merge_images(paths, output, FakeStorage())
@@ -0,0 +1,41 @@
+from Tool import TOOL_FUNCTIONS
+from Tool.formatter import generate_tool_schema
+from benchmarks.fixtures import FakeLLM, synthetic_history
+from benchmarks import benchmark
+
+TOOL_NAME = "add"
+
+
+def _setup():
+    tools = generate_tool_schema([TOOL_FUNCTIONS[TOOL_NAME]])
+    return FakeLLM(TOOL_NAME, tool_calls=3), tools
+
+
+@benchmark(rounds=20, number=20)
+def build_messages_long_history():
+    llm, tools = _setup()
+    history = synthetic_history(50)
+    return lambda: llm._build_kwargs(llm._build_messages("system", "question", history), tools)
+
+
+@benchmark(rounds=20, number=10)
+def achat_tool_loop():
+    """一輪 3 個工具呼叫 + 一輪文字答案（非串流）"""
+    llm, tools = _setup()
+    history = synthetic_history(5)
+
+    async def run():
+        await llm.achat("system", "question", tools=tools, history=history)
+    return run
+
+
+@benchmark(rounds=20, number=10)
+def achat_tool_loop_stream():
+    """同上，串流模式並消耗所有 SSE chunk"""
+    llm, tools = _setup()
+    history = synthetic_history(5)
+
+    async def run():
+        async for _ in await llm.achat("system", "question", tools=tools, history=history, stream=True):
+            pass
+    return run
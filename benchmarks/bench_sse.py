@@ -0,0 +1,67 @@
+import os
+import json
+import asyncio
+import tempfile
+import importlib
+
+from benchmarks import benchmark, SkipBenchmark
+
+
+def _agent_root() -> str:
+    root = tempfile.mkdtemp(prefix="bench_sse_")
+    os.makedirs(os.path.join(root, "agents"))
+    with open(os.path.join(root, "agents", "BENCH-SSE.json"), "w", encoding="utf-8") as f:
+        json.dump({"name": "bench", "id": "BENCH-SSE", "description": "", "is_public": True,
+                   "system_prompt": "", "tools": ["add"], "knowledge_base": "", "api_keys": {}}, f)
+    return root
+
+
+@benchmark(rounds=20, number=5)
+def main_chat_sse():
+    """main.py /chat 串流端點（replay provider 的合成回應、無延遲），含一輪工具呼叫"""
+    import httpx
+    import main
+    os.environ.setdefault("LLM_REPLAY_LATENCY", "none")
+    os.chdir(_agent_root())
+    transport = httpx.ASGITransport(app=main.app)
+    body = {"agent_id": "BENCH-SSE", "user_query": "hello", "password": "x", "streaming": True,
+            "llm_config": {"model_name": "bench", "provider": "replay", "temperature": 0, "max_tokens": 64}}
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async with client.stream("POST", "/chat", json=body) as response:
+                async for _ in response.aiter_lines():
+                    pass
+    return run
+
+
+@benchmark(rounds=20, number=5)
+def pipeline_api_sse():
+    """pipeline_api.py /process-files 的 SSE 產生器（假的 DocumentProcessor，每檔 20 頁）"""
+    try:
+        import httpx
+        pipeline_api = importlib.import_module("pipeline_api")
+    except ImportError as e:
+        raise SkipBenchmark(f"pipeline_api dependencies missing: {e}")
+
+    class FakeProcessor:
+        def __init__(self, **kwargs):
+            pass
+
+        def process_file_streaming(self, path):
+            for part in range(20):
+                yield {"part": part, "message": f"page {part}", "url": f"https://bench/{part}"}
+
+    pipeline_api.DocumentProcessor = FakeProcessor
+    pipeline_api.S3StorageOperate = lambda bucket_name: None
+    os.chdir(tempfile.mkdtemp(prefix="bench_pipeline_"))
+    transport = httpx.ASGITransport(app=pipeline_api.app)
+
+    async def run():
+        files = [("files", (f"doc{i}.pdf", b"%PDF-1.4", "application/pdf")) for i in range(5)]
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async with client.stream("POST", "/process-files", files=files,
+                                     data={"mode": "s3", "bucket_name": "bench"}) as response:
+                async for _ in response.aiter_lines():
+                    pass
+    return run
@@ -0,0 +1,75 @@
+import sys
+
+import Tool
+from Tool.formatter import generate_tool_schema
+from benchmarks.fixtures import synthetic_tools, synthetic_tools_dir
+from benchmarks import benchmark
+
+
+@benchmark(rounds=10)
+def generate_tool_schema_1000():
+    tools = synthetic_tools(1000)
+    return lambda: generate_tool_schema(tools)
+
+
+@benchmark(rounds=200, number=10)
+def generate_tool_schema_agent_20():
+    """單一 agent 約 20 個工具，每次 /chat 都會執行一次"""
+    tools = synthetic_tools(1000)[:20]
+    return lambda: generate_tool_schema(tools)
+
+
+@benchmark(rounds=5, warmup=0)
+def load_tools_cold_1000():
+    """冷啟動：每回合清除已匯入的模組，重新 import 1,000 個工具檔案"""
+    tools_dir = synthetic_tools_dir(1000)
+    saved = dict(Tool.TOOL_FUNCTIONS)
+
+    def run():
+        for name in [m for m in sys.modules if m.startswith("bench_tool_")]:
+            del sys.modules[name]
+        Tool.load_tools(tools_dir, lazy=False)
+        Tool.TOOL_FUNCTIONS.clear()
+        Tool.TOOL_FUNCTIONS.update(saved)
+    return run
+
+
+@benchmark(rounds=5, warmup=1)
+def load_tools_manifest_1000():
+    """啟動時只讀取 manifest：warmup 寫入 manifest，之後每回合清除已匯入的模組再載入"""
+    from Tool.manifest import module_cache
+    tools_dir = synthetic_tools_dir(1000)
+    saved = dict(Tool.TOOL_FUNCTIONS)
+
+    def run():
+        for name in [m for m in sys.modules if m.startswith("bench_tool_")]:
+            del sys.modules[name]
+            module_cache.discard(name)
+        Tool.load_tools(tools_dir)
+        Tool.TOOL_FUNCTIONS.clear()
+        Tool.TOOL_FUNCTIONS.update(saved)
+    return run
+
+
+@benchmark(rounds=200, number=100)
+def tool_bundle_agent_20():
+    """/chat 實際使用的路徑：由 agent 的工具名稱取得預先編譯的 bundle"""
+    from Tool.formatter import get_tool_bundle
+    tools = synthetic_tools(1000)[:20]
+    for func in tools:
+        Tool.TOOL_FUNCTIONS.setdefault(func.__name__, func)
+    names = [func.__name__ for func in tools]
+    return lambda: get_tool_bundle(names)
+
+
+@benchmark(rounds=50, number=10)
+def select_tools_1000():
+    """工具檢索：1,000 個工具的 agent 依問題挑選 top 8（索引已建立）"""
+    from Tool.retrieval import select_tools
+    tools = synthetic_tools(1000)
+    for func in tools:
+        Tool.TOOL_FUNCTIONS.setdefault(func.__name__, func)
+    names = [func.__name__ for func in tools]
+    cfg = {"top_k": 8}
+    select_tools(names, "合成工具 42 benchmark", cfg)
+    return lambda: select_tools(names, "合成工具 42 benchmark", cfg)
@@ -0,0 +1,122 @@
+"""benchmark 共用的合成資料與假 provider"""
+import os
+import json
+import tempfile
+import functools
+from typing import Dict, List, Literal
+
+from litellm import ModelResponse, ModelResponseStream
+
+from LLM.base import BaseLLM
+
+_PARAM_TYPES = ("str", "int", "float", "bool", "dict", "list", "Literal['a', 'b', 'c']")
+
+
+def _tool_source(i: int, with_decorator: bool = False) -> str:
+    params = ", ".join(f"p{j}: {_PARAM_TYPES[(i + j) % len(_PARAM_TYPES)]}" for j in range(i % 6 + 1))
+    lines = []
+    if with_decorator:
+        lines += ["from typing import Literal", "from Tool import register_tool", "", "@register_tool()"]
+    lines += [
+        f"def tool_{i}({params}, optional_{i}: str = 'x'):",
+        f"    \"\"\"合成工具 {i}：用於 benchmark\"\"\"",
+        "    return 'ok'",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_tools(count: int = 1000) -> List:
+    """count 個參數型別與數量各異的工具函式"""
+    namespace = {"Literal": Literal}
+    for i in range(count):
+        exec(_tool_source(i), namespace)
+    return [namespace[f"tool_{i}"] for i in range(count)]
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_tools_dir(count: int = 1000) -> str:
+    """建立含 count 個工具模組的暫存資料夾，供 Tool.load_tools 使用"""
+    tools_dir = tempfile.mkdtemp(prefix="bench_tools_")
+    for i in range(count):
+        with open(os.path.join(tools_dir, f"bench_tool_{i}.py"), "w", encoding="utf-8") as f:
+            f.write(_tool_source(i, with_decorator=True))
+    return tools_dir
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_agents_dir(count: int = 10000, tools_per_agent: int = 20) -> str:
+    """建立含 count 個 agent 設定的暫存資料夾（結構與 agents/*.json 相同），回傳其上層目錄"""
+    root = tempfile.mkdtemp(prefix="bench_agents_")
+    agents_dir = os.path.join(root, "agents")
+    os.makedirs(agents_dir)
+    for i in range(count):
+        config = {
+            "name": f"agent-{i}",
+            "id": f"BENCH-{i:05d}",
+            "description": "synthetic agent " * 4,
+            "is_public": i % 2 == 0,
+            "system_prompt": "你是一個熱心助人的幫手。" * 10,
+            "tools": [f"tool_{(i + j) % 1000}" for j in range(tools_per_agent)],
+            "knowledge_base": "",
+            "api_keys": {"openai": "x" * 64, "anthropic": "", "google": "", "huggingface": "", "grok": "", "groq": ""},
+        }
+        with open(os.path.join(agents_dir, f"BENCH-{i:05d}.json"), "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+    return root
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_agents_db(count: int = 10000) -> str:
+    """將 synthetic_agents_dir(count) 匯入 SQLite agent 儲存後端，回傳資料庫路徑"""
+    from utils.agent_store import SQLiteAgentStore
+    from utils.migrate_agents import migrate
+    root = synthetic_agents_dir(count)
+    path = os.path.join(root, "agents.db")
+    store = SQLiteAgentStore(path)
+    migrate(os.path.join(root, "agents"), store)
+    store.close()
+    return path
+
+
+def synthetic_history(turns: int = 20) -> List[Dict]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " * 20})
+        history.append({"role": "assistant", "content": f"answer {i} " * 40})
+    return history
+
+
+class FakeLLM(BaseLLM):
+    """
+    不經網路的假 provider：第一輪回傳 tool_calls 次工具呼叫，之後回傳文字答案；
+    用來量測 BaseLLM 本身的訊息組裝與工具分派成本。
+    """
+
+    def __init__(self, tool_name: str, tool_calls: int = 3, answer_tokens: int = 50):
+        super().__init__(provider="fake", model_name="fake-model", temperature=0.0)
+        self.tool_name = tool_name
+        self.tool_calls = tool_calls
+        self.answer_tokens = answer_tokens
+
+    def _message(self, kwargs: Dict) -> Dict:
+        if kwargs["messages"][-1]["role"] == "user" and kwargs.get("tools"):
+            return {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{i}", "type": "function",
+                 "function": {"name": self.tool_name, "arguments": json.dumps({"a": i, "b": i})}}
+                for i in range(self.tool_calls)
+            ]}
+        return {"role": "assistant", "content": " ".join(["token"] * self.answer_tokens)}
+
+    async def _acompletion(self, **kwargs):
+        message = self._message(kwargs)
+        if not kwargs.get("stream"):
+            return ModelResponse(choices=[{"index": 0, "message": message, "finish_reason": "stop"}])
+
+        async def chunks():
+            for i, call in enumerate(message.get("tool_calls") or []):
+                yield ModelResponseStream(choices=[{"index": 0, "delta": {"tool_calls": [dict(call, index=i)]}}])
+            for word in (message.get("content") or "").split(" ") if message.get("content") else []:
+                yield ModelResponseStream(choices=[{"index": 0, "delta": {"content": word + " "}}])
+        return chunks()
@@ -0,0 +1,162 @@
+"""
+Microbenchmark runner。
+
+用法（於專案根目錄）：
+    python -m benchmarks.runner                         # 執行全部，結果寫入 benchmarks/results/
+    python -m benchmarks.runner -k tool_schema          # 只執行名稱包含 tool_schema 的 benchmark
+    python -m benchmarks.runner --compare benchmarks/results/<舊結果>.json --threshold 0.2
+
+每個 benchmarks/bench_*.py 以 @benchmark 標記 setup 函式；setup 回傳要量測的 callable
+（可為 coroutine function），準備資料的時間不計入。缺少選用套件時拋出 SkipBenchmark 略過。
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import importlib
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from benchmarks import REGISTRY, SkipBenchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+def _discover():
+    bench_dir = os.path.join(ROOT, "benchmarks")
+    for fname in sorted(os.listdir(bench_dir)):
+        if fname.startswith("bench_") and fname.endswith(".py"):
+            importlib.import_module(f"benchmarks.{fname[:-3]}")
+
+
+def _run_one(entry: Dict, loop: asyncio.AbstractEventLoop) -> Dict:
+    # 部分 benchmark 會切換工作目錄到合成資料所在位置，結束後還原
+    cwd = os.getcwd()
+    try:
+        return _measure(entry, loop)
+    finally:
+        os.chdir(cwd)
+
+
+def _measure(entry: Dict, loop: asyncio.AbstractEventLoop) -> Dict:
+    func = entry["setup"]()
+    if asyncio.iscoroutinefunction(func):
+        coro_func = func
+        func = lambda: loop.run_until_complete(coro_func())
+
+    for _ in range(entry["warmup"]):
+        func()
+    samples = []
+    for _ in range(entry["rounds"]):
+        start = time.perf_counter()
+        for _ in range(entry["number"]):
+            func()
+        samples.append((time.perf_counter() - start) / entry["number"])
+
+    return {
+        "name": entry["name"],
+        "status": "ok",
+        "rounds": entry["rounds"],
+        "number": entry["number"],
+        "min": min(samples),
+        "max": max(samples),
+        "mean": statistics.mean(samples),
+        "median": statistics.median(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "ops": 1 / statistics.median(samples) if statistics.median(samples) else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def _compare(results: List[Dict], baseline_path: str, threshold: float) -> List[Dict]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {b["name"]: b for b in json.load(f)["benchmarks"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if result["status"] != "ok" or not old or old.get("status") != "ok":
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else 1.0
+        result["baseline_median"] = old["median"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(result)
+    return regressions
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run microbenchmarks and write machine-readable results")
+    parser.add_argument("-k", "--filter", default=None, help="只執行名稱包含此字串的 benchmark")
+    parser.add_argument("-o", "--output", default=None, help="結果 JSON 路徑，預設 benchmarks/results/<時間>-<commit>.json")
+    parser.add_argument("--compare", default=None, help="與先前的結果 JSON 比較 median")
+    parser.add_argument("--threshold", type=float, default=0.2, help="median 變慢超過此比例視為退化")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+
+    sys.path.insert(0, ROOT)
+    _discover()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    results = []
+    for entry in REGISTRY:
+        if args.filter and args.filter not in entry["name"]:
+            continue
+        try:
+            result = _run_one(entry, loop)
+        except SkipBenchmark as e:
+            result = {"name": entry["name"], "status": "skipped", "reason": str(e)}
+        except Exception as e:
+            result = {"name": entry["name"], "status": "error", "reason": f"{type(e).__name__}: {e}"}
+        results.append(result)
+        if result["status"] == "ok":
+            print(f"{result['name']:<55} median {_format_seconds(result['median']):>10}  "
+                  f"min {_format_seconds(result['min']):>10}  ({result['rounds']}x{result['number']})")
+        else:
+            print(f"{result['name']:<55} {result['status']}: {result['reason']}")
+    loop.close()
+
+    regressions = _compare(results, args.compare, args.threshold) if args.compare else []
+
+    commit = _git_commit()
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "benchmarks": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\nresults written to {output}")
+
+    for result in regressions:
+        print(f"REGRESSION {result['name']}: {result['ratio']:.2f}x slower than baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,47 @@
 import os
 import json
+import math
+import asyncio
 import logging
 from LLM import get_llm
+from LLM.cache import response_cache, cache_policy, make_scope_key
+from LLM.budget import Budget, PARTIAL_NOTICE
+from LLM.clients import client_registry
+from LLM.router import RoutingPolicy
+from LLM.singleflight import single_flight, flight_enabled, make_flight_key
+from LLM.clients import credential_fingerprint
+from LLM.context import context_manager_from_config
+from LLM.scheduler import rate_limiter
+from LLM.errors import ChatError
+from LLM.resilience import RetryPolicy
+from utils.metrics import registry as metrics_registry, phase_timer, current_agent, CHAT_IN_FLIGHT, CHAT_REQUESTS, \
+    provider_labels, model_labels
+from utils.agent_cache import agent_cache
+from utils.agent_store import agent_store, AgentNotFoundError
 from Tool import TOOL_FUNCTIONS, register_tool
-from Tool.formatter import generate_tool_schema
+from Tool.formatter import get_tool_bundle
+from Tool.cache import tool_cache
+from Tool.reloader import reload_tool_module, ToolWatcher
+from Tool.sandbox import sandbox_pool
+from Tool.http_client import tool_http
+from Tool.results import result_policies_from_config, PAGING_TOOL
+from Tool.retrieval import select_tools
 from fastapi import FastAPI, HTTPException, Body
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Literal
-from fastapi.responses import StreamingResponse
-from utils.decrypt import get_key, lock_key
-from fastapi import FastAPI, HTTPException, Body, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi import Response
+from utils.decrypt import aget_key, alock_key, aclose as close_decrypt_client
+from fastapi import FastAPI, HTTPException, Body, Depends, Header
 import secrets
 import random
 import string
 import requests
 from fastapi.middleware.cors import CORSMiddleware
 
+# 列出非公開 agent 所需的管理權杖；未設定時不開放
+AGENT_ADMIN_TOKEN = os.getenv("AGENT_ADMIN_TOKEN")
+
 # 確保 tools 目錄存在
 os.makedirs(os.path.join('Tool', 'tools'), exist_ok=True)
 
@@ -26,14 +52,17 @@ def generate_id():
     return f"{letters}-{hex_part}"
 
 def load_agent_config(agent_id: str) -> dict:
-    path = os.path.join('agents', f'{agent_id}.json')
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    # 回傳的設定由快取共用，不可直接修改
+    return agent_cache.get(agent_id)
 
-def save_agent_config(agent_id: str, config: dict):
-    path = os.path.join('agents', f'{agent_id}.json')
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(config, f, ensure_ascii=False, indent=2)
+async def aload_agent_config(agent_id: str) -> dict:
+    # 需要存取儲存後端時在執行緒中進行，不阻塞事件迴圈
+    return await agent_cache.aget(agent_id)
+
+async def save_agent_config(agent_id: str, config: dict):
+    # 儲存後端為同步 I/O（檔案或 SQLite），在執行緒中寫入以免阻塞事件迴圈
+    await asyncio.to_thread(agent_store.put, agent_id, config)
+    agent_cache.invalidate(agent_id)
 
 
 
@@ -52,6 +81,9 @@ class QueryRequest(BaseModel):
     system_prompt: Optional[str] = "你是一個熱心助人的幫手。"
     history: List[Dict] = []
     password: str
+    timeout: Optional[float] = None  # 整個請求的秒數上限
+    max_rounds: Optional[int] = None  # LLM 往返次數上限
+    max_tool_calls: Optional[int] = None  # 工具呼叫次數上限
 
 
 # 動態工具規格模型
@@ -60,6 +92,10 @@ class ToolSpec(BaseModel):
     name: str
     content: str = ""  # function 類型為代碼，api 類型為 URL，select 類型可為空
     description: Optional[str] = None  # api 類型的註解
+    cache_ttl: Optional[int] = None  # 結果快取秒數，None 表示不快取
+    cache_max_entries: int = 256
+    timeout: Optional[float] = None  # 單次執行的秒數上限，None 表示使用預設值
+    max_response_bytes: Optional[int] = None  # api 類型的回應大小上限，None 表示使用預設值
 
 class APIKeysConfig(BaseModel):
     openai: str = ""
@@ -99,88 +135,353 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 設定 TOOL_WATCH_INTERVAL（秒）時輪詢 tools 資料夾，自動載入直接修改於磁碟上的工具
+tool_watcher = None
+
+@app.on_event("startup")
+async def start_tool_watcher():
+    global tool_watcher
+    interval = float(os.getenv("TOOL_WATCH_INTERVAL", "0") or 0)
+    if interval > 0:
+        tool_watcher = ToolWatcher(interval=interval).start()
+
+@app.on_event("startup")
+async def bind_llm_clients():
+    # LLM 連線池只在伺服器的 event loop 上使用
+    client_registry.bind()
+
+@app.on_event("startup")
+async def start_tool_sandbox():
+    # 預先啟動 worker，第一個 isolated 工具呼叫不必等待 process 啟動
+    await asyncio.to_thread(sandbox_pool.start)
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    if tool_watcher is not None:
+        tool_watcher.stop()
+    sandbox_pool.shutdown()
+    await tool_http.aclose()
+    await client_registry.close()
+    await close_decrypt_client()
+    agent_store.close()
+
 def write_tool_file(spec: ToolSpec):
     """根據規格創建或覆蓋工具模組文件"""
     path = os.path.join('Tool', 'tools', f"{spec.name}.py")
+    decorator_args = ""
+    if spec.cache_ttl:
+        decorator_args = f"cache_ttl={spec.cache_ttl}, cache_max_entries={spec.cache_max_entries}"
     if spec.type == 'function':
+        # 使用者提供的程式碼一律在 sandbox worker process 中執行
+        sandbox_args = "isolated=True" + (f", timeout={spec.timeout}" if spec.timeout else "")
+        decorator_args = ", ".join(arg for arg in (decorator_args, sandbox_args) if arg)
         # 將提供的函數代碼包裝在 register_tool 裝飾器中
         content = spec.content.strip()
         # 確保函數定義保持完整
         module_code = f"""from Tool import register_tool
 
-@register_tool()
+@register_tool({decorator_args})
 {content}
 """
     else:  # api 類型
         url = spec.content.strip()
         description = spec.description or f"調用外部 API {url} 並傳入參數"
-        module_code = f"""import requests
-from Tool import register_tool
+        # 共用連線池的非同步 client，由工具迴圈直接 await，不佔用 thread
+        module_code = f"""from Tool import register_tool
+from Tool.http_client import get_json
 
-@register_tool()
-def {spec.name}(**params):
+@register_tool({decorator_args})
+async def {spec.name}(**params):
     \"\"\"{description}\"\"\"
-    response = requests.get("{url}", params=params)
-    response.raise_for_status()
-    return response.json()
+    return await get_json({url!r}, params, timeout={spec.timeout}, max_bytes={spec.max_response_bytes})
 """
+    previous = None
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            previous = f.read()
     with open(path, 'w', encoding='utf-8') as f:
         f.write(module_code)
 
+    # 只重新載入這個模組；載入失敗時還原舊檔，避免留下無法匯入的工具
+    try:
+        reload_tool_module(spec.name)
+    except Exception as e:
+        if previous is None:
+            os.remove(path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(previous)
+        reload_tool_module(spec.name)
+        raise HTTPException(status_code=400, detail=f"Tool {spec.name} failed to load: {type(e).__name__}: {e}")
+
 def remove_tool_file(name: str):
     """如果存在則刪除工具模組文件"""
     path = os.path.join('Tool', 'tools', f"{name}.py")
     if os.path.exists(path):
         os.remove(path)
+    reload_tool_module(name)
+
+def configured_models(cfg: dict) -> List[str]:
+    """agent 設定中列出的 model（models 與 routing.fallbacks），可作為監控標籤"""
+    models = [name for name in cfg.get('models') or [] if isinstance(name, str)]
+    for leg in (cfg.get('routing') or {}).get('fallbacks') or []:
+        if isinstance(leg, dict) and isinstance(leg.get('model_name'), str):
+            models.append(leg['model_name'])
+    return models
+
+async def _track_stream(body, agent_id: str):
+    """串流結束（或中斷）時才將請求計為完成"""
+    status = "error"
+    try:
+        async for chunk in body:
+            yield chunk
+        status = "ok"
+    finally:
+        CHAT_IN_FLIGHT.dec(streaming="true")
+        CHAT_REQUESTS.inc(agent=agent_id, status=status)
+
 
 @app.post("/chat")
-async def chat(request: QueryRequest):
+async def chat(request: QueryRequest, response: Response):
+    streaming_label = "true" if request.streaming else "false"
+    CHAT_IN_FLIGHT.inc(streaming=streaming_label)
+    status = "ok"
+    agent_label = current_agent.get()  # agent 確認存在前不以請求內容作為標籤
+    handed_off = False  # 串流響應由 _track_stream 負責結束統計
     try:
-        cfg = load_agent_config(request.agent_id)
-        
+        with phase_timer("load_agent_config"):
+            cfg = await aload_agent_config(request.agent_id)
+        agent_label = request.agent_id
+        current_agent.set(agent_label)
+        model_labels.allow(*configured_models(cfg))
+        provider = provider_labels(request.llm_config.provider.lower())
+        model = model_labels(request.llm_config.model_name)
+
         try:
             encrypt_key = cfg['api_keys'][request.llm_config.provider]
-            api_key = get_key(encrypt_key,request.password)
+            with phase_timer("get_key", provider, model):
+                api_key = await aget_key(encrypt_key,request.password)
         except:
             api_key = None
         
         
-        llm = get_llm(
-            provider=request.llm_config.provider,
-            model_name=request.llm_config.model_name,
-            api_key=api_key,
-            api_base=request.llm_config.api_base,
-            temperature=request.llm_config.temperature,
-            max_tokens=request.llm_config.max_tokens
+        with phase_timer("get_llm", provider, model):
+            llm = get_llm(
+                provider=request.llm_config.provider,
+                model_name=request.llm_config.model_name,
+                api_key=api_key,
+                api_base=request.llm_config.api_base,
+                temperature=request.llm_config.temperature,
+                max_tokens=request.llm_config.max_tokens
+            )
+        # 依 agent 設定的 rate_limits 為每個 provider 與憑證限流
+        rate_limits = cfg.get('rate_limits') or {}
+        llm.set_rate_limiter(rate_limiter.get(llm.provider, api_key, rate_limits.get(llm.provider)))
+        retry_policy = RetryPolicy.from_config(cfg.get('retry'))
+        llm.set_retry_policy(retry_policy)
+
+        # 對沖與備援策略（agent 設定 routing 時）
+        routing_cfg = cfg.get('routing') or {}
+        if routing_cfg.get('fallbacks'):
+            fallbacks = []
+            for leg in routing_cfg['fallbacks']:
+                try:
+                    leg_key = await aget_key(cfg['api_keys'][leg['provider']], request.password)
+                except:
+                    leg_key = None
+                fallback = get_llm(
+                    provider=leg['provider'],
+                    model_name=leg['model_name'],
+                    api_key=leg_key,
+                    api_base=leg.get('api_base'),
+                    temperature=request.llm_config.temperature,
+                    max_tokens=request.llm_config.max_tokens
+                )
+                fallback.set_retry_policy(retry_policy)
+                fallbacks.append(fallback.set_rate_limiter(
+                    rate_limiter.get(fallback.provider, leg_key, rate_limits.get(fallback.provider))))
+            llm.set_routing(RoutingPolicy(fallbacks,
+                                          hedge_after=routing_cfg.get('hedge_after'),
+                                          failover=routing_cfg.get('failover', True)))
+
+        # 預先編譯的工具 schema（依名稱排序，讓 prompt 前綴在每次請求間保持相同，provider 才能命中 prompt cache）
+        # 工具結果政策；可能將結果分頁保存時，一併提供 read_tool_result 讓模型讀取後續頁面
+        tool_results = result_policies_from_config(cfg)
+        with phase_timer("tool_schema", provider, model):
+            # 工具很多的 agent 只送出與問題相關的 top_k 個工具（agent 設定 tool_retrieval 啟用時）
+            selected, filtered = select_tools(cfg['tools'], request.user_query, cfg.get('tool_retrieval'))
+            tool_names = selected + [PAGING_TOOL] if tool_results.needs_paging(selected) else selected
+            # 檢索結果每次請求都可能不同，不保留 bundle
+            tool_bundle = get_tool_bundle(tool_names, cache=not filtered)
+        tool_schemas = tool_bundle.schemas
+
+        # 回應快取（agent 設定 response_cache 啟用時）
+        policy = cache_policy(cfg, request.llm_config.temperature)
+        cache_scope = None
+        cache_headers = {}
+        if policy:
+            cache_scope = make_scope_key(request.agent_id, llm.model_name, request.system_prompt, request.history,
+                                         tool_bundle.digest, request.llm_config.temperature)
+            # 未命中記憶體時可能讀取磁碟，在執行緒中查詢以免阻塞事件迴圈
+            cached, tier = await asyncio.to_thread(response_cache.get, cache_scope, request.user_query,
+                                                   policy["semantic_threshold"])
+            cache_headers = {"X-Cache": "HIT" if cached is not None else "MISS"}
+            if tier:
+                cache_headers["X-Cache-Tier"] = tier
+            if cached is not None:
+                if request.streaming:
+                    async def cached_stream():
+                        yield f"data: {cached}\n"
+                        yield "data: done\n"
+                    return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=cache_headers)
+                response.headers.update(cache_headers)
+                return {"response": cached}
+
+        # 請求預算：請求參數優先，其次為 agent 設定中的 budget
+        budget_cfg = cfg.get('budget') or {}
+        budget = Budget(
+            timeout=request.timeout or budget_cfg.get('timeout'),
+            max_rounds=request.max_rounds or budget_cfg.get('max_rounds'),
+            max_tool_calls=request.max_tool_calls if request.max_tool_calls is not None else budget_cfg.get('max_tool_calls')
         )
 
-        selected = [TOOL_FUNCTIONS[name] for name in cfg['tools'] if name in TOOL_FUNCTIONS]
-        tool_schemas = generate_tool_schema(selected)
+        # 相同請求合併為一次上游呼叫（agent 設定 single_flight 啟用時）
+        flight_key = None
+        if flight_enabled(cfg, request.llm_config.temperature):
+            flight_key = make_flight_key(
+                agent_id=request.agent_id,
+                llm_config=request.llm_config.model_dump(),
+                credential=credential_fingerprint(api_key),
+                system_prompt=request.system_prompt,
+                history=request.history,
+                user_query=request.user_query,
+                streaming=request.streaming,
+                budget=[request.timeout, request.max_rounds, request.max_tool_calls]
+            )
 
+        stats = {}
         if request.streaming:
-            def stream():
-                gen = llm.chat(
+            async def stream():
+                gen = await llm.achat(
                     system_prompt=request.system_prompt,
                     user_prompt=request.user_query,
                     tools=tool_schemas,
                     history=request.history,
-                    stream=True
+                    stream=True,
+                    tool_concurrency=cfg.get('tool_concurrency'),
+                    budget=budget,
+                    stats=stats,
+                    context=context_manager_from_config(cfg),
+                    tool_results=tool_results
                 )
-                for chunk in gen:
+                parts = []
+                failed = False
+                async for chunk in gen:
+                    if chunk.startswith("data: [Error during streaming]") or chunk == f"data: {PARTIAL_NOTICE}":
+                        failed = True
+                    elif chunk != "data: done":
+                        parts.append(chunk[len("data: "):])
                     yield f"{chunk}\n"
-            return StreamingResponse(stream(), media_type="text/event-stream")
-        else:    
-            response = llm.chat(
-                system_prompt=request.system_prompt,
-                user_prompt=request.user_query,
-                tools=tool_schemas,
-                history=request.history,
-                stream=request.streaming
-            )
+                if cache_scope and not failed:
+                    await asyncio.to_thread(response_cache.put, cache_scope, request.user_query, "".join(parts),
+                                            policy["ttl"], semantic=policy["semantic_threshold"] is not None)
+
+            headers = dict(cache_headers)
+            if flight_key:
+                body, shared = single_flight.stream(flight_key, stream)
+                headers["X-Single-Flight"] = "follower" if shared else "leader"
+            else:
+                body = stream()
+            handed_off = True
+            return StreamingResponse(_track_stream(body, agent_label), media_type="text/event-stream",
+                                     headers=headers)
+        else:
+            async def answer_query():
+                answer = await llm.achat(
+                    system_prompt=request.system_prompt,
+                    user_prompt=request.user_query,
+                    tools=tool_schemas,
+                    history=request.history,
+                    stream=request.streaming,
+                    tool_concurrency=cfg.get('tool_concurrency'),
+                    budget=budget,
+                    stats=stats,
+                    context=context_manager_from_config(cfg),
+                    tool_results=tool_results
+                )
 
-            return {"response": response}
+                if cache_scope and answer and not budget.exhausted:
+                    # 超出記憶體上限時會寫入磁碟，在執行緒中寫入以免阻塞事件迴圈
+                    await asyncio.to_thread(response_cache.put, cache_scope, request.user_query, answer,
+                                            policy["ttl"], semantic=policy["semantic_threshold"] is not None)
+                result = {"response": answer}
+                if stats.get("routes"):
+                    result["route"] = stats["routes"][-1]
+                usage = {k: stats[k] for k in ("prompt_tokens", "completion_tokens", "total_tokens",
+                                               "cached_tokens", "cache_creation_tokens",
+                                               "prompt_tokens_estimate", "dropped_messages") if k in stats}
+                if usage:
+                    result["usage"] = usage
+                if stats.get("tool_results"):
+                    result["tool_results"] = stats["tool_results"]
+                if budget.exhausted:
+                    result["partial"] = True
+                    result["budget"] = budget.summary()
+                return result
+
+            if flight_key:
+                result, shared = await single_flight.do(flight_key, answer_query)
+                result = dict(result)
+                response.headers["X-Single-Flight"] = "follower" if shared else "leader"
+            else:
+                result = await answer_query()
+            response.headers.update(cache_headers)
+            return result
+    except AgentNotFoundError:
+        status = "error"
+        raise HTTPException(status_code=404, detail="Agent not found")
+    except ChatError as e:
+        status = "error"
+        headers = {"Retry-After": str(max(1, math.ceil(e.retry_after)))} if e.retry_after is not None else None
+        raise HTTPException(status_code=e.status_code, detail=e.to_dict(), headers=headers)
     except Exception as e:
+        status = "error"
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not handed_off:
+            CHAT_IN_FLIGHT.dec(streaming=streaming_label)
+            CHAT_REQUESTS.inc(agent=agent_label, status=status)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的各階段延遲、token 用量與進行中請求數"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """回應快取命中率與 single-flight 合併統計"""
+    return {**response_cache.stats(), "single_flight": single_flight.stats()}
+
+
+@app.get("/agent/cache/stats")
+async def agent_cache_stats():
+    """agent 設定快取的命中率、淘汰次數與估計記憶體用量"""
+    return agent_cache.stats()
+
+
+@app.get("/agents")
+async def list_agents(offset: int = 0, limit: int = 50, is_public: bool = True, q: Optional[str] = None,
+                      x_admin_token: Optional[str] = Header(None)):
+    """依名稱排序列出 agent（分頁）；q 為名稱或說明的搜尋字串。預設只列出公開的 agent"""
+    if not is_public and not (AGENT_ADMIN_TOKEN and x_admin_token
+                              and secrets.compare_digest(x_admin_token, AGENT_ADMIN_TOKEN)):
+        raise HTTPException(status_code=403, detail="Listing private agents requires X-Admin-Token")
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), 200)
+    agents, total = await asyncio.to_thread(agent_store.list, offset, limit, is_public, q)
+    return {"agents": agents, "total": total, "offset": offset, "limit": limit}
 
 
 @app.post("/agent")
@@ -210,7 +511,7 @@ async def create_agent(config: AgentConfig):
         for provider, key in agent_data["api_keys"].items():
             if key:  # 只加密非空的密鑰
                 try:
-                    encrypted_key = lock_key(key, config.password)
+                    encrypted_key = await alock_key(key, config.password)
                     if encrypted_key is None:
                         agent_data["api_keys"][provider] = f"ENCRYPTION_FAILED"
                     else:
@@ -218,65 +519,44 @@ async def create_agent(config: AgentConfig):
                 except Exception as e:
                     agent_data["api_keys"][provider] = f"ENCRYPTION_ERROR"
     
-    os.makedirs('agents', exist_ok=True)
-    path = os.path.join("agents", f"{agent_id}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(agent_data, f, ensure_ascii=False, indent=2)
+    await save_agent_config(agent_id, agent_data)
 
     return {"message": "Agent created", "agent_id": agent_id}
 
 @app.put("/agent/{agent_id}")
 async def update_agent(agent_id: str, config_update: AgentConfigUpdate):
-    path = os.path.join("agents", f"{agent_id}.json")
-    if not os.path.exists(path):
-        raise HTTPException(status_code=404, detail="Agent not found")
-    
-    # 載入現有配置
-    old_cfg = load_agent_config(agent_id)
-    
-    # 準備更新後的配置
-    updated_cfg = old_cfg.copy()
-    
-    # 更新提供的字段
-    update_data = {k: v for k, v in config_update.model_dump(exclude_unset=True).items() if v is not None}
+    # 只送出有變動的欄位，由儲存後端在同一個交易中合併，並行的更新不會互相覆蓋
+    # （密碼只用於加密 API 密鑰，不寫入設定）
+    patch = {k: v for k, v in config_update.model_dump(exclude_unset=True, exclude={"password"}).items() if v is not None}
     
     # 特殊處理 api_keys，允許部分更新並加密
-    if 'api_keys' in update_data and isinstance(update_data['api_keys'], dict):
-        if 'api_keys' not in updated_cfg:
-            updated_cfg['api_keys'] = {}
-        
+    if 'api_keys' in patch and isinstance(patch['api_keys'], dict):
         # 獲取密碼
         password = config_update.password
         
-        for provider, key in update_data['api_keys'].items():
+        api_keys = {}
+        for provider, key in patch['api_keys'].items():
             if key: 
                 if password:
                     try:
-                        encrypted_key = lock_key(key, password)
+                        encrypted_key = await alock_key(key, password)
                         if encrypted_key is None:
-                            updated_cfg['api_keys'][provider] = f"ENCRYPTION_FAILED:{key}"
+                            api_keys[provider] = f"ENCRYPTION_FAILED:{key}"
                         else:
-                            updated_cfg['api_keys'][provider] = encrypted_key
+                            api_keys[provider] = encrypted_key
                     except Exception as e:
-                        updated_cfg['api_keys'][provider] = f"ENCRYPTION_ERROR"
+                        api_keys[provider] = f"ENCRYPTION_ERROR"
                 else:
-                    updated_cfg['api_keys'][provider] = key
+                    api_keys[provider] = key
             else:
-                updated_cfg['api_keys'][provider] = ""
-        
-        del update_data['api_keys']
-    
-    # 更新其他字段
-    updated_cfg.update(update_data)
-    
-    # 處理工具啟用/禁用
-    if config_update.tools is not None:
-        # 只更新工具列表，不修改工具內容
-        updated_cfg["tools"] = config_update.tools
+                api_keys[provider] = ""
+        # 與現有的 api_keys 逐一合併，未提供的 provider 維持不變
+        patch['api_keys'] = api_keys
     
-    # 保存更新後的配置
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(updated_cfg, f, ensure_ascii=False, indent=2)
+    # 工具列表整個取代（只更新啟用的工具，不修改工具內容）
+    if await asyncio.to_thread(agent_store.update, agent_id, patch) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    agent_cache.invalidate(agent_id)
 
     return {"message": "Agent updated", "agent_id": agent_id}
 
@@ -309,6 +589,16 @@ async def update_tool(name: str, spec: ToolSpec):
     write_tool_file(spec)
     return {"message": "Tool updated", "name": name}
 
+@app.get("/tool/cache/stats")
+async def tool_cache_stats():
+    """各工具結果快取的命中、未命中與淘汰次數"""
+    return tool_cache.stats()
+
+@app.get("/tool/sandbox/stats")
+async def tool_sandbox_stats():
+    """isolated 工具的執行統計：各工具的呼叫、逾時、被終止次數與耗時"""
+    return sandbox_pool.stats()
+
 @app.delete("/tool/{name}")
 async def delete_tool(name: str):
     """刪除工具"""
@@ -317,17 +607,15 @@ async def delete_tool(name: str):
 
 @app.delete("/agent/{agent_id}")
 async def delete_agent(agent_id: str):
-    path = os.path.join("agents", f"{agent_id}.json")
-    if not os.path.exists(path):
+    # 刪除配置
+    cfg = await asyncio.to_thread(agent_store.delete, agent_id)
+    if cfg is None:
         raise HTTPException(status_code=404, detail="Agent not found")
+    agent_cache.invalidate(agent_id)
     
     # 刪除工具
-    cfg = load_agent_config(agent_id)
     for name in cfg.get('tools', []):
         remove_tool_file(name)
-    
-    # 刪除配置
-    os.remove(path)
     return {"message": "Agent deleted", "agent_id": agent_id}
 
 if __name__ == '__main__':
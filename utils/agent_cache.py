@@ -0,0 +1,241 @@
+"""
+agent 設定快取：/chat 每次請求都要讀取 agent 設定，快取解析後的設定以免重複讀取與 json 解析。
+
+- POST/PUT/DELETE /agent 寫入或刪除設定後呼叫 invalidate 立即失效
+- 設定被其他 process 或直接在磁碟上修改時，以儲存後端的版本標記（JSON 檔的 mtime 與大小、
+  SQLite 的版本欄位）判斷是否需要重新讀取；同一項目在 check_interval 秒內不重複檢查
+- 以序列化大小估計記憶體用量，超過 max_bytes 或 max_entries 時淘汰最久未使用的設定
+- tools 在設定讀入時依工具註冊表解析一次，不存在的工具自 tools 移除並記錄警告；
+  工具被新增、改寫或刪除（註冊表版本改變）後才重新解析
+
+環境變數：AGENT_CACHE_MAX_ENTRIES（0 表示停用）、AGENT_CACHE_MAX_MB、AGENT_CACHE_CHECK_INTERVAL。
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from Tool import TOOL_FUNCTIONS, registry_version
+from .metrics import registry
+from .agent_store import AgentStore, AgentNotFoundError, agent_store
+
+logger = logging.getLogger(__name__)
+
+AGENT_CACHE_LOOKUPS = registry.counter(
+    "agent_config_cache_total", "Agent config lookups by result",
+    ("result",))
+AGENT_CACHE_EVICTIONS = registry.counter(
+    "agent_config_cache_evictions_total", "Agent configs evicted to stay under the cache limits")
+AGENT_CACHE_ENTRIES = registry.gauge(
+    "agent_config_cache_entries", "Agent configs currently cached")
+AGENT_CACHE_BYTES = registry.gauge(
+    "agent_config_cache_bytes", "Estimated size of cached agent configs")
+
+# 解析後的 dict 約為原始 JSON 大小的數倍，以此係數估計記憶體用量
+_SIZE_FACTOR = 4
+
+
+def validate_agent_config(agent_id: str, config: dict) -> dict:
+    """檢查 /chat 使用的設定：tools 統一為工具名稱列表"""
+    tools = config.get('tools') or []
+    if not isinstance(tools, list) or not all(isinstance(name, str) for name in tools):
+        raise ValueError(f"agent {agent_id} has an invalid tools list")
+    config['tools'] = tools
+    return config
+
+
+def resolve_tools(agent_id: str, names: Tuple[str, ...]) -> List[str]:
+    """依工具註冊表過濾工具名稱（保持順序、去除重複）；不存在的工具記錄警告後略過"""
+    resolved, missing = [], []
+    for name in dict.fromkeys(names):
+        (resolved if name in TOOL_FUNCTIONS else missing).append(name)
+    if missing:
+        logger.warning("agent %s references unknown tools: %s", agent_id, ", ".join(missing))
+    return resolved
+
+
+class _Entry:
+    """
+    declared: 設定中原本列出的工具名稱；config['tools'] 為依註冊表（版本 tools_version）解析後的列表。
+    """
+    __slots__ = ("version", "config", "size", "checked_at", "declared", "tools_version")
+
+    def __init__(self, version: Hashable, config: dict, size: int, checked_at: float,
+                 declared: Tuple[str, ...], tools_version: int):
+        self.version = version
+        self.config = config
+        self.size = size
+        self.checked_at = checked_at
+        self.declared = declared
+        self.tools_version = tools_version
+
+
+class AgentConfigCache:
+    """
+    store: 儲存後端，預設為 utils.agent_store.agent_store。
+    max_entries: 快取的 agent 數上限，0 表示停用快取（每次都向儲存後端讀取）。
+    max_bytes: 估計記憶體用量上限。
+    check_interval: 同一項目兩次檢查版本標記的最短間隔秒數，0 表示每次都檢查。
+
+    get 回傳的 dict 由所有請求共用，呼叫端不可修改（需要修改時先 copy.deepcopy）；
+    其中的 tools 只含目前已註冊的工具。
+    """
+
+    def __init__(self, store: Optional[AgentStore] = None, max_entries: int = 10000,
+                 max_bytes: int = 64 * 1024 * 1024, check_interval: float = 1.0):
+        self.store = store or agent_store
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # invalidate/clear 時遞增；讀取期間有寫入時不快取讀到的（可能是舊的）內容
+        self._generation = 0
+        self.hits = self.misses = self.reloads = self.evictions = 0
+
+    def _drop(self, agent_id: str) -> Optional[_Entry]:
+        entry = self._entries.pop(agent_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _forget(self, agent_id: str):
+        with self._lock:
+            self._drop(agent_id)
+            self._update_gauges()
+
+    def _update_gauges(self):
+        AGENT_CACHE_ENTRIES.set(len(self._entries))
+        AGENT_CACHE_BYTES.set(self._bytes)
+
+    @staticmethod
+    def _fresh_tools(agent_id: str, entry: _Entry) -> dict:
+        """註冊表在快取後有變動時重新解析 tools；以新列表取代，進行中的請求不受影響"""
+        version = registry_version()
+        if entry.tools_version != version:
+            entry.config['tools'] = resolve_tools(agent_id, entry.declared)
+            entry.tools_version = version
+        return entry.config
+
+    def _recent(self, agent_id: str, now: float) -> Optional[dict]:
+        """check_interval 內檢查過的項目直接回傳，不存取儲存後端；否則回傳 None"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is None or now - entry.checked_at >= self.check_interval:
+                return None
+            self._entries.move_to_end(agent_id)
+            self.hits += 1
+            AGENT_CACHE_LOOKUPS.inc(result="hit")
+            return self._fresh_tools(agent_id, entry)
+
+    async def aget(self, agent_id: str) -> dict:
+        """
+        get 的非同步版本：近期檢查過的項目在事件迴圈中直接回傳，
+        需要檢查版本標記或重新讀取時（stat、JSON 解析或 SQLite 查詢）在執行緒中進行。
+        """
+        config = self._recent(agent_id, time.monotonic())
+        if config is not None:
+            return config
+        return await asyncio.to_thread(self.get, agent_id)
+
+    def get(self, agent_id: str) -> dict:
+        """回傳 agent 設定；agent 不存在時拋出 AgentNotFoundError"""
+        if self.max_entries <= 0:
+            config = self.store.get(agent_id)
+            if config is None:
+                raise AgentNotFoundError(agent_id)
+            config = validate_agent_config(agent_id, config)
+            config['tools'] = resolve_tools(agent_id, tuple(config['tools']))
+            return config
+
+        now = time.monotonic()
+        config = self._recent(agent_id, now)
+        if config is not None:
+            return config
+
+        version = self.store.version(agent_id)
+        if version is None:
+            self._forget(agent_id)
+            raise AgentNotFoundError(agent_id)
+
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is not None and entry.version == version:
+                entry.checked_at = now
+                self._entries.move_to_end(agent_id)
+                self.hits += 1
+                AGENT_CACHE_LOOKUPS.inc(result="hit")
+                return self._fresh_tools(agent_id, entry)
+            generation = self._generation
+
+        # 未快取或設定已被外部修改：在鎖外讀取，避免阻塞其他 agent 的查詢
+        loaded = self.store.load(agent_id)
+        if loaded is None:
+            self._forget(agent_id)
+            raise AgentNotFoundError(agent_id)
+        config, version, size = loaded
+        config = validate_agent_config(agent_id, config)
+        declared = tuple(config['tools'])
+        tools_version = registry_version()
+        config['tools'] = resolve_tools(agent_id, declared)
+        with self._lock:
+            if generation != self._generation:
+                AGENT_CACHE_LOOKUPS.inc(result="miss")
+                self.misses += 1
+                return config
+            if self._drop(agent_id) is not None:
+                self.reloads += 1
+                result = "stale"
+            else:
+                self.misses += 1
+                result = "miss"
+            entry = _Entry(version, config, size * _SIZE_FACTOR, now, declared, tools_version)
+            self._entries[agent_id] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+                AGENT_CACHE_EVICTIONS.inc()
+            self._update_gauges()
+        AGENT_CACHE_LOOKUPS.inc(result=result)
+        return config
+
+    def invalidate(self, agent_id: str):
+        """agent 設定被寫入或刪除後呼叫"""
+        with self._lock:
+            self._generation += 1
+            self._drop(agent_id)
+            self._update_gauges()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses + self.reloads
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+agent_cache = AgentConfigCache(
+    agent_store,
+    max_entries=int(os.getenv("AGENT_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(float(os.getenv("AGENT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    check_interval=float(os.getenv("AGENT_CACHE_CHECK_INTERVAL", "1.0")),
+)
@@ -0,0 +1,366 @@
+"""
+agent 設定的儲存後端。
+
+- JsonAgentStore：每個 agent 一個 agents/<id>.json（預設，與舊版相容）
+- SQLiteAgentStore：單一 SQLite 資料庫（WAL），id、name、is_public 建有索引，
+  列表與搜尋只讀取索引欄位，不必解析每個 agent 的完整設定
+
+以環境變數 AGENT_STORE（json | sqlite）與 AGENT_DB_PATH（預設 agents.db）選擇後端；
+既有的 JSON 設定可用 python -m utils.migrate_agents 匯入 SQLite。
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class AgentNotFoundError(LookupError):
+    def __init__(self, agent_id: str):
+        super().__init__(f"Agent {agent_id} not found")
+        self.agent_id = agent_id
+
+
+def merge_patch(target: Dict, patch: Dict) -> Dict:
+    """
+    RFC 7396 JSON merge patch：patch 中的物件與原值遞迴合併，其他值直接取代，值為 None 時刪除該欄位。
+    回傳新的 dict，不修改 target。
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge_patch(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def agent_summary(agent_id: str, config: Dict) -> Dict:
+    """列表顯示用的欄位；同時支援 main.py（name）與 AgentManager（agent_name）的設定格式"""
+    return {
+        "id": agent_id,
+        "name": config.get("name", config.get("agent_name")) or "",
+        "description": config.get("description", config.get("agent_description")) or "",
+        "is_public": bool(config.get("is_public", False)),
+    }
+
+
+def _matches(summary: Dict, is_public: Optional[bool], query: Optional[str]) -> bool:
+    if is_public is not None and summary["is_public"] != is_public:
+        return False
+    if query:
+        query = query.lower()
+        return query in summary["name"].lower() or query in summary["description"].lower()
+    return True
+
+
+class AgentStore(ABC):
+    """
+    agent 設定儲存介面。
+
+    version 回傳的版本標記在設定每次寫入後都會改變，供 utils.agent_cache 判斷快取是否過期。
+    """
+
+    @abstractmethod
+    def load(self, agent_id: str) -> Optional[Tuple[Dict, Hashable, int]]:
+        """回傳 (設定, 版本標記, 序列化大小)；不存在時回傳 None"""
+
+    @abstractmethod
+    def version(self, agent_id: str) -> Optional[Hashable]:
+        """目前的版本標記；不存在時回傳 None"""
+
+    @abstractmethod
+    def put(self, agent_id: str, config: Dict):
+        """建立或整個取代 agent 設定"""
+
+    @abstractmethod
+    def replace(self, agent_id: str, config: Dict) -> bool:
+        """只在 agent 已存在時整個取代其設定，回傳是否存在"""
+
+    @abstractmethod
+    def update(self, agent_id: str, patch: Dict) -> Optional[Dict]:
+        """以 merge_patch 部分更新並回傳更新後的設定；agent 不存在時回傳 None"""
+
+    @abstractmethod
+    def delete(self, agent_id: str) -> Optional[Dict]:
+        """刪除並回傳原本的設定；agent 不存在時回傳 None"""
+
+    @abstractmethod
+    def list(self, offset: int = 0, limit: Optional[int] = 50, is_public: Optional[bool] = None,
+             query: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """
+        依名稱排序的 agent 摘要（agent_summary）與符合條件的總數。
+        is_public: 只列出公開或非公開的 agent；query: 名稱或說明包含的字串（不分大小寫）。
+        """
+
+    def get(self, agent_id: str) -> Optional[Dict]:
+        loaded = self.load(agent_id)
+        return loaded[0] if loaded is not None else None
+
+    def exists(self, agent_id: str) -> bool:
+        return self.version(agent_id) is not None
+
+    def close(self):
+        pass
+
+
+class JsonAgentStore(AgentStore):
+    """
+    每個 agent 一個 JSON 檔（相對路徑以目前工作目錄解析）。
+    寫入先寫暫存檔再 os.replace，讀取端不會讀到寫到一半的檔案；
+    update 的讀取—修改—寫入只在同一個 process 內互斥，多 process 部署請改用 SQLiteAgentStore。
+    """
+
+    def __init__(self, agents_dir: str = "agents"):
+        self.agents_dir = agents_dir
+        self._lock = threading.Lock()
+
+    def path(self, agent_id: str) -> str:
+        return os.path.join(self.agents_dir, f"{agent_id}.json")
+
+    def load(self, agent_id: str) -> Optional[Tuple[Dict, Hashable, int]]:
+        path = self.path(agent_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                stat = os.fstat(f.fileno())
+                config = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not isinstance(config, dict):
+            raise ValueError(f"agent config {path} must be a JSON object")
+        return config, (stat.st_mtime_ns, stat.st_size), stat.st_size
+
+    def version(self, agent_id: str) -> Optional[Hashable]:
+        try:
+            stat = os.stat(self.path(agent_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def put(self, agent_id: str, config: Dict):
+        os.makedirs(self.agents_dir, exist_ok=True)
+        path = self.path(agent_id)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def replace(self, agent_id: str, config: Dict) -> bool:
+        with self._lock:
+            if not os.path.exists(self.path(agent_id)):
+                return False
+            self.put(agent_id, config)
+        return True
+
+    def update(self, agent_id: str, patch: Dict) -> Optional[Dict]:
+        with self._lock:
+            config = self.get(agent_id)
+            if config is None:
+                return None
+            config = merge_patch(config, patch)
+            self.put(agent_id, config)
+        return config
+
+    def delete(self, agent_id: str) -> Optional[Dict]:
+        with self._lock:
+            config = self.get(agent_id)
+            if config is None:
+                return None
+            os.remove(self.path(agent_id))
+        return config
+
+    def ids(self) -> List[str]:
+        if not os.path.isdir(self.agents_dir):
+            return []
+        return [name[:-len(".json")] for name in os.listdir(self.agents_dir) if name.endswith(".json")]
+
+    def list(self, offset: int = 0, limit: Optional[int] = 50, is_public: Optional[bool] = None,
+             query: Optional[str] = None) -> Tuple[List[Dict], int]:
+        # 必須讀取並解析每個檔案，agent 數量多時請改用 SQLiteAgentStore
+        summaries = []
+        for agent_id in self.ids():
+            try:
+                config = self.get(agent_id)
+            except ValueError:
+                continue
+            if config is None:
+                continue
+            summary = agent_summary(agent_id, config)
+            if _matches(summary, is_public, query):
+                summaries.append(summary)
+        summaries.sort(key=lambda s: (s["name"].lower(), s["id"]))
+        end = None if limit is None else offset + limit
+        return summaries[offset:end], len(summaries)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agents (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    is_public INTEGER NOT NULL DEFAULT 0,
+    config TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_agents_name ON agents (name COLLATE NOCASE, id);
+CREATE INDEX IF NOT EXISTS idx_agents_public ON agents (is_public, name COLLATE NOCASE, id);
+"""
+
+_UPSERT = """
+INSERT INTO agents (id, name, description, is_public, config, updated_at) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET name = excluded.name, description = excluded.description,
+    is_public = excluded.is_public, config = excluded.config,
+    version = agents.version + 1, updated_at = excluded.updated_at
+"""
+
+
+class SQLiteAgentStore(AgentStore):
+    """
+    以 SQLite（WAL）儲存 agent 設定：讀取不會被寫入阻塞，多個 process 可共用同一個資料庫檔。
+
+    path: 資料庫檔案路徑；busy_timeout: 等待其他連線釋放寫入鎖的秒數。
+    每個執行緒各自一個連線；寫入以 BEGIN IMMEDIATE 取得寫入鎖，update 的讀取—修改—寫入不會遺失並行的更新。
+    """
+
+    def __init__(self, path: str = "agents.db", busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自行以 BEGIN/COMMIT 控制交易
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _row(agent_id: str, config: Dict, now: float) -> Tuple:
+        summary = agent_summary(agent_id, config)
+        return (agent_id, summary["name"], summary["description"], int(summary["is_public"]),
+                json.dumps(config, ensure_ascii=False), now)
+
+    def load(self, agent_id: str) -> Optional[Tuple[Dict, Hashable, int]]:
+        row = self._conn().execute(
+            "SELECT config, version, updated_at FROM agents WHERE id = ?", (agent_id,)).fetchone()
+        if row is None:
+            return None
+        # 刪除後重建的 agent 版本號會從 1 重新開始，版本標記一併帶上更新時間
+        return json.loads(row[0]), (row[1], row[2]), len(row[0])
+
+    def version(self, agent_id: str) -> Optional[Hashable]:
+        row = self._conn().execute(
+            "SELECT version, updated_at FROM agents WHERE id = ?", (agent_id,)).fetchone()
+        return tuple(row) if row is not None else None
+
+    def put(self, agent_id: str, config: Dict):
+        self._conn().execute(_UPSERT, self._row(agent_id, config, time.time()))
+
+    def put_many(self, items: Iterable[Tuple[str, Dict]], overwrite: bool = True) -> int:
+        """在同一個交易中寫入多個 agent，回傳實際寫入的數量；overwrite=False 時略過已存在的 agent"""
+        conn = self._conn()
+        sql = _UPSERT if overwrite else _UPSERT.split("ON CONFLICT")[0] + "ON CONFLICT(id) DO NOTHING"
+        now = time.time()
+        written = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for agent_id, config in items:
+                written += conn.execute(sql, self._row(agent_id, config, now)).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return written
+
+    def replace(self, agent_id: str, config: Dict) -> bool:
+        _, name, description, is_public, data, now = self._row(agent_id, config, time.time())
+        cursor = self._conn().execute(
+            "UPDATE agents SET name = ?, description = ?, is_public = ?, config = ?, "
+            "version = version + 1, updated_at = ? WHERE id = ?",
+            (name, description, is_public, data, now, agent_id))
+        return cursor.rowcount > 0
+
+    def update(self, agent_id: str, patch: Dict) -> Optional[Dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT config FROM agents WHERE id = ?", (agent_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            config = merge_patch(json.loads(row[0]), patch)
+            conn.execute(_UPSERT, self._row(agent_id, config, time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return config
+
+    def delete(self, agent_id: str) -> Optional[Dict]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT config FROM agents WHERE id = ?", (agent_id,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM agents WHERE id = ?", (agent_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row is not None else None
+
+    def list(self, offset: int = 0, limit: Optional[int] = 50, is_public: Optional[bool] = None,
+             query: Optional[str] = None) -> Tuple[List[Dict], int]:
+        where, params = [], []
+        if is_public is not None:
+            where.append("is_public = ?")
+            params.append(int(is_public))
+        if query:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where.append("(name LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(*) FROM agents{clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT id, name, description, is_public FROM agents{clause} "
+            f"ORDER BY name COLLATE NOCASE, id LIMIT ? OFFSET ?",
+            params + [-1 if limit is None else limit, offset]).fetchall()
+        return [{"id": r[0], "name": r[1], "description": r[2], "is_public": bool(r[3])} for r in rows], total
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+def create_agent_store(backend: Optional[str] = None, agents_dir: str = "agents",
+                       db_path: Optional[str] = None) -> AgentStore:
+    """依 backend（預設為環境變數 AGENT_STORE，未設定時為 json）建立 agent 設定儲存後端"""
+    backend = (backend or os.getenv("AGENT_STORE") or "json").lower()
+    if backend == "json":
+        return JsonAgentStore(agents_dir)
+    if backend == "sqlite":
+        return SQLiteAgentStore(db_path or os.getenv("AGENT_DB_PATH", "agents.db"))
+    raise ValueError(f"unknown agent store backend: {backend}")
+
+
+agent_store = create_agent_store()
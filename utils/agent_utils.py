@@ -1,23 +1,24 @@
 import uuid
-import json
 import os
 from typing import Dict, List, Optional, Any
 from .models import AgentConfig, AgentResponse, Tool, ModelConfig
+from .agent_store import AgentStore, create_agent_store
 
 
 class AgentManager:
     """Agent管理器類"""
     
-    def __init__(self, storage_path: str = "agents"):
+    def __init__(self, storage_path: str = "agents", store: Optional[AgentStore] = None):
         """
         初始化Agent管理器
         
         Args:
-            storage_path: Agent配置存儲路徑
+            storage_path: Agent配置存儲路徑（JSON 後端使用）
+            store: 存儲後端，未指定時依環境變數 AGENT_STORE 建立
         """
         self.storage_path = storage_path
-        # 確保存儲目錄存在
-        os.makedirs(os.path.join(os.path.dirname(__file__), "..", storage_path), exist_ok=True)
+        self.store = store or create_agent_store(
+            agents_dir=os.path.join(os.path.dirname(__file__), "..", storage_path))
     
     def create_agent(self, config: AgentConfig) -> AgentResponse:
         """
@@ -56,39 +57,32 @@ class AgentManager:
         Returns:
             Optional[Dict[str, Any]]: Agent配置，如果不存在則返回None
         """
-        config_path = self._get_agent_config_path(agent_id)
-        if not os.path.exists(config_path):
-            return None
-        
-        with open(config_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return self.store.get(agent_id)
     
-    def list_agents(self) -> List[Dict[str, Any]]:
+    def list_agents(self, offset: int = 0, limit: Optional[int] = None,
+                    is_public: Optional[bool] = None, query: Optional[str] = None) -> List[Dict[str, Any]]:
         """
-        列出所有Agent
+        列出Agent（依名稱排序）
         
+        Args:
+            offset: 略過的筆數
+            limit: 最多回傳的筆數，None 表示全部
+            is_public: 只列出公開或非公開的Agent
+            query: 名稱或描述包含的字串
+            
         Returns:
             List[Dict[str, Any]]: Agent列表
         """
-        agents = []
-        storage_dir = os.path.join(os.path.dirname(__file__), "..", self.storage_path)
-        
-        if not os.path.exists(storage_dir):
-            return agents
-        
-        for filename in os.listdir(storage_dir):
-            if filename.endswith(".json"):
-                agent_id = filename.replace(".json", "")
-                agent_config = self.get_agent(agent_id)
-                if agent_config:
-                    agents.append({
-                        "agent_id": agent_id,
-                        "agent_name": agent_config.get("agent_name", ""),
-                        "agent_description": agent_config.get("agent_description", ""),
-                        "is_public": agent_config.get("is_public", False)
-                    })
-        
-        return agents
+        summaries, _ = self.store.list(offset=offset, limit=limit, is_public=is_public, query=query)
+        return [
+            {
+                "agent_id": summary["id"],
+                "agent_name": summary["name"],
+                "agent_description": summary["description"],
+                "is_public": summary["is_public"]
+            }
+            for summary in summaries
+        ]
     
     def update_agent(self, agent_id: str, config: AgentConfig) -> AgentResponse:
         """
@@ -101,7 +95,12 @@ class AgentManager:
         Returns:
             AgentResponse: 更新結果
         """
-        if not self.get_agent(agent_id):
+        # 更新Agent數據
+        agent_data = config.dict()
+        agent_data["agent_id"] = agent_id
+        
+        # 檢查存在與保存在存儲後端中一次完成，不會覆蓋同時被刪除的Agent
+        if not self.store.replace(agent_id, agent_data):
             return AgentResponse(
                 agent_id=agent_id,
                 agent_name=config.agent_name,
@@ -109,13 +108,6 @@ class AgentManager:
                 message="Agent不存在"
             )
         
-        # 更新Agent數據
-        agent_data = config.dict()
-        agent_data["agent_id"] = agent_id
-        
-        # 保存更新後的配置
-        self._save_agent_config(agent_id, agent_data)
-        
         return AgentResponse(
             agent_id=agent_id,
             agent_name=config.agent_name,
@@ -133,8 +125,8 @@ class AgentManager:
         Returns:
             AgentResponse: 刪除結果
         """
-        config_path = self._get_agent_config_path(agent_id)
-        if not os.path.exists(config_path):
+        # 刪除配置
+        if self.store.delete(agent_id) is None:
             return AgentResponse(
                 agent_id=agent_id,
                 agent_name="",
@@ -142,9 +134,6 @@ class AgentManager:
                 message="Agent不存在"
             )
         
-        # 刪除配置文件
-        os.remove(config_path)
-        
         return AgentResponse(
             agent_id=agent_id,
             agent_name="",
@@ -152,18 +141,6 @@ class AgentManager:
             message="Agent刪除成功"
         )
     
-    def _get_agent_config_path(self, agent_id: str) -> str:
-        """
-        獲取Agent配置文件路徑
-        
-        Args:
-            agent_id: Agent ID
-            
-        Returns:
-            str: 配置文件路徑
-        """
-        return os.path.join(os.path.dirname(__file__), "..", self.storage_path, f"{agent_id}.json")
-    
     def _save_agent_config(self, agent_id: str, config_data: Dict[str, Any]) -> None:
         """
         保存Agent配置
@@ -172,6 +149,4 @@ class AgentManager:
             agent_id: Agent ID
             config_data: 配置數據
         """
-        config_path = self._get_agent_config_path(agent_id)
-        with open(config_path, "w", encoding="utf-8") as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        self.store.put(agent_id, config_data)
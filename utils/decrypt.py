@@ -1,4 +1,5 @@
 import requests
+import httpx
 import json
 
 decrypt_url = "http://localhost:1212/decrypt"
@@ -34,4 +35,51 @@ def lock_key(origin_key, password:str):
     except :
         key = None
     
-    return key
\ No newline at end of file
+    return key
+
+_async_client = None
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(timeout=10)
+    return _async_client
+
+async def aget_key(encrypt_key, password:str):
+    data = {
+        "encrypted_key": encrypt_key,
+        "password": password
+    }
+
+    response = await _get_async_client().post(decrypt_url, headers={"Content-Type": "application/json"}, content=json.dumps(data))
+
+    try:
+        key = response.json().get("key")
+
+    except:
+        key = None
+
+    return key
+
+async def alock_key(origin_key, password:str):
+    data = {
+        "key": origin_key,
+        "password": password
+    }
+
+    response = await _get_async_client().post(encrypt_url, headers={"Content-Type": "application/json"}, content=json.dumps(data))
+
+    try:
+        key = response.json().get("key")
+
+    except:
+        key = None
+
+    return key
+
+async def aclose():
+    """關閉共用的非同步連線（應用程式關閉時呼叫）"""
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.aclose()
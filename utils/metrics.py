@@ -0,0 +1,237 @@
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 目前請求所屬的 agent；由 /chat 在確認 agent 存在後設定，LLM 與工具的量測會帶上此標籤
+current_agent: contextvars.ContextVar = contextvars.ContextVar("current_agent", default="unknown")
+
+# 不在允許清單中的標籤值一律記為此值
+OTHER_LABEL = "other"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """區塊執行期間數值加一，用於進行中的請求數"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # [各 bucket 的非累計次數..., 超出最大 bucket 的次數, 總和]
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[i] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, entry in list(self._values.items()):
+            entry = list(entry)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class LabelAllowlist:
+    """
+    標籤值來自請求內容時（provider、model），只輸出允許的值，其餘記為 "other"，
+    避免任意輸入產生無上限的時間序列。
+
+    register 加入程式內建的固定值（不計入上限）；allow 加入設定檔中的值，最多 max_values 個。
+    """
+
+    def __init__(self, values: Iterable[str] = (), max_values: int = 1000):
+        self.max_values = max_values
+        self._known = set()
+        self._allowed = set()
+        self._lock = threading.Lock()
+        self.allow(*values)
+
+    def register(self, *values: str):
+        with self._lock:
+            self._known.update(value for value in values if value and isinstance(value, str))
+
+    def allow(self, *values: str):
+        with self._lock:
+            for value in values:
+                if not value or not isinstance(value, str) or value in self._known or value in self._allowed:
+                    continue
+                if len(self._allowed) >= self.max_values:
+                    break
+                self._allowed.add(value)
+
+    def __call__(self, value) -> str:
+        return value if value in self._known or value in self._allowed else OTHER_LABEL
+
+
+# provider 與 litellm 已知的 model 由 LLM 模組註冊；另可用 METRICS_MODEL_LABELS（逗號分隔）與 agent 設定加入 model
+provider_labels = LabelAllowlist()
+model_labels = LabelAllowlist(
+    (name.strip() for name in os.getenv("METRICS_MODEL_LABELS", "").split(",")),
+    max_values=int(os.getenv("METRICS_MAX_MODEL_LABELS", "1000")))
+
+# 全域共用的指標註冊表
+registry = Registry()
+
+CHAT_PHASE_SECONDS = registry.histogram(
+    "chat_phase_seconds", "Time spent in each phase of /chat",
+    ("phase", "agent", "provider", "model"))
+LLM_TTFT_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time from sending a streaming LLM request to its first chunk",
+    ("agent", "provider", "model"))
+TOOL_CALL_SECONDS = registry.histogram(
+    "tool_call_seconds", "Tool execution time",
+    ("agent", "tool", "status"))
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Tokens reported by provider usage",
+    ("agent", "provider", "model", "type"))
+CHAT_REQUESTS = registry.counter(
+    "chat_requests_total", "Finished /chat requests",
+    ("agent", "status"))
+CHAT_IN_FLIGHT = registry.gauge(
+    "chat_requests_in_flight", "/chat requests currently being served",
+    ("streaming",))
+LLM_IN_FLIGHT = registry.gauge(
+    "llm_requests_in_flight", "LLM requests currently waiting on a provider",
+    ("provider", "model"))
+TOOL_IN_FLIGHT = registry.gauge(
+    "tool_calls_in_flight", "Tool calls currently executing",
+    ("tool",))
+
+
+def observe_phase(phase: str, seconds: float, provider: str = "", model: str = ""):
+    CHAT_PHASE_SECONDS.observe(seconds, phase=phase, agent=current_agent.get(),
+                               provider=provider, model=model)
+
+
+@contextmanager
+def phase_timer(phase: str, provider: str = "", model: str = ""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start, provider, model)
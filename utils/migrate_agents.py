@@ -0,0 +1,71 @@
+"""
+將 agents/<id>.json 匯入 SQLite agent 儲存後端：
+
+    python -m utils.migrate_agents --src agents --db agents.db
+    AGENT_STORE=sqlite AGENT_DB_PATH=agents.db python main.py
+
+agent ID 取自檔名（與 load_agent_config 相同）。預設略過資料庫中已存在的 agent，可重複執行；
+--overwrite 以 JSON 檔覆寫。原本的 JSON 檔不會被刪除。
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Dict, Iterator, Tuple
+
+from .agent_store import JsonAgentStore, SQLiteAgentStore
+
+
+def migrate(src: str, store: SQLiteAgentStore, overwrite: bool = False, batch_size: int = 1000) -> Dict[str, int]:
+    """回傳 imported（寫入）、skipped（已存在）、invalid（無法解析）的數量"""
+    counts = {"imported": 0, "skipped": 0, "invalid": 0}
+    source = JsonAgentStore(src)
+
+    def configs() -> Iterator[Tuple[str, Dict]]:
+        for agent_id in sorted(source.ids()):
+            try:
+                config = source.get(agent_id)
+            except ValueError as e:
+                counts["invalid"] += 1
+                print(f"skip {agent_id}: {e}", file=sys.stderr)
+                continue
+            if config is not None:
+                yield agent_id, config
+
+    batch = []
+    for item in configs():
+        batch.append(item)
+        if len(batch) >= batch_size:
+            written = store.put_many(batch, overwrite=overwrite)
+            counts["imported"] += written
+            counts["skipped"] += len(batch) - written
+            batch = []
+    if batch:
+        written = store.put_many(batch, overwrite=overwrite)
+        counts["imported"] += written
+        counts["skipped"] += len(batch) - written
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import agents/<id>.json files into the SQLite agent store")
+    parser.add_argument("--src", default="agents", help="directory containing <agent_id>.json files")
+    parser.add_argument("--db", default=os.getenv("AGENT_DB_PATH", "agents.db"), help="SQLite database path")
+    parser.add_argument("--overwrite", action="store_true", help="replace agents that already exist in the database")
+    parser.add_argument("--batch-size", type=int, default=1000, help="agents written per transaction")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.src):
+        parser.error(f"{args.src} is not a directory")
+    store = SQLiteAgentStore(args.db)
+    try:
+        counts = migrate(args.src, store, overwrite=args.overwrite, batch_size=args.batch_size)
+    finally:
+        store.close()
+    print(f"imported {counts['imported']}, skipped {counts['skipped']} existing, "
+          f"{counts['invalid']} invalid -> {args.db}")
+    return 1 if counts["invalid"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())